@@ -7,6 +7,8 @@
 from fastapi import FastAPI, HTTPException
 from passlib.context import CryptContext
 from db import database, metadata, engine
+# config_environment is importable once db has put the repo root on sys.path
+from config_environment.schema_check import ensure_schema
 from models import users
 from schemas import UserCreate, UserLogin
 
@@ -20,8 +22,9 @@ app= FastAPI()
 # -------------------------------
 # Create the Table
 # -------------------------------
-# Creates all tables defined in models.py (here, the 'users' table)
-metadata.create_all(engine)
+# Creates all tables defined in models.py (here, the 'users' table), unless
+# schema_version shows they were already created with this exact definition
+ensure_schema(engine, metadata, name="auth_database")
 
 
 # -------------------------------
@@ -1,17 +1,24 @@
 # Database configuration file
 # Related file: app.py (main FastAPI app uses this database)
 
-from sqlalchemy import create_engine, MetaData
+import os
+import sys
+from sqlalchemy import MetaData
 from databases import Database
 
+# The repo root holds config_environment/engine_factory.py (shared pooled engines)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_environment.engine_factory import create_db_engine
+
 # SQLite database URL
 DATABASE_URL= "sqlite:///./users.db" # Example SQLite Database URL
 
 # Database instance for async queries
+# (the databases library opens its own async connections; only the sync engine below uses the shared pool)
 database= Database(DATABASE_URL)
 
 # Metadata object to hold table schemas (from models.py)
 metadata= MetaData()
 
-# SQLAlchemy engine for creating tables synchronously
-engine= create_engine(DATABASE_URL)
+# SQLAlchemy engine for creating tables synchronously, built by the shared factory
+engine= create_db_engine(DATABASE_URL)
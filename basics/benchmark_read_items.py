@@ -0,0 +1,116 @@
+# Benchmark: GET /items/ (List[Item] response_model) vs GET /items/?stream=true
+# Related files: main3.py, json_stream.py
+
+# Usage (from the repo root):
+#   python basics/benchmark_read_items.py --rows 500000
+#
+# Builds a scratch SQLite database for main3.py (the real database.db is not
+# touched). Each mode then runs in a fresh process that sends one request
+# straight to the ASGI app and reports time to first byte, total time,
+# response size and how much the process's peak RSS grew during the request.
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+MODES= {"list": b"", "stream": b"stream=true"}
+
+
+def fill(directory: str, rows: int):
+    """Creates database.db in directory with `rows` items, 50k per transaction."""
+    os.chdir(directory)
+    from sqlalchemy import insert
+    from sqlmodel import SQLModel
+    from basics.main3 import Item, engine
+
+    SQLModel.metadata.create_all(engine)
+    chunk= 50_000
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk):
+            conn.execute(insert(Item), [
+                {"name": f"item {n}", "price": n/100, "is_offer": n%3==0}
+                for n in range(start, min(start+chunk, rows))
+            ])
+
+
+async def get(app, query_string: bytes):
+    """One GET /items/ through the ASGI interface; returns (ttfb ms, total ms, bytes)."""
+    scope= {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/items/", "raw_path": b"/items/", "root_path": "",
+        "query_string": query_string, "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    requested= False
+    disconnect= asyncio.Event()  # never set: the client stays connected
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested= True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+
+    first_byte= None
+    size= 0
+
+    async def send(message):
+        nonlocal first_byte, size
+        if message["type"]=="http.response.body" and message.get("body"):
+            if first_byte is None:
+                first_byte= time.perf_counter()
+            size+= len(message["body"])  # counted, not kept
+
+    start= time.perf_counter()
+    await app(scope, receive, send)
+    end= time.perf_counter()
+    return (first_byte-start)*1000, (end-start)*1000, size
+
+
+def run_child(mode: str, directory: str):
+    """Runs in the child process: one request in `mode`, results printed as JSON."""
+    os.chdir(directory)
+    from basics.main3 import app
+
+    before= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ttfb, total, size= asyncio.run(get(app, MODES[mode]))
+    peak= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"ttfb_ms": ttfb, "total_ms": total, "bytes": size,
+                      "rss_peak_mb": peak/1024, "rss_growth_mb": (peak-before)/1024}))
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Compare list and streaming GET /items/ in basics/main3.py")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DIR"), help=argparse.SUPPRESS)
+    args= parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    directory= tempfile.mkdtemp()
+    start= time.perf_counter()
+    fill(directory, args.rows)
+    print(f"filled {args.rows} rows in {time.perf_counter()-start:.1f}s")
+
+    for mode in MODES:
+        output= subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, directory],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result= json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>6}: first byte {result['ttfb_ms']:9.1f} ms   total {result['total_ms']:9.1f} ms   "
+              f"{result['bytes']/1e6:6.1f} MB sent   peak RSS {result['rss_peak_mb']:7.1f} MB (+{result['rss_growth_mb']:.1f} MB for the request)")
+
+
+if __name__=="__main__":
+    main()
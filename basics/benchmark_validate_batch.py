@@ -0,0 +1,79 @@
+# Benchmark: N x POST /items/ vs one POST /items/validate-batch with N items
+# Related file: main2.py
+
+# Usage (from the repo root):
+#   python basics/benchmark_validate_batch.py --items 5000 --invalid 0.1
+#
+# Both run in this process through httpx's ASGI transport, so there is no network:
+# the numbers are the server-side cost (routing, parsing, validation, response).
+# Over a real network every single POST also pays a round trip, which makes the
+# gap bigger still.
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from main2 import app
+
+
+def make_items(count: int, invalid: float):
+    """count candidate items; about `invalid` of them have a bad price or no name."""
+    rng= random.Random(42)
+    items= []
+    for n in range(count):
+        item= {"name": f"item {n}", "price": round(rng.uniform(1, 100), 2), "is_offer": n%3==0}
+        if rng.random()<invalid:
+            if n%2:
+                item["price"]= "cheap"
+            else:
+                del item["name"]
+        items.append(item)
+    return items
+
+
+async def single_posts(client, items):
+    valid= 0
+    for item in items:
+        response= await client.post("/items/", json=item)
+        valid+= response.status_code==200
+    return valid
+
+
+async def batch_post(client, items):
+    response= await client.post("/items/validate-batch", json=items)
+    response.raise_for_status()
+    return len(response.json()["valid"])
+
+
+async def run(items):
+    transport= httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await batch_post(client, items[:10])  # warm up
+        results= {}
+        for name, fn in (("single POSTs", single_posts), ("validate-batch", batch_post)):
+            start= time.perf_counter()
+            valid= await fn(client, items)
+            results[name]= (time.perf_counter()-start, valid)
+    return results
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Compare N single POST /items/ with one POST /items/validate-batch")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--invalid", type=float, default=0.1, help="Fraction of invalid items")
+    args= parser.parse_args()
+
+    items= make_items(args.items, args.invalid)
+    results= asyncio.run(run(items))
+    for name, (seconds, valid) in results.items():
+        print(f"{name:>15}: {seconds*1000:9.1f} ms   {seconds/len(items)*1e6:8.1f} us/item   {valid} valid of {len(items)}")
+    print(f"speedup: {results['single POSTs'][0]/results['validate-batch'][0]:.0f}x")
+
+
+if __name__=="__main__":
+    main()
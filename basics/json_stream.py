@@ -0,0 +1,71 @@
+# Streams the rows of a query as one JSON array, chunk by chunk
+# Related files: main3.py, main4.py, main5.py (GET /items/?stream=true), benchmark_read_items.py
+
+# Faster encoding with orjson (optional, falls back to the json module):
+#   pip install orjson
+
+# Returning List[Item] makes FastAPI load every row as an object, validate the
+# whole list against response_model and build the JSON in memory before the
+# first byte goes out. stream_json_array() instead:
+#   1. Runs a Core query on plain columns (no ORM objects, no pydantic)
+#   2. Fetches STREAM_CHUNK_ROWS rows at a time (yield_per)
+#   3. Encodes each chunk straight to bytes and sends it
+# so the response starts after the first chunk and memory stays flat however
+# many rows there are. The JSON is the same as the non-streaming response as long
+# as both read the same model_query(): read_rows() gives the non-streaming path
+# the same dicts (same keys, same order) to hand to response_model.
+# A database error halfway through can't become an error status any more (the
+# 200 has already been sent); the client sees a truncated array instead.
+
+import json
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson= None
+
+
+# Rows fetched and encoded per chunk
+STREAM_CHUNK_ROWS= 1000
+
+
+def dumps(obj):
+    """Compact JSON as bytes (orjson if installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def model_query(model):
+    """select() of every column of a SQLModel table model, in field order (the order its JSON has)."""
+    return select(*(getattr(model, name) for name in model.model_fields))
+
+
+def read_rows(engine, query):
+    """All rows of a plain-column query as dicts, for the non-streaming response."""
+    with engine.connect() as conn:
+        return [row._asdict() for row in conn.execute(query)]
+
+
+def iter_json_array(engine, query, chunk_rows: int=STREAM_CHUNK_ROWS):
+    """
+    Yields bytes that together form a JSON array with one object per row.
+    query must select plain columns, e.g. select(Item.id, Item.name); the
+    column names become the object keys.
+    """
+    fields= [column.key for column in query.selected_columns]
+    with engine.connect() as conn:
+        result= conn.execution_options(yield_per=chunk_rows).execute(query)
+        yield b"["
+        separator= b""
+        for rows in result.partitions():
+            yield separator + b",".join(dumps(dict(zip(fields, row))) for row in rows)
+            separator= b","
+        yield b"]"
+
+
+def stream_json_array(engine, query, chunk_rows: int=STREAM_CHUNK_ROWS):
+    """StreamingResponse around iter_json_array()."""
+    return StreamingResponse(iter_json_array(engine, query, chunk_rows), media_type="application/json")
@@ -1,13 +1,26 @@
 from fastapi import FastAPI
+from pathlib import Path
+import sys
+
+# The repo root holds middleware/response_cache.py (shared response cache)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from middleware.response_cache import ResponseCacheMiddleware, cache_response, router as cache_router
 
 # Create an instance of the FastAPI class
 # This instance will be used to define all our routes and configurations
 app= FastAPI()
 
+# Every route below returns the same thing for the same inputs, so responses are
+# cached in memory (@cache_response sets how long). A repeated request is answered
+# by the middleware before routing and validation; GET /debug/cache shows the hit ratio.
+app.add_middleware(ResponseCacheMiddleware)
+app.include_router(cache_router)
+
 # -------------------------------
 # Basic Route
 # -------------------------------
 @app.get("/")  # HTTP GET method at the root path "/"
+@cache_response(ttl=3600)
 def read_root():
     # Returns a simple JSON response
     return {"Hello": "World"}
@@ -17,6 +30,7 @@ def read_root():
 # Dynamic Endpoints using Path and Query Parameters
 # -------------------------------
 @app.get("/items/{item_id}")  # Dynamic route using a path parameter
+@cache_response(ttl=300, stale_while_revalidate=60)
 def read_item(item_id: int, q: str=None):
     """
     Path Parameter:
@@ -39,6 +53,7 @@ def read_item(item_id: int, q: str=None):
 # Optional Typed Query Parameters
 # -------------------------------
 @app.get("/products/")
+@cache_response(ttl=60, stale_while_revalidate=30)
 def list_products(skip: int=0, limit: int=10):
     """
     Query Parameters:
@@ -3,12 +3,22 @@
 # Pydantic models are used to define classes that represent the structure of data sent to or returned from API endpoints. 
 # They automatically validate the data types and structure, ensuring that incoming data is correct before it reaches your endpoint logic.
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+# Related file: benchmark_validate_batch.py (POST /items/validate-batch vs one POST per item)
+
+import json
+import logging
+from typing import List
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 # Create FastAPI instance
 app= FastAPI()
 
+# Debug output goes through logging instead of print(), so it costs nothing
+# unless the log level is DEBUG (e.g. logging.basicConfig(level=logging.DEBUG))
+logger= logging.getLogger(__name__)
+
 
 # -------------------------------
 # Define Pydantic Model for Request
@@ -51,7 +61,7 @@ def create_item(item: Item):
     Receives an Item object in the request body, validates it automatically,
     and returns it according to the ItemResponse model.
     """
-    print(item)  # Prints the received item to the console for debugging
+    logger.debug("Received item: %r", item)  # Logged only at DEBUG level
     return item  # Only fields in ItemResponse will be returned to the client
 
     # Example alternative return if you want a custom message:
@@ -61,6 +71,89 @@ def create_item(item: Item):
     # }
 
 
+# -------------------------------
+# Batch Validation
+# -------------------------------
+class ItemError(BaseModel):
+    """
+    One problem with one row of a batch.
+    - index: Position of the row in the request list
+    - loc: Field path inside the row, e.g. ["price"]
+    - msg / type: Pydantic's error message and error type
+    """
+    index: int
+    loc: List[str]
+    msg: str
+    type: str
+
+
+class BatchValidationResult(BaseModel):
+    """
+    Response of POST /items/validate-batch.
+    - valid: The rows that passed, in request order, shaped like ItemResponse
+    - errors: Every problem of every rejected row
+    """
+    valid: List[ItemResponse]
+    errors: List[ItemError]
+
+
+# Built once at import: a TypeAdapter compiles its validator/serializer when it is
+# created, so creating one per request would redo that work every time
+item_list_adapter= TypeAdapter(List[Item])
+
+# Rows accepted per request; larger batches get 413
+MAX_BATCH_ITEMS= 10_000
+
+
+# The body is read raw (see below), so its schema is given to /docs explicitly
+@app.post(
+    "/items/validate-batch",
+    response_model=BatchValidationResult,
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": {"type": "array", "items": Item.model_json_schema()}}}}},
+)
+async def validate_batch(request: Request):
+    """
+    Validates a JSON list of items in one pass and reports every bad row instead of
+    rejecting the whole request at the first one (which a List[Item] parameter would do).
+
+    Steps:
+    1. Validate the raw body as List[Item] (JSON parsing and validation in one go)
+    2. All rows valid: return them
+    3. Otherwise group the errors by row index and validate the remaining
+       rows again as a list (this pass can't fail)
+    Input values are never echoed back, so a rejected row's password stays private.
+    A body that isn't a JSON list gets the usual 422.
+    """
+    body= await request.body()
+    errors= []
+    try:
+        items= item_list_adapter.validate_json(body)
+        count= len(items)
+    except ValidationError as exc:
+        for error in exc.errors(include_url=False, include_input=False, include_context=False):
+            loc= error["loc"]
+            if not loc or not isinstance(loc[0], int):
+                # Not a list (or not JSON): nothing to validate row by row
+                raise RequestValidationError([{**error, "loc": ("body", *loc)}])
+            errors.append({"index": loc[0], "loc": [str(part) for part in loc[1:]], "msg": error["msg"], "type": error["type"]})
+        rows= json.loads(body)
+        count= len(rows)
+        items= None
+    if count>MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+    if items is None:
+        bad= {error["index"] for error in errors}
+        items= item_list_adapter.validate_python([row for index, row in enumerate(rows) if index not in bad])
+
+    # Serialized straight to JSON by pydantic (the password field left out), instead
+    # of letting FastAPI check every row against response_model again
+    valid= item_list_adapter.dump_json(items, exclude={"__all__": {"password"}})
+    return Response(
+        content=b'{"valid":'+valid+b',"errors":'+json.dumps(errors, separators=(",", ":")).encode()+b'}',
+        media_type="application/json",
+    )
+
+
 # -------------------------------
 # Notes:
 # -------------------------------
@@ -74,3 +167,8 @@ def create_item(item: Item):
 # 3. Response Models:
 #    - By defining a separate response model (ItemResponse), you can hide sensitive fields like passwords or internal IDs from API responses.
 #    - This helps keep your API responses clean and secure.
+#
+# 4. Batch Validation:
+#    - POST /items/validate-batch takes a list like [{"name": "Pen", "price": 1.5}, {"name": "Cup", "price": "cheap"}]
+#      and answers {"valid": [{"name": "Pen", ...}], "errors": [{"index": 1, "loc": ["price"], ...}]}.
+#    - Compare it with one POST /items/ per item: python basics/benchmark_validate_batch.py
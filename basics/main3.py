@@ -28,15 +28,30 @@ class Item(SQLModel, table=True):
 # -------------------------------
 # Setup SQLite Database Engine
 # -------------------------------
-from sqlmodel import create_engine, Session
+import os
+import sys
+from sqlmodel import Session
+
+# The repo root holds config_environment/engine_factory.py (shared pooled engines);
+# make it importable whether the app is started from the repo root or from this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_environment.engine_factory import create_db_engine, create_session_factory
+from config_environment.schema_check import ensure_schema
+from config_environment import engine_factory, sql_profiler
+from middleware.compression import CompressionMiddleware
+from middleware.single_flight import single_flight
 
 # SQLite file name and connection URL
 sqlite_file_name= "database.db"
 sqlite_url= f"sqlite:///{sqlite_file_name}"
 
-# Create a SQLModel engine to connect to the database
-# echo=True prints all SQL statements to the console for debugging
-engine= create_engine(sqlite_url, echo=True)
+# Create the engine through the shared factory: pool size, pre-ping, recycle, statement
+# cache and SQLite pragmas all come from config_environment.conf.Settings
+# (set DB_ECHO=true to print every SQL statement while debugging)
+engine= create_db_engine(sqlite_url)
+
+# Session factory; class_=Session keeps SQLModel's session.exec()
+SessionLocal= create_session_factory(engine, class_=Session)
 
 
 # -------------------------------
@@ -46,8 +61,10 @@ def create_db_and_tables():
     """
     Creates all tables defined with SQLModel.metadata.
     This is called on app startup to ensure tables exist before using them.
+    ensure_schema() skips the DDL (one SELECT instead of a check per table) when
+    the schema_version table says this exact schema was already created.
     """
-    SQLModel.metadata.create_all(engine)
+    ensure_schema(engine, SQLModel.metadata, name="basics")
 
 
 # -------------------------------
@@ -71,6 +88,19 @@ async def lifespan(app: FastAPI):
 # Pass the lifespan function to FastAPI
 app= FastAPI(lifespan=lifespan)
 
+# SQL profiler (only with SQL_PROFILE_SAMPLE_RATE > 0): query count and DB time in the
+# Server-Timing / X-DB-Queries response headers, recent requests and slow queries at GET /debug/sql
+# (which wants an X-Profile token made with PROFILE_SECRET, see config_environment/sql_profiler.py)
+sql_profiler.install(app, engine)
+
+# The engine's connection pool (in use, idle, overflow, connects/checkouts) at
+# GET /debug/pool, with the same token as GET /debug/sql
+app.include_router(engine_factory.router)
+
+# Compress responses (gzip/deflate, zstd if installed) for clients that accept it;
+# GET /items/?stream=true is compressed chunk by chunk as it streams
+app.add_middleware(CompressionMiddleware)
+
 
 # -------------------------------
 # Dependency Injection (optional for later use)
@@ -92,31 +122,55 @@ def create_item(item: Item):
     4. Refresh the item to get auto-generated fields (like id)
     5. Return the item
     """
-    with Session(engine) as session:
+    with SessionLocal() as session:
         session.add(item)
         session.commit()
         session.refresh(item)
-        return item
+    # A GET /items/ from now on must see the new item, not join a read that started before it
+    load_items.forget()
+    return item
 
 
 # -------------------------------
 # GET Endpoint to Read All Items
 # -------------------------------
 from typing import List
-from sqlmodel import select
+from fastapi.concurrency import run_in_threadpool
+from basics.json_stream import model_query, read_rows, stream_json_array
+
+# Every column in Item's field order: the regular and the streamed response
+# read the same query, so their JSON objects are identical
+ITEMS_QUERY= model_query(Item)
+
+@single_flight()
+async def load_items():
+    """
+    All items as a list of dicts. Concurrent callers share one query: when a spike
+    of GET /items/ requests arrives, the first runs the SELECT in the threadpool and
+    the others await it on the event loop, without holding a worker thread each
+    (middleware/single_flight.py). They all get the same list: don't modify it.
+    """
+    return await run_in_threadpool(read_rows, engine, ITEMS_QUERY)
+
 
 @app.get("/items/", response_model=List[Item])
-def read_items():
+async def read_items(stream: bool=False):
     """
     Fetches all items from the database.
     Steps:
-    1. Open a database session
-    2. Select all items using SQLModel's select()
-    3. Convert the result to a list and return
+    1. Select every column of every item (ITEMS_QUERY, also used for ?stream=true)
+    2. Return the rows as dicts; response_model validates them
+
+    With ?stream=true the items are streamed instead (see json_stream.py):
+    plain columns are read 1000 rows at a time and each chunk is encoded and
+    sent right away, skipping the per-row response_model validation. Same
+    JSON, but the first byte arrives at once and memory use stays flat.
+    Example URL: /items/?stream=true
     """
-    with Session(engine) as session:
-        items= session.exec(select(Item)).all()
-        return items
+    if stream:
+        return stream_json_array(engine, ITEMS_QUERY)
+    # Copies: the shared list's dicts stay untouched whatever happens to this response's
+    return [dict(row) for row in await load_items()]
 
 
 # -------------------------------
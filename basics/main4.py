@@ -34,11 +34,25 @@ class Item(SQLModel, table=True):
 # -------------------------------
 # Setup PostgreSQL Engine
 # -------------------------------
-from sqlmodel import create_engine, Session
+import os
+import sys
+from sqlmodel import Session
 
-# Create an SQLModel engine for connecting to PostgreSQL
-# echo=True prints all SQL statements to the console for debugging
-engine= create_engine(postgres_url, echo=True)
+# The repo root holds config_environment/engine_factory.py (shared pooled engines);
+# make it importable whether the app is started from the repo root or from this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_environment.engine_factory import create_db_engine, create_session_factory
+from config_environment.schema_check import ensure_schema
+from config_environment import engine_factory, sql_profiler
+from middleware.compression import CompressionMiddleware
+
+# Create the PostgreSQL engine through the shared factory: pool size/overflow,
+# pre-ping (drops connections the server closed) and recycle come from Settings
+# (set DB_ECHO=true to print every SQL statement while debugging)
+engine= create_db_engine(postgres_url)
+
+# Session factory; class_=Session keeps SQLModel's session.exec()
+SessionLocal= create_session_factory(engine, class_=Session)
 
 
 # -------------------------------
@@ -51,8 +65,10 @@ def create_db_and_tables():
     """
     Create all tables defined with SQLModel.metadata in the PostgreSQL database.
     Ensures that the database schema is set up before using the app.
+    With many workers only one runs the DDL (under a pg_advisory_lock); the
+    others, and every later boot, just compare the stored schema fingerprint.
     """
-    SQLModel.metadata.create_all(engine)
+    ensure_schema(engine, SQLModel.metadata, name="basics")
 
 # Lifespan function runs on app startup and shutdown
 @asynccontextmanager
@@ -67,6 +83,16 @@ async def lifespan(app: FastAPI):
 # Pass the lifespan function to FastAPI
 app=FastAPI(lifespan=lifespan)
 
+# Query count / DB time per request in the response headers, details at GET /debug/sql
+# (only with SQL_PROFILE_SAMPLE_RATE > 0, see main3.py)
+sql_profiler.install(app, engine)
+
+# Connection pool at GET /debug/pool (see main3.py)
+app.include_router(engine_factory.router)
+
+# Compressed responses, streamed ones chunk by chunk (see main3.py)
+app.add_middleware(CompressionMiddleware)
+
 @app.post("/items/")
 def create_item(item: Item):
     """
@@ -78,7 +104,7 @@ def create_item(item: Item):
     4. Refresh the item to get auto-generated fields (like id)
     5. Return the item
     """
-    with Session(engine) as session:
+    with SessionLocal() as session:
         session.add(item)
         session.commit()
         session.refresh(item)
@@ -89,20 +115,25 @@ def create_item(item: Item):
 # GET Endpoint to Read All Items
 # -------------------------------
 from typing import List
-from sqlmodel import select
+from basics.json_stream import model_query, read_rows, stream_json_array
+
+# Every column in Item's field order: the regular and the streamed response
+# read the same query, so their JSON objects are identical
+ITEMS_QUERY= model_query(Item)
 
 @app.get("/items/", response_model=List[Item])
-def read_items():
+def read_items(stream: bool=False):
     """
     Fetch all items from the PostgreSQL database.
     Steps:
-    1. Open a database session
-    2. Select all items using SQLModel's select()
-    3. Convert the result to a list and return
+    1. Select every column of every item (ITEMS_QUERY, also used for ?stream=true)
+    2. Return the rows as dicts; response_model validates them
+
+    ?stream=true streams the same JSON in chunks (see read_items in main3.py).
     """
-    with Session(engine) as session:
-        items= session.exec(select(Item)).all()
-        return items
+    if stream:
+        return stream_json_array(engine, ITEMS_QUERY)
+    return read_rows(engine, ITEMS_QUERY)
     
 
 
@@ -113,4 +144,4 @@ def read_items():
 # 2. Using the lifespan function ensures tables are created automatically when the app starts.
 # 3. `Session` manages transactions; always commit after adding/updating items.
 # 4. response_model ensures that FastAPI automatically converts database objects to JSON responses.
-# 5. echo=True is very helpful for debugging SQL queries while learning.
+# 5. DB_ECHO=true (Settings.db_echo) prints every SQL query, very helpful for debugging while learning.
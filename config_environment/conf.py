@@ -1,11 +1,12 @@
 # Configuration file using Pydantic Settings and environment variables
-# Related files: environ.py, .env
+# Related files: environ.py, engine_factory.py, schema_check.py, .env
 
 # Install dependencies:
 #   pip install pydantic-settings python-dotenv
 
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
+from typing import Dict, Optional, Union
 import os
 
 
@@ -21,9 +22,59 @@ class Settings(BaseSettings):
     Holds all application configuration variables.
     - database_url: URL for connecting to the database
     - secret_key: Secret key used for signing tokens, encryption, etc.
+
+    Database engine options, used by engine_factory.py for every app
+    (each can be set with the upper-case environment variable, e.g. DB_POOL_SIZE=20):
+    - db_pool_size: Connections the pool keeps open
+    - db_max_overflow: Extra connections allowed on top of db_pool_size under load
+    - db_pool_timeout: Seconds a request waits for a free connection before failing
+    - db_pool_pre_ping: Test each connection before handing it out (survives database restarts)
+    - db_pool_recycle: Replace connections older than this many seconds (-1 = never);
+                       keep it below the server's idle timeout (MySQL wait_timeout)
+    - db_statement_cache_size: Compiled SQL statements cached per engine (and per SQLite connection)
+    - db_echo: Log every SQL statement (for debugging, slow in production)
+    - sqlite_pragmas: PRAGMAs run on every new SQLite connection
+                      (JSON in the environment: SQLITE_PRAGMAS='{"journal_mode": "WAL"}')
+    - db_schema_check: Skip the startup DDL when schema_version already has the current
+                       schema fingerprint (schema_check.py); false = always run create_all
+
+    SQL profiler options (sql_profiler.py):
+    - sql_profile_sample_rate: Fraction of requests profiled; 0 (default) = profiler off,
+                               sql_profiler.install() adds no middleware and no event hooks
+    - sql_slow_query_ms: Statements slower than this go to the slow-query log
+    - sql_profile_buffer_size: Requests and slow queries kept for GET /debug/sql
+    - sql_profile_secret: HMAC secret for the GET /debug/sql and /debug/pool tokens
+                          (default: PROFILE_SECRET); unset = they refuse every request
     """
-    database_url: str= os.getenv('DATABASE_URL')
-    secret_key: str= os.getenv('SECRET_KEY')
+    # Optional, so apps that only need the engine options still start without a .env
+    database_url: Optional[str]= os.getenv('DATABASE_URL')
+    secret_key: Optional[str]= os.getenv('SECRET_KEY')
+
+    db_pool_size: int= 5
+    db_max_overflow: int= 10
+    db_pool_timeout: float= 30.0
+    db_pool_pre_ping: bool= True
+    db_pool_recycle: int= 1800
+    db_statement_cache_size: int= 500
+    db_echo: bool= False
+    db_schema_check: bool= True
+    # journal_mode=WAL    -> readers don't block the writer (and vice versa)
+    # synchronous=NORMAL  -> with WAL, fsync at checkpoints instead of on every commit
+    # busy_timeout        -> wait for the lock instead of failing with "database is locked"
+    # cache_size          -> negative value = size in KiB (here 64 MiB of page cache)
+    # temp_store=MEMORY   -> temp tables and sort spills stay in RAM
+    sqlite_pragmas: Dict[str, Union[int, str]]= {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+    }
+
+    sql_profile_sample_rate: float= 0.0
+    sql_slow_query_ms: float= 100.0
+    sql_profile_buffer_size: int= 200
+    sql_profile_secret: Optional[str]= os.getenv('PROFILE_SECRET')
 
 # Create a single settings instance to use across the application
 settings= Settings()
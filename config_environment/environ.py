@@ -2,10 +2,23 @@
 # Related files: conf.py, .env
 
 from fastapi import FastAPI
+from pathlib import Path
+import sys
 from conf import settings  # Import the settings instance
 
+# The repo root holds middleware/response_cache.py (shared response cache)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from middleware.response_cache import ResponseCacheMiddleware, cache_response, router as cache_router
+
 app= FastAPI()
 
+# Settings are read once at startup, so GET / only changes on a restart and the
+# browser may keep it for ttl. private=True: it contains the secret key, so neither
+# proxies on the way nor the shared in-memory cache keep a copy (GET /debug/cache
+# counts it as a miss every time)
+app.add_middleware(ResponseCacheMiddleware)
+app.include_router(cache_router)
+
 # Print database URL to confirm settings are loaded
 print(settings.database_url)
 
@@ -14,6 +27,7 @@ print(settings.database_url)
 # GET Endpoint: Display Config
 # -------------------------------
 @app.get("/")
+@cache_response(ttl=300, stale_while_revalidate=300, private=True)
 async def root():
     """
     Returns configuration values as JSON.
@@ -0,0 +1,153 @@
+# Creates the tables at startup only when the schema changed, not on every boot
+# Related files: engine_factory.py, conf.py (Settings.db_schema_check), benchmark_schema_check.py,
+#                basics/main3.py-main5.py, database_crud_sqlalchemy/sharding.py, jwt_auth/jwt.py, auth_database/app.py
+
+# Use in an app (instead of metadata.create_all(engine)):
+#   from config_environment.schema_check import ensure_schema
+#   ensure_schema(engine, SQLModel.metadata, name="basics")
+
+# Why: create_all() checks every table with a reflection query before creating
+# it. Against a remote Postgres/MySQL that is one round trip per table, in every
+# worker, on every boot, and all workers of a rolling restart race to run the DDL.
+#
+# How it works:
+#   1. The fingerprint is a SHA-256 of the CREATE TABLE / CREATE INDEX statements
+#      the metadata produces for this database (plus any extra raw DDL), so any
+#      change to a model gives a new fingerprint.
+#   2. The schema_version table stores one fingerprint per name. If it matches,
+#      startup costs a single SELECT and no DDL runs.
+#   3. Otherwise the worker takes a schema lock, looks again (the worker that held
+#      the lock before may have just done it), runs the DDL and stores the fingerprint.
+#      Lock per database:
+#        postgresql -> pg_advisory_lock
+#        mysql      -> GET_LOCK (LOCK_TIMEOUT seconds, then TimeoutError)
+#        sqlite     -> flock on "<database file>.schema-lock" (none for in-memory databases)
+#
+# This is not a migration tool: like create_all it only adds missing tables and
+# indexes. If tables are dropped by hand, delete their schema_version row (or
+# start once with DB_SCHEMA_CHECK=false, which always runs the DDL).
+
+import hashlib
+import time
+from contextlib import contextmanager, nullcontext
+from sqlalchemy import Column, Float, MetaData, String, Table, delete, insert, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from config_environment.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: SQLite workers are not serialized
+    fcntl= None
+
+
+# Seconds a MySQL worker waits for another one to finish creating the schema
+LOCK_TIMEOUT= 60
+
+# Kept apart from the apps' metadata so their create_all() never touches it
+version_metadata= MetaData()
+schema_version= Table(
+    "schema_version", version_metadata,
+    Column("name", String(100), primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def metadata_fingerprint(metadata, dialect, extra=()):
+    """SHA-256 of the DDL that metadata (plus the extra statements) produces for dialect."""
+    parts= []
+    for table in metadata.sorted_tables:
+        parts.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            parts.append(str(CreateIndex(index).compile(dialect=dialect)))
+    parts.extend(extra)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def read_fingerprint(engine, name: str):
+    """Stored fingerprint for name, or None (not stored yet, or no schema_version table)."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_version.c.fingerprint).where(schema_version.c.name==name)).scalar()
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def write_fingerprint(engine, name: str, fingerprint: str):
+    version_metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(delete(schema_version).where(schema_version.c.name==name))
+        conn.execute(insert(schema_version).values(name=name, fingerprint=fingerprint, updated_at=time.time()))
+
+
+@contextmanager
+def advisory_lock(engine, name: str):
+    """Server-side lock that only one connection (worker) can hold at a time."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name=="postgresql":
+            key= int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+        else:
+            if conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": name[:64], "timeout": LOCK_TIMEOUT}).scalar()!=1:
+                raise TimeoutError(f"Schema lock {name!r} still held by another worker after {LOCK_TIMEOUT}s")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name[:64]})
+
+
+@contextmanager
+def file_lock(path: str):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def schema_lock(engine, name: str):
+    """Lock held while one worker creates the schema (see top of file)."""
+    dialect= engine.dialect.name
+    if dialect in ("postgresql", "mysql", "mariadb"):
+        return advisory_lock(engine, f"schema:{name}")
+    database= make_url(engine.url).database
+    if dialect=="sqlite" and fcntl is not None and database not in (None, "", ":memory:"):
+        return file_lock(f"{database}.schema-lock")
+    return nullcontext()
+
+
+def ensure_schema(engine, metadata, name: str, create=None, extra=(), settings=settings):
+    """
+    Creates the schema for metadata on engine unless schema_version says it's already there.
+    - name: Row in schema_version (one per app/metadata sharing the database)
+    - create: Function(engine) that runs the DDL (default: metadata.create_all)
+    - extra: Raw DDL statements that create() runs besides metadata, so changing them
+             changes the fingerprint too
+    Returns True if this call ran the DDL, False if the stored fingerprint matched.
+
+    Steps:
+    1. One SELECT: stored fingerprint == current one -> nothing to do
+    2. Otherwise wait for the schema lock and check again
+    3. Still different: run create(engine), then store the new fingerprint
+    """
+    create= create or metadata.create_all
+    if not settings.db_schema_check:
+        create(engine)
+        return True
+
+    fingerprint= metadata_fingerprint(metadata, engine.dialect, extra)
+    if read_fingerprint(engine, name)==fingerprint:
+        return False
+    with schema_lock(engine, name):
+        if read_fingerprint(engine, name)==fingerprint:
+            return False
+        create(engine)
+        write_fingerprint(engine, name, fingerprint)
+    return True
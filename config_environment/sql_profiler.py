@@ -0,0 +1,261 @@
+# Lightweight SQL profiler: query count and DB time per request, plus a slow-query log
+# Related files: conf.py (Settings), basics/main3.py-main5.py, database_crud_sqlalchemy/crud.py
+
+# Use in an app (after building its engines):
+#   from config_environment import sql_profiler
+#   sql_profiler.install(app, engine)            # middleware + GET /debug/sql + hooks on engine
+#
+# Off by default: with sql_profile_sample_rate=0 (the default) install() does
+# nothing, so no engine gets the hooks. Turn it on per run, e.g.
+#   SQL_PROFILE_SAMPLE_RATE=0.1 uvicorn main3:app
+# Only the engines passed to install() are hooked; apps that don't call it
+# (jwt_auth, auth_database...) never pay for it.
+#
+# Cost per statement (python -m config_environment.sql_profiler, SELECT 1 on
+# in-memory SQLite, this repo's dev machine):
+#   no hooks 31.5 us, hooks on but request not sampled 40.9 us (+9.4 us),
+#   request profiled 47.3 us (+15.7 us). Other runs measured +9 to +14 us unsampled.
+# This misses the "few us per query" budget the profiler was meant to stay in.
+# Nearly all of it is SQLAlchemy dispatching cursor events at all: no-op hooks
+# cost the same, and for a request that isn't sampled both hooks already return
+# after one ContextVar lookup (no perf_counter, no bookkeeping). So sampling fewer
+# requests doesn't remove it, only not attaching the hooks does. That is why they
+# are attached only when profiling is on, and it's off by default.
+#
+# GET /debug/sql shows SQL text and timings of real traffic, so it wants a token
+# (X-Profile header or ?profile=), the same kind middleware/profiler.py uses,
+# made with Settings.sql_profile_secret (default: PROFILE_SECRET):
+#   PROFILE_SECRET=... python -m middleware.profiler token --minutes 10
+# Without a secret it answers 403 to everyone; the response headers still work.
+
+# How it works:
+#   1. SQLProfilerMiddleware picks a sample of requests (sql_profile_sample_rate)
+#      and puts a fresh RequestProfile in a ContextVar for each of them.
+#   2. before/after_cursor_execute hooks on the app's engines time each statement with
+#      perf_counter_ns and add it to the current profile. Outside a sampled
+#      request they return after a single ContextVar lookup.
+#   3. When the response starts, the middleware adds
+#        Server-Timing: db;dur=<ms>;desc="<n> queries"   (shows up in browser dev tools)
+#        X-DB-Queries: <n>
+#      and afterwards stores the request's totals in a ring buffer.
+#   4. Statements slower than sql_slow_query_ms go to a second ring buffer with
+#      their parameters redacted to type names, so no values are kept.
+# Unlike echo=True nothing is printed; GET /debug/sql shows both buffers.
+#
+# The context is copied into the threadpool that runs `def` endpoints, so their
+# queries count. Work on threads the request doesn't own (e.g. the CRUD app's
+# write_queue thread) is not attributed to the request.
+
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter_ns
+from fastapi import APIRouter, Header, HTTPException, Query
+from sqlalchemy import event
+from config_environment.conf import settings
+from middleware.profiler import check_token
+
+
+class RequestProfile:
+    """Queries run and DB time (ns) for one request."""
+    __slots__= ("queries", "db_ns")
+
+    def __init__(self):
+        self.queries= 0
+        self.db_ns= 0
+
+
+# Profile of the request being handled, or None (not in a request, or not sampled)
+current_profile= ContextVar("sql_profile", default=None)
+
+SLOW_QUERY_NS= int(settings.sql_slow_query_ms*1_000_000)
+
+# Ring buffers for GET /debug/sql
+recent_requests= deque(maxlen=settings.sql_profile_buffer_size)
+slow_queries= deque(maxlen=settings.sql_profile_buffer_size)
+
+# Process-wide counters (profiled requests only)
+totals= {"requests": 0, "skipped": 0, "queries": 0, "db_ms": 0.0}
+
+
+def redact(parameters, executemany: bool):
+    """Replaces parameter values with their type names."""
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        context._profile_start= perf_counter_ns()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile= current_profile.get()
+    if profile is None:
+        return
+    start= getattr(context, "_profile_start", None)
+    if start is None:  # profiling began while this statement was running
+        return
+    elapsed= perf_counter_ns()-start
+    profile.queries+= 1
+    profile.db_ns+= elapsed
+    if elapsed>=SLOW_QUERY_NS:
+        slow_queries.append({
+            "statement": statement[:1000],
+            "parameters": redact(parameters, executemany),
+            "duration_ms": round(elapsed/1e6, 3),
+            "database": conn.engine.url.render_as_string(hide_password=True),
+            "at": time.time(),
+        })
+
+
+def attach(engine):
+    """Adds the timing hooks to an Engine or AsyncEngine (once, however often it's called)."""
+    engine= getattr(engine, "sync_engine", engine)
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def install(app, *engines, sample_rate: float=None):
+    """
+    Profiles app's requests against engines: adds SQLProfilerMiddleware, GET /debug/sql
+    and the hooks on every engine (None entries are skipped).
+    Does nothing if the sample rate (default: Settings.sql_profile_sample_rate) is 0.
+    Returns True if the profiler was installed.
+    """
+    sample_rate= settings.sql_profile_sample_rate if sample_rate is None else sample_rate
+    if sample_rate<=0:
+        return False
+    for engine in engines:
+        if engine is not None:
+            attach(engine)
+    app.add_middleware(SQLProfilerMiddleware, sample_rate=sample_rate)
+    app.include_router(router)
+    return True
+
+
+class SQLProfilerMiddleware:
+    """
+    Pure ASGI middleware: profiles a sample of HTTP requests and reports each
+    one's query count and DB time in its response headers.
+    - sample_rate: Fraction of requests profiled (default: Settings.sql_profile_sample_rate)
+    """
+
+    def __init__(self, app, sample_rate: float=None):
+        self.app= app
+        self.sample_rate= settings.sql_profile_sample_rate if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http" or self.sample_rate<=0 or random.random()>=self.sample_rate:
+            if scope["type"]=="http":
+                totals["skipped"]+= 1
+            return await self.app(scope, receive, send)
+
+        profile= RequestProfile()
+        token= current_profile.set(profile)
+        status= []
+
+        async def send_with_timing(message):
+            if message["type"]=="http.response.start":
+                status.append(message["status"])
+                db_ms= profile.db_ns/1e6
+                headers= list(message.get("headers", []))
+                headers.append((b"server-timing", f'db;dur={db_ms:.3f};desc="{profile.queries} queries"'.encode()))
+                headers.append((b"x-db-queries", str(profile.queries).encode()))
+                message= {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_profile.reset(token)
+            db_ms= profile.db_ns/1e6
+            totals["requests"]+= 1
+            totals["queries"]+= profile.queries
+            totals["db_ms"]+= db_ms
+            recent_requests.append({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status[0] if status else None,
+                "queries": profile.queries,
+                "db_ms": round(db_ms, 3),
+                "at": time.time(),
+            })
+
+
+# -------------------------------
+# Debug Endpoint
+# -------------------------------
+router= APIRouter()
+
+
+@router.get("/debug/sql")
+def sql_debug(x_profile: str= Header(None), profile: str= Query(None)):
+    """
+    Recent profiled requests (query count, DB time), the slow-query log
+    (parameters redacted) and totals since startup.
+    Needs a token made with Settings.sql_profile_secret (see top of file), else 403.
+    """
+    if not check_token(x_profile or profile or "", settings.sql_profile_secret or ""):
+        raise HTTPException(status_code=403, detail="Valid X-Profile token required")
+    return {
+        "settings": {
+            "sample_rate": settings.sql_profile_sample_rate,
+            "slow_query_ms": settings.sql_slow_query_ms,
+        },
+        "totals": {**totals, "db_ms": round(totals["db_ms"], 3)},
+        "requests": list(recent_requests),
+        "slow_queries": list(slow_queries),
+    }
+
+
+if __name__=="__main__":
+    # Per-query overhead of the hooks: the same statement on a plain engine and a profiled one
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import StaticPool
+
+    runs= 20_000
+
+    def per_query_us(engine, profiled: bool):
+        token= current_profile.set(RequestProfile() if profiled else None)
+        try:
+            with engine.connect() as conn:
+                statement= text("SELECT 1")
+                conn.execute(statement)
+                start= perf_counter_ns()
+                for _ in range(runs):
+                    conn.execute(statement)
+                return (perf_counter_ns()-start)/runs/1000
+        finally:
+            current_profile.reset(token)
+
+    def noop(*args):
+        pass
+
+    plain= create_engine("sqlite://", poolclass=StaticPool)
+    # Any cursor event makes SQLAlchemy dispatch events on every statement; this
+    # engine measures that fixed cost with hooks that do nothing
+    noop_hooked= create_engine("sqlite://", poolclass=StaticPool)
+    event.listen(noop_hooked, "before_cursor_execute", noop)
+    event.listen(noop_hooked, "after_cursor_execute", noop)
+    hooked= create_engine("sqlite://", poolclass=StaticPool)
+    attach(hooked)
+
+    # Modes take turns within each round so machine noise hits them all alike; best round wins
+    modes= {"base": (plain, False), "dispatch": (noop_hooked, False), "idle": (hooked, False), "active": (hooked, True)}
+    best= {mode: float("inf") for mode in modes}
+    for _ in range(7):
+        for mode, (engine, profiled) in modes.items():
+            best[mode]= min(best[mode], per_query_us(engine, profiled))
+    base, dispatch, idle, active= best["base"], best["dispatch"], best["idle"], best["active"]
+    print(f"SELECT 1 without hooks:                {base:6.2f} us")
+    print(f"no-op hooks (SQLAlchemy event cost):   {dispatch:6.2f} us  ({dispatch-base:+.2f} us)")
+    print(f"profiler hooks, request not sampled:   {idle:6.2f} us  ({idle-dispatch:+.2f} us over no-op hooks)")
+    print(f"profiler hooks, request profiled:      {active:6.2f} us  ({active-dispatch:+.2f} us over no-op hooks)")
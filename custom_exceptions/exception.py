@@ -5,6 +5,12 @@
 #   - Exception handlers for returning custom responses
 
 from fastapi import FastAPI, HTTPException
+from pathlib import Path
+import sys
+
+# The repo root holds middleware/response_cache.py (shared response cache)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from middleware.response_cache import ResponseCacheMiddleware, cache_response, router as cache_router
 
 
 # -------------------------------
@@ -12,11 +18,17 @@ from fastapi import FastAPI, HTTPException
 # -------------------------------
 app= FastAPI()
 
+# /divide/ is a pure function of a and b: repeated requests come from the cache
+# (GET /debug/cache shows the hit ratio). The 400 for b=0 is not cached.
+app.add_middleware(ResponseCacheMiddleware)
+app.include_router(cache_router)
+
 
 # -------------------------------
 # Example: Handling Division by Zero
 # -------------------------------
 @app.get("/divide/")
+@cache_response(ttl=3600)
 def divide(a: float, b: float):
     """
     Divide two numbers.
@@ -0,0 +1,90 @@
+# Benchmark: sync (threadpool) vs async (aiosqlite) CRUD endpoints
+# Related files: crud.py, crud_async.py, db2.py
+
+# Usage (from this folder):
+#   pip install httpx aiosqlite "sqlalchemy[asyncio]"
+#   python benchmark_db_modes.py --requests 5000 --concurrency 200
+#
+# Each mode runs in its own subprocess against a scratch SQLite file, because
+# db2.py picks the mode when it is imported. Requests go through httpx's
+# in-process ASGI transport, so the numbers measure the app, not the network.
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+SEED_ITEMS= 1000
+
+
+async def run_load(requests: int, concurrency: int):
+    """Fires a 90% GET / 10% PUT mix at the app and returns per-request latencies (seconds)."""
+    import httpx
+    from crud import app, upsert_batch
+    from schemas2 import ItemSchema
+
+    upsert_batch([(i, ItemSchema(name=f"item-{i}", quantity=i, price=1.0)) for i in range(SEED_ITEMS)])
+
+    latencies= []
+    semaphore= asyncio.Semaphore(concurrency)
+    transport= httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(n):
+            item_id= random.randint(1, SEED_ITEMS)
+            async with semaphore:
+                start= time.perf_counter()
+                if n%10==0:
+                    body= {"name": f"item-{item_id-1}", "quantity": n, "price": 2.0}
+                    response= await client.put(f"/items/{item_id}", json=body)
+                else:
+                    response= await client.get(f"/items/{item_id}")
+                latencies.append(time.perf_counter()-start)
+                response.raise_for_status()
+
+        await asyncio.gather(*(one(n) for n in range(requests)))
+    return latencies
+
+
+def child(mode: str, requests: int, concurrency: int):
+    """Runs inside the subprocess: load test one mode and print a result line."""
+    start= time.perf_counter()
+    latencies= asyncio.run(run_load(requests, concurrency))
+    elapsed= time.perf_counter()-start
+    latencies.sort()
+    p50= statistics.median(latencies)*1000
+    p99= latencies[int(len(latencies)*0.99)-1]*1000
+    print(f"{mode:>5}: {requests/elapsed:8.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Compare sync and async CRUD modes")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--child", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args= parser.parse_args()
+
+    if args.child:
+        child(args.child, args.requests, args.concurrency)
+        return
+
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env= dict(
+                os.environ,
+                ITEMS_DB_MODE=mode,
+                ITEMS_DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+                ITEM_CACHE_SIZE="0",  # measure the database path, not the cache
+            )
+            command= [sys.executable, __file__, "--child", mode,
+                      "--requests", str(args.requests), "--concurrency", str(args.concurrency)]
+            subprocess.run(command, env=env, check=True)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,86 @@
+# Benchmark: FTS5 search vs LIKE '%q%' over a large items table
+# Related files: search.py, models2.py
+
+# Usage (from this folder):
+#   python benchmark_search.py --rows 1000000
+#
+# Builds a scratch SQLite database (the real items.db is not touched), fills it
+# with random item names, then times the same queries both ways.
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("ITEMS_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_search.db")
+
+from sqlalchemy import insert, text
+from db2 import engine, SessionLocal
+from models2 import Base, Item
+from search import create_search_index, search_items
+
+
+# A vocabulary of 5000 made-up words, so each word appears in a small fraction of rows
+random.seed(42)
+VOCAB= ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randint(4, 9))) for _ in range(5000)]
+
+
+def fill(rows: int):
+    """Inserts random 'word word word N' names in chunks of 50k."""
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    chunk= 50_000
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk):
+            batch= [
+                {"name": f"{' '.join(random.sample(VOCAB, 3))} {n}", "price": 1.0, "quantity": 1}
+                for n in range(start, min(start+chunk, rows))
+            ]
+            conn.execute(insert(Item), batch)
+
+
+def timed(fn, repeat: int):
+    """Median wall time of fn() in milliseconds."""
+    times= []
+    for _ in range(repeat):
+        start= time.perf_counter()
+        fn()
+        times.append((time.perf_counter()-start)*1000)
+    return statistics.median(times)
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Compare FTS5 search with LIKE '%q%'")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args= parser.parse_args()
+
+    start= time.perf_counter()
+    fill(args.rows)
+    print(f"filled {args.rows} rows in {time.perf_counter()-start:.1f}s")
+
+    # Type-ahead style queries: a full word, a prefix, and two prefixes together
+    words= random.sample(VOCAB, 3)
+    queries= [words[0], words[1][:3], f"{words[2][:4]} {words[0][:3]}"]
+
+    with SessionLocal() as db:
+        for q in queries:
+            # The LIKE version: every word must appear somewhere in the name
+            terms= q.split()
+            like_sql= text(
+                "SELECT id, name FROM items WHERE "
+                + " AND ".join(f"name LIKE :p{i}" for i in range(len(terms)))
+                + " LIMIT :limit"
+            )
+            params= {f"p{i}": f"%{term}%" for i, term in enumerate(terms)}
+            params["limit"]= args.limit
+            like_ms= timed(lambda: db.execute(like_sql, params).all(), args.repeat)
+            fts_ms= timed(lambda: search_items(db, q, args.limit), args.repeat)
+            print(f"{q!r:>16}: LIKE {like_ms:8.2f} ms   FTS5 {fts_ms:8.2f} ms   ({like_ms/fts_ms:6.1f}x)")
+
+
+if __name__=="__main__":
+    main()
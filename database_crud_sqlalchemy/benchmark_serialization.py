@@ -0,0 +1,135 @@
+# Microbenchmark: response serialisation of ORM objects vs column rows + response models
+# Related files: schemas2.py (ITEM_COLUMNS, row_to_dict, response models), crud.py
+
+# Usage (from this folder):
+#   python benchmark_serialization.py --rows 1000 --page 100
+#
+# Works on a scratch items.db in a temporary folder (the real one is not touched).
+#   Part 1 times one page without HTTP, split into fetch and encode:
+#     before -> select(Item) ORM objects, jsonable_encoder + json.dumps
+#               (what FastAPI does when a handler has no response_model)
+#     after  -> select(*ITEM_COLUMNS) + row_to_dict, then validate + dump_json
+#               through a TypeAdapter (what FastAPI does with a response_model)
+#   Part 2 puts both versions behind real routes on a small FastAPI app and
+#   times whole GET requests through the ASGI interface (CPU time per request).
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE= os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+
+def per_call_us(fn, runs: int):
+    fn()
+    start= time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter()-start)/runs*1e6
+
+
+async def get_cpu_us(app, path: str, runs: int):
+    """CPU microseconds per GET through the ASGI interface (threadpool work included)."""
+    scope= {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(dict(scope), receive, send)
+    start= time.process_time()
+    for _ in range(runs):
+        await app(dict(scope), receive, send)
+    return (time.process_time()-start)/runs*1e6
+
+
+def main():
+    parser= argparse.ArgumentParser(description="ORM objects + jsonable_encoder vs column rows + response models")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=300)
+    args= parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    from fastapi import FastAPI
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import insert, select
+    from db2 import engine, SessionLocal
+    from models2 import Base, Item
+    from schemas2 import ITEM_COLUMNS, ItemOut, ItemPage, row_to_dict
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Item), [{"name": f"item {n}", "quantity": n%50, "price": n/4} for n in range(args.rows)])
+
+    orm_query= select(Item).order_by(Item.id).limit(args.page)
+    row_query= select(*ITEM_COLUMNS).order_by(Item.id).limit(args.page)
+    page_adapter= TypeAdapter(ItemPage)
+
+    def fetch_orm():
+        with SessionLocal() as db:
+            return db.scalars(orm_query).all()
+
+    def fetch_rows():
+        with engine.connect() as conn:
+            return [row_to_dict(row) for row in conn.execute(row_query)]
+
+    orm_items, row_items= fetch_orm(), fetch_rows()
+
+    def encode_before():
+        return json.dumps(jsonable_encoder({"items": orm_items, "next": None})).encode()
+
+    def encode_after():
+        return page_adapter.dump_json(page_adapter.validate_python({"items": row_items, "next": None}))
+
+    assert json.loads(encode_before())==json.loads(encode_after())
+
+    print(f"Part 1: one page of {args.page} items, no HTTP")
+    for name, fetch, encode in (("before", fetch_orm, encode_before), ("after", fetch_rows, encode_after)):
+        fetch_us, encode_us= per_call_us(fetch, args.runs), per_call_us(encode, args.runs)
+        print(f"  {name:>6}: fetch {fetch_us:8.1f} us   encode {encode_us:8.1f} us   total {fetch_us+encode_us:8.1f} us")
+
+    app= FastAPI()
+
+    @app.get("/before")
+    def list_before():
+        return {"items": fetch_orm(), "next": None}
+
+    @app.get("/after", response_model=ItemPage)
+    def list_after():
+        return {"items": fetch_rows(), "next": None}
+
+    one_orm= select(Item).where(Item.id==1)
+    one_row= select(*ITEM_COLUMNS).where(Item.id==1)
+
+    @app.get("/before/1")
+    def get_before():
+        with SessionLocal() as db:
+            return db.scalars(one_orm).first()
+
+    @app.get("/after/1", response_model=ItemOut)
+    def get_after():
+        with engine.connect() as conn:
+            return row_to_dict(conn.execute(one_row).first())
+
+    print("Part 2: whole GET requests, CPU time per request")
+    for label, path in ((f"page of {args.page}", ""), ("single item", "/1")):
+        before= asyncio.run(get_cpu_us(app, "/before"+path, args.runs))
+        after= asyncio.run(get_cpu_us(app, "/after"+path, args.runs))
+        print(f"  {label:>12}: before {before:8.1f} us   after {after:8.1f} us   ({(1-after/before)*100:.0f}% less CPU)")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,114 @@
+# In-process read-through cache for single items
+# Related files: crud.py, crud_async.py (get_item reads through it, writes invalidate it)
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ItemCache:
+    """
+    Size-bounded LRU cache with a TTL, used in front of get_item.
+    - max_size: Maximum number of cached keys; the least recently used is evicted first
+    - ttl: Seconds a found item stays cached
+    - negative_ttl: Seconds a "not found" answer stays cached (kept short, ids get created later)
+    Handlers run in Starlette's threadpool, so every access is guarded by a lock.
+    """
+
+    def __init__(self, max_size: int=1024, ttl: float=30.0, negative_ttl: float=5.0):
+        self.max_size= max_size
+        self.ttl= ttl
+        self.negative_ttl= negative_ttl
+        self._entries= OrderedDict()  # key -> (expires_at, value); value None means "not found"
+        self._lock= threading.Lock()
+        # Bumped on every invalidation so a load that raced with a write isn't stored
+        self._generation= 0
+        self.hits= 0
+        self.negative_hits= 0
+        self.misses= 0
+        self.evictions= 0
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, or calls loader(key) and caches its result.
+        loader should return None when the key doesn't exist (that gets negatively cached).
+        """
+        found, value, generation= self._lookup(key)
+        if found:
+            return value
+        # Load outside the lock so a slow query doesn't block other readers
+        value= loader(key)
+        self._store(key, value, generation)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """Same as get_or_load, for an async loader (used by crud_async.py)."""
+        found, value, generation= self._lookup(key)
+        if found:
+            return value
+        value= await loader(key)
+        self._store(key, value, generation)
+        return value
+
+    def _lookup(self, key):
+        """Returns (found, value, generation) and updates the counters."""
+        now= time.monotonic()
+        with self._lock:
+            entry= self._entries.get(key)
+            if entry and entry[0]>now:
+                self._entries.move_to_end(key)
+                if entry[1] is None:
+                    self.negative_hits+= 1
+                else:
+                    self.hits+= 1
+                return True, entry[1], None
+            self.misses+= 1
+            return False, None, self._generation
+
+    def _store(self, key, value, generation):
+        """Caches a loaded value unless an invalidation happened since the lookup."""
+        with self._lock:
+            if generation!=self._generation:
+                return
+            ttl= self.negative_ttl if value is None else self.ttl
+            self._entries[key]= (time.monotonic()+ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions+= 1
+
+    def invalidate(self, *keys):
+        """Drops the given keys (called after a write commits)."""
+        with self._lock:
+            self._generation+= 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops everything."""
+        with self._lock:
+            self._generation+= 1
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size, for sizing the cache."""
+        with self._lock:
+            lookups= self.hits+self.negative_hits+self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits+self.negative_hits)/lookups if lookups else 0.0,
+            }
+
+
+# Shared instance used by the CRUD endpoints (sizes and TTLs are configurable via env)
+item_cache= ItemCache(
+    max_size=int(os.getenv("ITEM_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ITEM_CACHE_TTL", "30")),
+    negative_ttl=float(os.getenv("ITEM_CACHE_NEGATIVE_TTL", "5")),
+)
@@ -0,0 +1,212 @@
+# Change feed for items: change log table + in-process broadcast hub for SSE
+# Related files: crud.py (GET /items/changes), models2.py (ItemChange), db2.py (write_queue)
+
+# How a change reaches a subscriber:
+#   1. A trigger on items appends a row to item_changes in the same transaction
+#      as the write, so every write path is logged and nothing is logged for a
+#      write that rolled back.
+#   2. After each batch commits, write_queue calls ChangeHub.notify() (async-mode
+#      writes do the same through Shard.after_async_commit). That only sets an
+#      asyncio.Event, so writers never wait on subscribers.
+#   3. The hub's pump task reads the new log rows and puts them on every
+#      subscriber's bounded queue. A subscriber whose queue is full is dropped
+#      with a "lagged" marker instead of slowing anyone down; it reconnects with
+#      Last-Event-ID and catches up from the log.
+#
+# Retention: the log keeps the last ITEMS_CHANGES_RETAIN rows per file (0 = all).
+# ChangeLogPruner, another commit listener, deletes older ones in chunks of a tenth
+# of that, so the log (and items.db) stops growing. A client resuming from before
+# the oldest kept row can't catch up any more: it gets the "lagged" marker with
+# "expired": true and an id at the start of what is kept, and has to reload the items.
+#
+# With several shards (sharding.py) every shard has its own log and its own hub.
+# A client subscribes to all of them with one Subscriber; events carry the shard
+# they came from, and the SSE id is the position in every log ("12.0.7").
+
+import asyncio
+import json
+import os
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, text
+from models2 import ItemChange
+
+
+ITEM_JSON= "json_object('id', {row}.id, 'name', {row}.name, 'quantity', {row}.quantity, 'price', {row}.price, 'version', {row}.version)"
+NOW= "(julianday('now') - 2440587.5) * 86400.0"  # unix time, works on any SQLite version
+
+CHANGE_LOG_DDL= [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS item_changes_insert AFTER INSERT ON items BEGIN
+        INSERT INTO item_changes (op, item_id, item, created_at)
+        VALUES ('create', new.id, {ITEM_JSON.format(row="new")}, {NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS item_changes_update AFTER UPDATE ON items BEGIN
+        INSERT INTO item_changes (op, item_id, item, created_at)
+        VALUES ('update', new.id, {ITEM_JSON.format(row="new")}, {NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS item_changes_delete AFTER DELETE ON items BEGIN
+        INSERT INTO item_changes (op, item_id, item, created_at)
+        VALUES ('delete', old.id, json_object('id', old.id), {NOW});
+    END
+    """,
+]
+
+# Most log rows read per query (replay and pump)
+READ_BATCH= 500
+
+# Log rows kept per database file (0 = never delete any)
+CHANGES_RETAIN= int(os.getenv("ITEMS_CHANGES_RETAIN", "100000"))
+
+
+def create_change_log(engine):
+    """Creates the triggers that fill item_changes (the table itself comes from models2)."""
+    with engine.begin() as conn:
+        for ddl in CHANGE_LOG_DDL:
+            conn.execute(text(ddl))
+
+
+def read_changes(engine, since: int, limit: int=READ_BATCH):
+    """Log rows with seq > since, oldest first, as event dicts."""
+    query= (
+        select(ItemChange.seq, ItemChange.op, ItemChange.item_id, ItemChange.item, ItemChange.created_at)
+        .where(ItemChange.seq>since)
+        .order_by(ItemChange.seq)
+        .limit(limit)
+    )
+    with engine.connect() as conn:
+        return [
+            {"seq": seq, "op": op, "item_id": item_id, "item": json.loads(item), "at": at}
+            for seq, op, item_id, item, at in conn.execute(query)
+        ]
+
+
+def latest_seq(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.coalesce(func.max(ItemChange.seq), 0))).scalar()
+
+
+def oldest_seq(engine):
+    """seq of the oldest row still in the log, or None if it's empty."""
+    with engine.connect() as conn:
+        return conn.execute(select(func.min(ItemChange.seq))).scalar()
+
+
+class ChangeLogPruner:
+    """
+    Commit listener for a WriteQueue that keeps the newest `keep` log rows.
+    After a commit it looks up the newest seq (one indexed MAX) and only deletes
+    once more than keep/10 rows are due, so the DELETE runs once every few
+    thousand changes, not after every batch. Runs on the writer thread, so it
+    never competes with that file's writes for the lock.
+    - engine: Engine of the file whose log is pruned
+    - keep: Rows kept (0 = disabled)
+    """
+
+    def __init__(self, engine, keep: int=CHANGES_RETAIN):
+        self.engine= engine
+        self.keep= keep
+        self.chunk= max(keep//10, 1)
+        self.pruned_upto= 0
+        self.deleted= 0
+
+    def __call__(self):
+        if self.keep<=0:
+            return
+        cutoff= latest_seq(self.engine)-self.keep
+        if cutoff-self.pruned_upto<self.chunk:
+            return
+        with self.engine.begin() as conn:
+            self.deleted+= conn.execute(delete(ItemChange).where(ItemChange.seq<=cutoff)).rowcount
+        self.pruned_upto= cutoff
+
+
+def format_sse(event: dict, event_id=None):
+    """One Server-Sent Events message; the id lets the browser resume with Last-Event-ID."""
+    event_id= event["seq"] if event_id is None else event_id
+    return f"id: {event_id}\nevent: {event['op']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscriber:
+    """One connected client: a bounded queue of events, or None once it has lagged."""
+
+    def __init__(self, buffer_size: int):
+        self.queue= asyncio.Queue(maxsize=buffer_size)
+
+
+class ChangeHub:
+    """
+    Broadcasts new item_changes rows to all connected subscribers.
+    - engine: Engine to read the log from
+    - buffer_size: Events buffered per subscriber before it counts as lagging
+    - shard: Index put on every event as "shard"
+    """
+
+    def __init__(self, engine, buffer_size: int=1000, shard: int=0):
+        self.engine= engine
+        self.buffer_size= buffer_size
+        self.shard= shard
+        self.subscribers= set()
+        self.last_seq= 0
+        self.dropped= 0
+        self._loop= None
+        self._wake= None
+        self._pump_task= None
+
+    async def subscribe(self, subscriber: Subscriber=None):
+        """Registers a subscriber, new or shared with other hubs (starting the pump on first use)."""
+        if self._pump_task is None:
+            self._loop= asyncio.get_running_loop()
+            self._wake= asyncio.Event()
+            self.last_seq= await run_in_threadpool(latest_seq, self.engine)
+            self._pump_task= self._loop.create_task(self._pump())
+        if subscriber is None:
+            subscriber= Subscriber(self.buffer_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def notify(self):
+        """Called from the writer thread after a commit: wake the pump."""
+        if self._loop is not None and self.subscribers:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _pump(self):
+        """Reads new log rows after each notify() and fans them out."""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                while True:
+                    events= await run_in_threadpool(read_changes, self.engine, self.last_seq)
+                    if not events:
+                        break
+                    for event in events:
+                        event["shard"]= self.shard
+                    self.last_seq= events[-1]["seq"]
+                    self._fanout(events)
+            except Exception:
+                await asyncio.sleep(1)  # e.g. database briefly locked: retry on the next wake-up
+                self._wake.set()
+
+    def _fanout(self, events):
+        for subscriber in list(self.subscribers):
+            for event in events:
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Too slow: drop what it has buffered and tell it to resume from the log
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(None)
+                    self.subscribers.discard(subscriber)
+                    self.dropped+= 1
+                    break
+
+    def stats(self):
+        return {"subscribers": len(self.subscribers), "last_seq": self.last_seq, "dropped": self.dropped}
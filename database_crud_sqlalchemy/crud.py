@@ -1,119 +1,659 @@
 ### Implements CRUD (Create, Read, Update, Delete) APIs for items
-# Related files: db2.py (database), models2.py (ORM models)
+# Related files: db2.py (database), models2.py (ORM models), schemas2.py (Pydantic schemas),
+#                cache.py (item cache), writes.py (write operations), etags.py (conditional requests),
+#                search.py (FTS5 name search), export.py (streaming export), stats.py (aggregates),
+#                idempotency.py (Idempotency-Key store), changes.py (change feed), crud_async.py (async versions of the CRUD endpoints),
+#                sharding.py (routes every read/write to the shard file that holds the item),
+#                config_environment/sql_profiler.py (query count / DB time per request, GET /debug/sql)
 
-from fastapi import FastAPI
-from pydantic import BaseModel
-from db2 import engine,SessionLocal
-from models2 import Base, Item
+import asyncio
+import base64
+import heapq
+import json
+import os
+from operator import itemgetter
+from typing import Optional, Union
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from db2 import DB_MODE
+from models2 import Item
+from schemas2 import ItemSchema, ItemPatch, ItemDeleteFilter, ITEM_COLUMNS, row_to_dict, item_response
+from schemas2 import ItemOut, ItemPage, ItemList, ItemStats, BulkDeleteResult, Message, ErrorMessage
+from cache import item_cache
+from writes import STALE
+from etags import make_etag, none_match, if_match_versions
+from search import search_items_ranked, search_stats, rerank
+import export
+from stats import STATS_FIELDS, read_stats
+from changes import ChangeHub, ChangeLogPruner, Subscriber, format_sse, read_changes, oldest_seq
+from idempotency import idempotency_store, request_fingerprint, PROCEED, REPLAY, MISMATCH
+import sharding
+from sharding import shards, fan_out
+# config_environment is importable once db2 has put the repo root on sys.path
+from config_environment import engine_factory, sql_profiler
+from middleware.single_flight import SingleFlightMiddleware
 
 
 # FastAPI app instance
 app= FastAPI()
 
-# Create database tables if they don't exist
-Base.metadata.create_all(bind=engine)
+# With SQL_PROFILE_SAMPLE_RATE > 0: query count and DB time of each request in the
+# Server-Timing / X-DB-Queries response headers; recent requests and slow queries
+# at GET /debug/sql (with an X-Profile token). Every shard's engines (and the shard
+# directory) get the hooks.
+# Writes run on the write_queue thread, so their statements aren't counted.
+sql_profiler.install(app, sharding.directory_engine,
+                     *[engine for shard in shards for engine in (shard.engine, shard.async_engine)])
+
+# Connection pool of every engine (each shard's sync/async engine, the directory,
+# the idempotency store) at GET /debug/pool, with the same token as GET /debug/sql
+app.include_router(engine_factory.router)
+
+# Identical GET /items/{id} requests arriving while one is already running wait for
+# it and get a copy of its response (middleware/single_flight.py), so a spike of
+# clients asking for the same uncached item costs one query.
+# Requests with different credentials or If-None-Match headers never share.
+app.add_middleware(SingleFlightMiddleware, routes=["GET /items/{item_id:int}"])
+
+# The four basic CRUD endpoints are registered on this router instead of on app.
+# At the bottom of the file either this router or the async one from crud_async.py
+# is included, depending on DB_MODE.
+router= APIRouter()
+
+# On every shard (just items.db unless ITEMS_SHARDS > 1), create if they don't exist:
+# the tables, the FTS5 index for GET /items/search, the summary row for
+# GET /items/stats and the change log triggers for GET /items/changes.
+# Skipped when the shard's schema_version row already matches this schema
+# (config_environment/schema_check.py); then startup costs one SELECT per shard.
+for shard in shards:
+    sharding.ensure_shard_schema(shard.engine)
+
+# Broadcast hubs for the change feed (one per shard), woken up after every committed write batch.
+# Each shard's writer also trims its change log to the last ITEMS_CHANGES_RETAIN rows.
+CHANGES_BUFFER= int(os.getenv("ITEMS_CHANGES_BUFFER", "1000"))
+change_hubs= [ChangeHub(shard.engine, buffer_size=CHANGES_BUFFER, shard=shard.index) for shard in shards]
+for shard, hub in zip(shards, change_hubs):
+    shard.write_queue.commit_listeners.append(hub.notify)
+    shard.write_queue.commit_listeners.append(ChangeLogPruner(shard.engine))
 
 
 # -------------------------------
-# Pydantic Schema for Item
+# POST Endpoint: Create Item
 # -------------------------------
-class ItemSchema(BaseModel):
+def insert_item(item: ItemSchema):
+    """
+    Inserts one item and returns (status_code, body).
+    Steps:
+    1. Build an INSERT ... RETURNING operation
+    2. Hand it to the shard's write queue, which commits it together with other queued writes
+       (with several shards the name is reserved in the directory first)
+    3. Wait for the commit; a duplicate name becomes a 409 instead of a 500
     """
-    Defines the data structure for incoming requests for creating/updating items.
-    Attributes:
-        name: Name of the item
-        quantity: Number of items
-        price: Price of the item
+    try:
+        created= sharding.submit_insert(item.model_dump()).result()
+    except IntegrityError:
+        return 409, {"detail": f"An item named '{item.name}' already exists"}
+    item_cache.invalidate(created["id"])  # the id may have been cached as "not found"
+    return 200, created
+
+
+@router.post("/items/", response_model=ItemOut)
+def create_item(item:ItemSchema, idempotency_key: Optional[str]= Header(None)):
+    """
+    Adds a new item to the database.
+    With an Idempotency-Key header, retries are safe:
+    1. First request with the key: insert as usual and remember the response
+    2. Repeat with the same key and body: replay the remembered response
+       (if the first one is still running, wait for it rather than inserting twice)
+    3. Same key with a different body: 422
     """
-    name: str
-    quantity: int
-    price: float
+    if not idempotency_key:
+        return item_response(*insert_item(item))
 
+    fingerprint= request_fingerprint(item.model_dump())
+    state, stored= idempotency_store.begin(idempotency_key, fingerprint)
+    if state==REPLAY:
+        return item_response(*stored, replayed=True)
+    if state==MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    if state!=PROCEED:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    try:
+        status_code, body= insert_item(item)
+    except Exception:
+        idempotency_store.abandon(idempotency_key)
+        raise
+    idempotency_store.complete(idempotency_key, fingerprint, status_code, body)
+    return item_response(status_code, body)
 
 
 # -------------------------------
-# POST Endpoint: Create Item
+# POST Endpoint: Bulk Create/Upsert Items
 # -------------------------------
-@app.post("/items/")
-def create_item(item:ItemSchema):
+# Number of rows written per transaction (one executemany per batch)
+BULK_BATCH_SIZE= 1000
+
+
+def upsert_batch(rows):
     """
-    Adds a new item to the database.
+    Writes one batch of validated rows in a single transaction per shard (via the write queues).
+    - rows: list of (index, ItemSchema) tuples
     Steps:
-    1. Create a session
-    2. Instantiate an Item ORM object
-    3. Add and commit the item
-    4. Refresh to get auto-generated fields (id)
-    5. Close session and return item
+    1. Look up which names already exist (those rows become "updated")
+    2. Run one executemany INSERT ... ON CONFLICT(name) DO UPDATE
+    3. Fetch the ids of all touched names
+    4. Return one result dict per row, in input order
+    """
+    existing, ids= sharding.upsert([item.model_dump() for _, item in rows])
+
+    results= []
+    for index, item in rows:
+        # A name repeated inside the same batch is an update after its first occurrence
+        status= "updated" if item.name in existing else "created"
+        existing.add(item.name)
+        results.append({"index": index, "name": item.name, "id": ids.get(item.name), "status": status})
+    return results
+
+
+def parse_bulk_row(index, raw):
+    """
+    Validates a single incoming record.
+    Returns (ItemSchema, None) on success or (None, error result dict) on failure.
     """
-    db= SessionLocal()
-    db_item= Item(name=item.name, quantity=item.quantity, price=item.price)
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    db.close()
-    return db_item
+    try:
+        data= json.loads(raw) if isinstance(raw, bytes) else raw
+        return ItemSchema.model_validate(data), None
+    except ValueError as e:
+        # ValidationError is a ValueError subclass, so bad JSON and bad fields land here
+        errors= e.errors(include_url=False) if isinstance(e, ValidationError) else [{"msg": str(e)}]
+        return None, {"index": index, "status": "error", "errors": errors}
+
+
+async def iter_bulk_records(request: Request):
+    """
+    Yields raw records from the request body.
+    - application/x-ndjson (or jsonl): one JSON object per line, read as a stream
+    - anything else: a single JSON array
+    """
+    content_type= request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        buffer= b""
+        async for chunk in request.stream():
+            buffer+= chunk
+            *lines, buffer= buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+
+    try:
+        records= json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON stream")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON stream")
+    for record in records:
+        yield record
+
+
+@app.post("/items/bulk")
+async def bulk_upsert_items(request: Request):
+    """
+    Creates or updates many items at once (upsert on the unique name).
+    Accepts a JSON array or an NDJSON stream of ItemSchema records.
+    Steps:
+    1. Validate each record; invalid ones are reported, not fatal
+    2. Collect valid rows into batches of BULK_BATCH_SIZE
+    3. Write each batch in one transaction (in the threadpool)
+    4. Return counts plus a per-row result list
+    """
+    results= []
+    batch= []
+    index= 0
+    async for raw in iter_bulk_records(request):
+        item, error= parse_bulk_row(index, raw)
+        if error:
+            results.append(error)
+        else:
+            batch.append((index, item))
+        index+= 1
+        if len(batch)>=BULK_BATCH_SIZE:
+            results.extend(await run_in_threadpool(upsert_batch, batch))
+            batch= []
+    if batch:
+        results.extend(await run_in_threadpool(upsert_batch, batch))
+    item_cache.invalidate(*(r["id"] for r in results if r.get("id") is not None))
+
+    results.sort(key=lambda r: r["index"])
+    summary= {"created": 0, "updated": 0, "error": 0}
+    for r in results:
+        summary[r["status"]]+= 1
+    return {"created": summary["created"], "updated": summary["updated"], "failed": summary["error"], "results": results}
+
+
+# -------------------------------
+# GET Endpoint: List Items (Keyset Pagination)
+# -------------------------------
+# Page size used when the client doesn't ask for one, and the hard cap on what it may ask for
+DEFAULT_PAGE_SIZE= 50
+MAX_PAGE_SIZE= int(os.getenv("ITEMS_MAX_PAGE_SIZE", "500"))
+
+# Columns a client may page by; both are indexed (id is the primary key, name is unique)
+PAGE_KEYS= {"id": Item.id, "name": Item.name}
+
+
+def encode_cursor(order_by: str, value):
+    """Packs the sort key and the last value seen into an opaque URL-safe token."""
+    raw= json.dumps({"k": order_by, "v": value}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, order_by: str):
+    """Unpacks a token from encode_cursor; raises 400 if it is malformed or for another sort key."""
+    try:
+        padded= token + "=" * (-len(token) % 4)
+        data= json.loads(base64.urlsafe_b64decode(padded))
+        if data["k"]==order_by:
+            return data["v"]
+    except (ValueError, KeyError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/items/", response_model=ItemPage)
+def list_items(limit: int=DEFAULT_PAGE_SIZE, cursor: str=None, order_by: str="id"):
+    """
+    Lists items one page at a time using keyset (cursor) pagination.
+    Query Parameters:
+        limit: Page size, capped at MAX_PAGE_SIZE
+        cursor: The 'next' token from the previous page (omit for the first page)
+        order_by: 'id' or 'name'
+    Steps:
+    1. Decode the cursor into the last key seen
+    2. Select rows with key > last key, ordered by key, limit+1 rows
+    3. If the extra row came back there is another page: build its 'next' token
+    Unlike OFFSET, the index seek makes every page cost the same however deep you go.
+    With several shards, step 2 runs on all of them in parallel and the sorted
+    results are merged; the first limit+1 of the merge are the page.
+    Example URL: /items/?limit=20&cursor=eyJrIjoiaWQiLCJ2IjoyMH0
+    """
+    if order_by not in PAGE_KEYS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of {sorted(PAGE_KEYS)}")
+    limit= max(1, min(limit, MAX_PAGE_SIZE))
+    key= PAGE_KEYS[order_by]
+
+    # Plain columns, not ORM objects: no identity map, and each row becomes a dict directly
+    query= select(*ITEM_COLUMNS).order_by(key).limit(limit+1)
+    if cursor:
+        query= query.where(key > decode_cursor(cursor, order_by))
+
+    def read_page(shard):
+        with shard.engine.connect() as conn:
+            return [row_to_dict(row) for row in conn.execute(query)]
+
+    pages= fan_out(read_page)
+    if len(pages)==1:
+        items= pages[0]
+    else:
+        items= list(heapq.merge(*pages, key=itemgetter(order_by)))[:limit+1]
+
+    next_token= None
+    if len(items)>limit:
+        items= items[:limit]
+        next_token= encode_cursor(order_by, items[-1][order_by])
+    return {"items": items, "next": next_token}
+
+
+# -------------------------------
+# GET Endpoint: Search Items by Name
+# -------------------------------
+MAX_SEARCH_RESULTS= 100
+
+@app.get("/items/search", response_model=ItemList)
+def search(q: str, limit: int=20):
+    """
+    Type-ahead / full-text search over item names (SQLite FTS5).
+    Query Parameters:
+        q: Search text; every word is matched as a prefix ("red sh" finds "Red Shoes")
+        limit: Maximum number of results, capped at MAX_SEARCH_RESULTS
+    Results are ranked best match first by bm25. With several shards, each shard's
+    top `limit` is scored again over the counts of all shards (search.rerank), so
+    the order is the one a single items.db would give.
+    Example URL: /items/search?q=red%20sh&limit=10
+    """
+    limit= max(1, min(limit, MAX_SEARCH_RESULTS))
+    if not sharding.SHARDED:
+        with shards[0].SessionLocal() as db:
+            return {"items": [item for _, item in search_items_ranked(db, q, limit)]}
+
+    def search_shard(shard):
+        with shard.SessionLocal() as db:
+            return search_items_ranked(db, q, limit), search_stats(db, q)
+
+    results= fan_out(search_shard)
+    candidates= [item for ranked, _ in results for _, item in ranked]
+    return {"items": rerank(q, candidates, [stats for _, stats in results], limit)}
+
+
+# -------------------------------
+# GET Endpoint: Export All Items
+# -------------------------------
+@app.get("/items/export")
+def export_items(format: str="csv"):
+    """
+    Streams the whole items table as a download.
+    Query Parameters:
+        format: 'csv', 'ndjson' or 'arrow' (Arrow IPC stream, needs pyarrow)
+    Rows are read and sent in fixed-size chunks, so the response starts
+    immediately and memory use doesn't grow with the table.
+    Example URL: /items/export?format=ndjson
+    """
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(export.EXPORT_FORMATS)}")
+    if format=="arrow" and export.pyarrow is None:
+        raise HTTPException(status_code=400, detail="Arrow export needs pyarrow (pip install pyarrow)")
+    media_type, extension= export.EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export.EXPORTERS[format](),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{extension}"'},
+    )
+
+
+# -------------------------------
+# GET Endpoint: Inventory Stats
+# -------------------------------
+@app.get("/items/stats", response_model=ItemStats)
+def get_stats():
+    """
+    Returns item count, total quantity, total stock value (price * quantity)
+    and the number of low-stock items.
+    Reads the precomputed item_stats row (kept current by triggers), so the
+    cost doesn't depend on the size of the table.
+    Run `python stats.py check` / `python stats.py rebuild` to verify or repair it.
+    With several shards each one has its own row; they are read in parallel and summed.
+    """
+    def read_shard(shard):
+        with shard.engine.connect() as conn:
+            return read_stats(conn)
+
+    rows= fan_out(read_shard)
+    if len(rows)==1:
+        return rows[0]
+    total= dict(rows[0])
+    for row in rows[1:]:
+        for field in STATS_FIELDS:
+            total[field]+= row[field]
+    return total
+
+
+# -------------------------------
+# GET Endpoint: Change Feed (Server-Sent Events)
+# -------------------------------
+# Seconds between keep-alive comments on an idle stream
+SSE_HEARTBEAT= 15
+
+
+def format_position(position: list):
+    """SSE id for a position in every shard's change log: "42" with one shard, "12.0.7" with three."""
+    return ".".join(str(seq) for seq in position)
+
+
+def parse_position(token: str):
+    """
+    Inverse of format_position; None if the token isn't one (or is for another shard count).
+    A single number applies to every shard, so ?since=0 replays all logs from the start.
+    """
+    parts= token.split(".")
+    if len(parts)==1:
+        parts= parts*len(shards)
+    if len(parts)!=len(shards) or not all(part.isdigit() for part in parts):
+        return None
+    return [int(part) for part in parts]
+
+
+def lagged_event(position: list, expired: bool=False):
+    """
+    The 'lagged' marker. Its id makes a reconnecting EventSource resume at position
+    (right after the last event it got, or at the oldest kept row if expired).
+    """
+    last_id= format_position(position)
+    data= {"last_seq": position[0] if len(position)==1 else last_id}
+    if expired:
+        data["expired"]= True
+    return f"id: {last_id}\nevent: lagged\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_changes(since: Optional[list]):
+    """
+    Generator behind GET /items/changes.
+    Steps:
+    1. Subscribe to every shard's hub first, so nothing committed from now on can be missed
+    2. If resuming, replay each shard's item_changes rows after its position in `since`;
+       if a shard's log was pruned past that position, send a 'lagged' event with
+       "expired": true instead and end the stream (the events in between are gone,
+       the client reloads the items and resumes from the oldest kept row)
+    3. Then forward live events, skipping any already sent during the replay
+    4. If a hub dropped us for lagging, send a 'lagged' event and end the
+       stream; the client reconnects with Last-Event-ID and catches up
+    """
+    subscriber= Subscriber(CHANGES_BUFFER)
+    for hub in change_hubs:
+        await hub.subscribe(subscriber)
+    try:
+        # Live-only clients start at whatever the hubs have already broadcast
+        position= list(since) if since is not None else [hub.last_seq for hub in change_hubs]
+        if since is not None:
+            expired= False
+            for shard in shards:
+                oldest= await run_in_threadpool(oldest_seq, shard.engine)
+                if oldest is not None and position[shard.index]<oldest-1:
+                    position[shard.index]= oldest-1
+                    expired= True
+            if expired:
+                yield lagged_event(position, expired=True)
+                return
+            for shard in shards:
+                while True:
+                    events= await run_in_threadpool(read_changes, shard.engine, position[shard.index])
+                    if not events:
+                        break
+                    for event in events:
+                        event["shard"]= shard.index
+                        position[shard.index]= event["seq"]
+                        yield format_sse(event, format_position(position))
+
+        while True:
+            try:
+                event= await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                yield lagged_event(position)
+                return
+            if event["seq"]<=position[event["shard"]]:
+                continue
+            position[event["shard"]]= event["seq"]
+            yield format_sse(event, format_position(position))
+    finally:
+        for hub in change_hubs:
+            hub.unsubscribe(subscriber)
+
+
+@app.get("/items/changes")
+async def item_changes(since: Optional[str]=None, last_event_id: Optional[str]= Header(None)):
+    """
+    Streams item create/update/delete events as Server-Sent Events.
+    Query Parameters:
+        since: Resume after this event id (the browser sends the
+               Last-Event-ID header automatically when it reconnects)
+    Each event looks like:
+        id: 42
+        event: update
+        data: {"seq": 42, "op": "update", "item_id": 7, "item": {...}, "at": 1700000000.0, "shard": 0}
+    With several shards the id lists the position in every shard's log ("12.0.7").
+    Only the last ITEMS_CHANGES_RETAIN changes are kept: resuming from further back
+    gives just a 'lagged' event with "expired": true.
+    Example: curl -N http://127.0.0.1:8000/items/changes?since=0
+    """
+    position= parse_position(last_event_id) if last_event_id else None
+    if position is None and since is not None:
+        position= parse_position(since)
+        if position is None:
+            raise HTTPException(status_code=400, detail="since must be an event id from this feed")
+    return StreamingResponse(
+        stream_changes(position),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # -------------------------------
 # GET Endpoint: Read Item by ID
 # -------------------------------
-@app.get("/items/{item_id}")
-def get_item(item_id: int):
+def load_item(item_id: int):
+    """Loads one item from the database as a dict, or None if it doesn't exist."""
+    with sharding.shard_for(item_id).engine.connect() as conn:
+        row= conn.execute(select(*ITEM_COLUMNS).where(Item.id==item_id)).first()
+    return row_to_dict(row) if row else None
+
+
+@app.get("/items/cache/stats")
+def get_item_cache_stats():
+    """Returns hit/miss counters for the get_item cache."""
+    return item_cache.stats()
+
+
+@router.get("/items/{item_id}", response_model=Union[ItemOut, ErrorMessage])
+def get_item(item_id: int, response: Response, if_none_match: Optional[str]= Header(None)):
     """
     Fetches a single item by its ID.
+    Reads through item_cache, so repeated reads of hot items skip the database.
+    Sends an ETag; if the client's If-None-Match already has it, answers
+    304 Not Modified with an empty body instead of the item.
     Returns an error message if not found.
     """
-    db= SessionLocal()
-    item= db.query(Item).filter(Item.id==item_id).first()
-    db.close()
+    item= item_cache.get_or_load(item_id, load_item)
     if not item:
         return {"error": "Item not found!!"}
+    etag= make_etag(item)
+    if if_none_match and none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"]= etag
     return item
 
 
 # -------------------------------
 # PUT Endpoint: Update Item
 # -------------------------------
-@app.put("/items/{item_id}")
-def update_item(item_id: int, item: ItemSchema):
+@router.put("/items/{item_id}", response_model=Union[ItemOut, ErrorMessage])
+def update_item(item_id: int, item: ItemSchema, response: Response, if_match: Optional[str]= Header(None)):
     """
     Updates an existing item.
-    Steps:
-    1. Query the item by ID
-    2. If not found, return error
-    3. Update fields
-    4. Commit changes
-    5. Refresh and return updated item
-    """
-    db=SessionLocal()
-    db_item= db.query(Item).filter(Item.id==item_id).first()
-    if not db_item:
-        db.close()
+    Runs a single UPDATE ... RETURNING through the shard's write queue, so there is no
+    SELECT-then-modify round trip. If no row matched, returns an error.
+    With an If-Match header the update only applies to that version of the
+    item; if someone else changed it first, fails with 412 instead of overwriting.
+    Renaming it to a name another item already has is a 409, like in create_item.
+    """
+    try:
+        updated= sharding.submit_update(item_id, item.model_dump(), if_match_versions(if_match, item_id)).result()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"An item named '{item.name}' already exists")
+    if updated is STALE:
+        raise HTTPException(status_code=412, detail="Item was modified by someone else; fetch it again")
+    if not updated:
         return {"error": "Item not found!!"}
-    db_item.name= item.name
-    db_item.quantity= item.quantity
-    db_item.price= item.price
-    db.commit()
-    db.refresh(db_item)
-    db.close()
-    return db_item
+    item_cache.invalidate(item_id)
+    response.headers["ETag"]= make_etag(updated)
+    return updated
 
 
 # -------------------------------
 # DELETE Endpoint: Delete Item
 # -------------------------------
-@app.delete("/items/{item_id}")
-def delete_item(item_id: int):
+@router.delete("/items/{item_id}", response_model=Union[Message, ErrorMessage])
+def delete_item(item_id: int, if_match: Optional[str]= Header(None)):
     """
-    Deletes an item by ID.
+    Deletes an item by ID with a single DELETE ... RETURNING (through the shard's write queue).
+    Supports If-Match like update_item (412 if the item changed since it was read).
     Returns an error message if the item is not found.
     """
-    db= SessionLocal()
-    db_item= db.query(Item).filter(Item.id==item_id).first()
-    if not db_item:
-        db.close()
+    deleted= sharding.submit_delete(item_id, if_match_versions(if_match, item_id)).result()
+    if deleted is STALE:
+        raise HTTPException(status_code=412, detail="Item was modified by someone else; fetch it again")
+    if not deleted:
         return {"error": "Item not found!!"}
-    db.delete(db_item)
-    db.commit()
-    db.close()
+    item_cache.invalidate(item_id)
     return {"message": "Item deleted sucessfully!!"}
+
+
+# -------------------------------
+# PATCH Endpoint: Partial Update
+# -------------------------------
+@app.patch("/items/{item_id}", response_model=Union[ItemOut, ErrorMessage])
+def patch_item(item_id: int, item: ItemPatch, response: Response, if_match: Optional[str]= Header(None)):
+    """
+    Updates only the fields present in the request body.
+    Supports If-Match like update_item (and a 409 for a name that is taken).
+    Example body: {"quantity": 5}
+    """
+    values= item.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    try:
+        updated= sharding.submit_update(item_id, values, if_match_versions(if_match, item_id)).result()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"An item named '{values.get('name')}' already exists")
+    if updated is STALE:
+        raise HTTPException(status_code=412, detail="Item was modified by someone else; fetch it again")
+    if not updated:
+        return {"error": "Item not found!!"}
+    item_cache.invalidate(item_id)
+    response.headers["ETag"]= make_etag(updated)
+    return updated
+
+
+# -------------------------------
+# POST Endpoint: Bulk Delete
+# -------------------------------
+@app.post("/items/bulk-delete", response_model=BulkDeleteResult)
+def bulk_delete_items(filters: ItemDeleteFilter):
+    """
+    Deletes every item matching the filters in one DELETE statement (per shard).
+    At least one filter is required so an empty body can't wipe the table.
+    Example body: {"ids": [1, 2, 3]} or {"name_prefix": "test-", "max_quantity": 0}
+    """
+    conditions= []
+    if filters.ids is not None:
+        conditions.append(Item.id.in_(filters.ids))
+    if filters.name_prefix is not None:
+        conditions.append(Item.name.startswith(filters.name_prefix, autoescape=True))
+    if filters.max_quantity is not None:
+        conditions.append(Item.quantity<=filters.max_quantity)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+
+    deleted_ids= sharding.delete_many(*conditions)
+    item_cache.invalidate(*deleted_ids)
+    return {"deleted": len(deleted_ids), "ids": deleted_ids}
+
+
+# -------------------------------
+# Sync or Async CRUD Endpoints
+# -------------------------------
+# DB_MODE=sync  -> the def handlers above (blocking SQLite calls on the threadpool)
+# DB_MODE=async -> the async def handlers in crud_async.py (aiosqlite, no threadpool)
+if DB_MODE=="async":
+    from crud_async import router as crud_router
+else:
+    crud_router= router
+app.include_router(crud_router)
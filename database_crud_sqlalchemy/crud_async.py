@@ -0,0 +1,146 @@
+### Async versions of the four CRUD endpoints
+# Related files: crud.py (includes this router when ITEMS_DB_MODE=async), db2.py (async engine),
+#                sharding.py (which shard's sessions and writer an item id uses)
+
+# The handlers in crud.py are plain `def` functions: FastAPI runs each one on
+# Starlette's threadpool, and every blocking SQLite call holds a thread.
+# Here the handlers are `async def` and talk to SQLite through aiosqlite,
+# so waiting on the database doesn't tie up a thread.
+# Writes run on the same async engine (sharding.insert_async/update_async/
+# delete_async), one transaction each, instead of the sync write queue: no
+# group commit, but no writer thread or threadpool hop either. The write
+# queue's commit listeners (change feed, log pruning) still run after each one.
+
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models2 import Item
+from schemas2 import ItemSchema, ITEM_COLUMNS, row_to_dict, item_response, ItemOut, Message, ErrorMessage
+from cache import item_cache
+from writes import STALE
+import sharding
+from etags import make_etag, none_match, if_match_versions
+from idempotency import idempotency_store, request_fingerprint, PROCEED, REPLAY, MISMATCH
+
+
+router= APIRouter()
+
+
+# -------------------------------
+# Dependency: Get Async DB session
+# -------------------------------
+async def get_async_db(item_id: int):
+    """
+    Provide one AsyncSession per request, on the shard that holds item_id.
+    The session is closed when the response has been sent.
+    """
+    async with sharding.shard_for(item_id).AsyncSessionLocal() as db:
+        yield db
+
+
+# -------------------------------
+# POST Endpoint: Create Item
+# -------------------------------
+async def insert_item_async(item: ItemSchema):
+    """Async version of crud.insert_item: returns (status_code, body)."""
+    try:
+        created= await sharding.insert_async(item.model_dump())
+    except IntegrityError:
+        return 409, {"detail": f"An item named '{item.name}' already exists"}
+    item_cache.invalidate(created["id"])
+    return 200, created
+
+
+@router.post("/items/", response_model=ItemOut)
+async def create_item_async(item: ItemSchema, idempotency_key: Optional[str]= Header(None)):
+    """
+    Adds a new item to the database (async version of crud.create_item,
+    including Idempotency-Key handling).
+    """
+    if not idempotency_key:
+        return item_response(*await insert_item_async(item))
+
+    fingerprint= request_fingerprint(item.model_dump())
+    # begin() may block waiting for an in-flight duplicate, so keep it off the event loop
+    state, stored= await run_in_threadpool(idempotency_store.begin, idempotency_key, fingerprint)
+    if state==REPLAY:
+        return item_response(*stored, replayed=True)
+    if state==MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    if state!=PROCEED:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    try:
+        status_code, body= await insert_item_async(item)
+    except Exception:
+        idempotency_store.abandon(idempotency_key)
+        raise
+    # complete() writes the entry to SQLite when the store has a database
+    await run_in_threadpool(idempotency_store.complete, idempotency_key, fingerprint, status_code, body)
+    return item_response(status_code, body)
+
+
+# -------------------------------
+# GET Endpoint: Read Item by ID
+# -------------------------------
+@router.get("/items/{item_id}", response_model=Union[ItemOut, ErrorMessage])
+async def get_item_async(item_id: int, response: Response, if_none_match: Optional[str]= Header(None),
+                         db: AsyncSession= Depends(get_async_db)):
+    """
+    Fetches a single item by its ID (async version of crud.get_item).
+    Reads through the same item_cache as the sync handler.
+    """
+    async def load_item(key):
+        row= (await db.execute(select(*ITEM_COLUMNS).where(Item.id==key))).first()
+        return row_to_dict(row) if row else None
+
+    item= await item_cache.get_or_load_async(item_id, load_item)
+    if not item:
+        return {"error": "Item not found!!"}
+    etag= make_etag(item)
+    if if_none_match and none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"]= etag
+    return item
+
+
+# -------------------------------
+# PUT Endpoint: Update Item
+# -------------------------------
+@router.put("/items/{item_id}", response_model=Union[ItemOut, ErrorMessage])
+async def update_item_async(item_id: int, item: ItemSchema, response: Response,
+                            if_match: Optional[str]= Header(None)):
+    """
+    Updates an existing item (async version of crud.update_item, including the 409 for a taken name).
+    """
+    try:
+        updated= await sharding.update_async(item_id, item.model_dump(), if_match_versions(if_match, item_id))
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"An item named '{item.name}' already exists")
+    if updated is STALE:
+        raise HTTPException(status_code=412, detail="Item was modified by someone else; fetch it again")
+    if not updated:
+        return {"error": "Item not found!!"}
+    item_cache.invalidate(item_id)
+    response.headers["ETag"]= make_etag(updated)
+    return updated
+
+
+# -------------------------------
+# DELETE Endpoint: Delete Item
+# -------------------------------
+@router.delete("/items/{item_id}", response_model=Union[Message, ErrorMessage])
+async def delete_item_async(item_id: int, if_match: Optional[str]= Header(None)):
+    """
+    Deletes an item by ID (async version of crud.delete_item).
+    """
+    deleted= await sharding.delete_async(item_id, if_match_versions(if_match, item_id))
+    if deleted is STALE:
+        raise HTTPException(status_code=412, detail="Item was modified by someone else; fetch it again")
+    if not deleted:
+        return {"error": "Item not found!!"}
+    item_cache.invalidate(item_id)
+    return {"message": "Item deleted sucessfully!!"}
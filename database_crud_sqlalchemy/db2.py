@@ -1,21 +1,176 @@
 # Database configuration file for CRUD APIs
-# Related files: models2.py, crud.py
+# Related files: models2.py, crud.py, crud_async.py
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+# Async mode needs the aiosqlite driver and SQLAlchemy's asyncio extra:
+#   pip install aiosqlite "sqlalchemy[asyncio]"
 
-# SQLite database URL
-DATABASE_URL= "sqlite:///./items.db"
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from sqlalchemy.orm import declarative_base
 
+# The repo root holds config_environment/engine_factory.py (shared pooled engines)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_environment.engine_factory import create_db_engine, create_async_db_engine, create_session_factory
 
-# Create SQLAlchemy engine
-# check_same_thread=False is needed for SQLite when using multiple threads
-engine= create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite database URL (ITEMS_DATABASE_URL lets benchmarks point at a scratch file)
+DATABASE_URL= os.getenv("ITEMS_DATABASE_URL", "sqlite:///./items.db")
+
+# Same database, opened through the async aiosqlite driver
+ASYNC_DATABASE_URL= DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# Which implementation serves the CRUD endpoints: "sync" (threadpool) or "async" (event loop)
+DB_MODE= os.getenv("ITEMS_DB_MODE", "sync")
+
+
+# Create SQLAlchemy engine through the shared factory. Pool settings, check_same_thread=False
+# and the SQLite pragmas (WAL, synchronous=NORMAL, busy_timeout, page cache, temp_store)
+# come from config_environment.conf.Settings.
+engine= create_db_engine(DATABASE_URL)
 
 # Base class for our ORM models
 Base= declarative_base()
 
 # SessionLocal class to create session objects for DB operations
-# autocommit=False ensures we manually commit transactions
-# autoflush=False avoids automatic flush of pending changes until commit
-SessionLocal= sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# (the factory turns autoflush off: pending changes aren't flushed until commit)
+SessionLocal= create_session_factory(engine)
+
+
+# -------------------------------
+# Async Engine and Sessions
+# -------------------------------
+# Only built in async mode, so the sync app doesn't need aiosqlite/greenlet installed
+async_engine= None
+AsyncSessionLocal= None
+if DB_MODE=="async":
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine= create_async_db_engine(ASYNC_DATABASE_URL)
+
+    # expire_on_commit=False keeps attributes readable after commit without another await
+    AsyncSessionLocal= async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# -------------------------------
+# Group-Commit Write Queue
+# -------------------------------
+class WriteQueue:
+    """
+    Single-writer subsystem for SQLite.
+    Instead of every request opening its own write transaction (and fighting over
+    the database lock), requests submit write operations here. One dedicated
+    thread takes whatever has queued up, runs it in a single transaction and
+    commits once, so N concurrent writes cost one commit instead of N.
+
+    - session_factory: Creates the session the operations run in
+    - max_batch: Most operations applied in one transaction
+    - max_wait: Seconds to linger for more operations after the first one
+                (0 = only group what is already queued)
+
+    An operation is a function op(db) -> result. It must not commit; it may
+    flush (e.g. to get an autoincrement id). If an operation fails, the batch
+    is rolled back and every operation in it is retried in its own transaction,
+    so one bad write can't fail its neighbours.
+    """
+
+    def __init__(self, session_factory, max_batch: int=256, max_wait: float=0.0):
+        self.session_factory= session_factory
+        self.max_batch= max_batch
+        self.max_wait= max_wait
+        self._queue= queue.Queue()
+        self._thread= None
+        self._start_lock= threading.Lock()
+        self.batches= 0
+        self.operations= 0
+        # Functions called (with no arguments) on the writer thread after each batch commits
+        self.commit_listeners= []
+
+    def submit(self, op):
+        """Queues op and returns a concurrent.futures.Future resolved after its batch commits."""
+        self._ensure_started()
+        future= Future()
+        self._queue.put((op, future))
+        return future
+
+    def run(self, op):
+        """Queues op and blocks until its batch has committed; returns op's result or raises its error."""
+        return self.submit(op).result()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread= threading.Thread(target=self._worker, name="sqlite-writer", daemon=True)
+                    self._thread.start()
+
+    def _worker(self):
+        """Writer thread: take a batch off the queue, apply it, repeat."""
+        while True:
+            batch= [self._queue.get()]
+            while len(batch)<self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=self.max_wait) if self.max_wait else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(batch)
+            self.run_commit_listeners()
+
+    def run_commit_listeners(self):
+        """Calls every commit listener; also used after writes that bypass the queue (crud_async.py)."""
+        for listener in self.commit_listeners:
+            try:
+                listener()
+            except Exception:
+                pass  # a broken listener must never stop the writer
+
+    def _apply(self, batch):
+        """Runs a batch in one transaction, falling back to one transaction per op on failure."""
+        batch= [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batches+= 1
+        self.operations+= len(batch)
+
+        db= self.session_factory()
+        try:
+            results= [op(db) for op, _ in batch]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            db.close()
+            if len(batch)==1:
+                batch[0][1].set_exception(e)
+            else:
+                for op, future in batch:
+                    self._apply_one(op, future)
+            return
+        db.close()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _apply_one(self, op, future):
+        db= self.session_factory()
+        try:
+            result= op(db)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            db.close()
+
+    def stats(self):
+        """Number of committed batches and operations (operations/batches = average group size)."""
+        return {"batches": self.batches, "operations": self.operations, "queued": self._queue.qsize()}
+
+
+# Group-commit settings, shared by every writer (sharding.py builds one per shard)
+WRITE_BATCH= int(os.getenv("ITEMS_WRITE_BATCH", "256"))
+WRITE_WAIT= float(os.getenv("ITEMS_WRITE_WAIT", "0"))
+
+# Shared writer for items.db; every write endpoint goes through it
+write_queue= WriteQueue(SessionLocal, max_batch=WRITE_BATCH, max_wait=WRITE_WAIT)
@@ -0,0 +1,49 @@
+# ETag helpers for conditional requests on items
+# Related files: crud.py, crud_async.py, models2.py (Item.version)
+
+# An item's ETag is "<id>.<version>". Item.version goes up on every write, so
+# the tag changes exactly when the row does (a strong validator).
+#   GET    + If-None-Match -> 304 Not Modified when the client's copy is current
+#   PUT/PATCH/DELETE + If-Match -> 412 Precondition Failed when it isn't
+
+
+def make_etag(item: dict):
+    """Strong ETag for an item dict (as built by row_to_dict)."""
+    return f'"{item["id"]}.{item["version"]}"'
+
+
+def parse_etags(header: str):
+    """
+    Splits an If-Match / If-None-Match header into its entity tags.
+    Returns (tags, is_star); weak tags keep their W/ prefix.
+    """
+    tags= [tag.strip() for tag in header.split(",") if tag.strip()]
+    return tags, "*" in tags
+
+
+def none_match(header: str, etag: str):
+    """True if an If-None-Match header matches etag (weak comparison, per RFC 9110)."""
+    tags, is_star= parse_etags(header)
+    return is_star or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def if_match_versions(header: str, item_id: int):
+    """
+    Turns an If-Match header into the list of versions a write may apply to.
+    - None: no header, or "*" -> no version condition
+    - []  : none of the tags can match this item -> the write must fail with 412
+    Weak tags never match (If-Match uses strong comparison).
+    """
+    if not header:
+        return None
+    tags, is_star= parse_etags(header)
+    if is_star:
+        return None
+    versions= []
+    for tag in tags:
+        if tag.startswith("W/"):
+            continue
+        tag_id, _, version= tag.strip('"').partition(".")
+        if tag_id==str(item_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
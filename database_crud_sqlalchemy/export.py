@@ -0,0 +1,104 @@
+# Streaming export of the whole items table as CSV, NDJSON or Arrow
+# Related files: crud.py (GET /items/export), sharding.py (one items table per shard)
+
+# Arrow output needs pyarrow (optional):
+#   pip install pyarrow
+
+# Each exporter is a generator: it reads the table EXPORT_CHUNK_SIZE rows at a
+# time (yield_per -> the driver fetches in chunks, server-side cursor on
+# Postgres/MySQL) and yields one encoded chunk of bytes per batch. Plain column
+# tuples are selected, so no ORM objects are built. Memory use stays the same
+# whether the table has a thousand rows or a hundred million.
+# With several shards, each one is read the same way and the streams are
+# merged by id (heapq.merge), so the output is still in id order.
+
+import csv
+import heapq
+import io
+import json
+from itertools import chain, islice
+from sqlalchemy import select
+from sharding import shards
+from models2 import Item
+from schemas2 import ITEM_COLUMNS
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow export is optional
+    pyarrow= None
+
+
+EXPORT_CHUNK_SIZE= 5000
+EXPORT_FIELDS= [column.key for column in ITEM_COLUMNS]
+
+# format -> (media type, file extension)
+EXPORT_FORMATS= {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+def iter_shard_chunks(shard):
+    """Yields lists of row tuples from one shard, EXPORT_CHUNK_SIZE rows at a time, in id order."""
+    query= select(*ITEM_COLUMNS).order_by(Item.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    with shard.SessionLocal() as db:
+        for partition in db.execute(query).partitions():
+            yield partition
+
+
+def iter_row_chunks():
+    """Yields lists of row tuples, EXPORT_CHUNK_SIZE rows at a time, in id order across all shards."""
+    if len(shards)==1:
+        yield from iter_shard_chunks(shards[0])
+        return
+    rows= heapq.merge(*(chain.from_iterable(iter_shard_chunks(shard)) for shard in shards), key=lambda row: row[0])
+    while True:
+        chunk= list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_csv():
+    """CSV with a header line."""
+    buffer= io.StringIO()
+    writer= csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for rows in iter_row_chunks():
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # empty table: just the header
+
+
+def export_ndjson():
+    """One JSON object per line."""
+    for rows in iter_row_chunks():
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows).encode()
+
+
+def export_arrow():
+    """Arrow IPC stream: one record batch per chunk."""
+    schema= pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("name", pyarrow.string()),
+        ("quantity", pyarrow.int64()),
+        ("price", pyarrow.float64()),
+        ("version", pyarrow.int64()),
+    ])
+    sink= io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for rows in iter_row_chunks():
+            columns= list(zip(*rows))
+            writer.write_batch(pyarrow.record_batch([list(c) for c in columns], schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate(0)
+    yield sink.getvalue()  # schema (if the table was empty) and end-of-stream marker
+
+
+EXPORTERS= {"csv": export_csv, "ndjson": export_ndjson, "arrow": export_arrow}
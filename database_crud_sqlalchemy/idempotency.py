@@ -0,0 +1,183 @@
+# Idempotency-Key support for POST /items/
+# Related files: crud.py, crud_async.py
+
+# A client that retries a POST sends the same Idempotency-Key header each time.
+# The first request runs normally and its response is stored under that key;
+# later requests with the key get the stored response back without touching the
+# items table. If the first request is still running, a duplicate waits for it
+# instead of racing it into the unique constraint on Item.name.
+#
+# The store's lock only guards the in-memory dicts. SQLite is read and written
+# outside it, so a slow disk holds up requests for that one key, not for every
+# key: the request that claimed a key (its in-flight marker) does the lookup,
+# and its duplicates wait on the marker's Event meanwhile.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+# config_environment is importable once db2 has put the repo root on sys.path
+from config_environment.engine_factory import create_db_engine
+
+
+# Results of IdempotencyStore.begin()
+PROCEED= "proceed"      # first time we see this key: run the request, then call complete() or abandon()
+REPLAY= "replay"        # a stored response exists: send it back
+MISMATCH= "mismatch"    # the key was used before with a different request body
+IN_PROGRESS= "in_progress"  # the original is still running and didn't finish within wait_timeout
+
+
+def request_fingerprint(body: dict):
+    """Hash of the request body, so a key can't be reused for a different request."""
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+metadata= MetaData()
+
+# Table used when the store has SQLite backing (survives restarts; other workers can replay finished keys)
+idempotency_keys= Table(
+    "idempotency_keys", metadata,
+    Column("key", String, primary_key=True),
+    Column("fingerprint", String, nullable=False),
+    Column("status_code", Integer, nullable=False),
+    Column("body", Text, nullable=False),
+    Column("expires_at", Float, nullable=False, index=True),
+)
+
+
+class IdempotencyStore:
+    """
+    Bounded, TTL'd store of responses keyed by Idempotency-Key.
+    - max_size: Most keys kept in memory (least recently used is dropped first)
+    - ttl: Seconds a stored response can be replayed
+    - wait_timeout: Seconds a duplicate waits for an in-flight original
+    - database_url: Optional SQLite URL for a persistent copy of every entry
+    """
+
+    def __init__(self, max_size: int=10000, ttl: float=24*3600, wait_timeout: float=30.0, database_url: str=None):
+        self.max_size= max_size
+        self.ttl= ttl
+        self.wait_timeout= wait_timeout
+        self._entries= OrderedDict()  # key -> (expires_at, fingerprint, status_code, body)
+        self._inflight= {}            # key -> (fingerprint, threading.Event)
+        self._lock= threading.Lock()
+        self.engine= None
+        if database_url:
+            # Same pool settings and SQLite pragmas (WAL, busy_timeout...) as every other engine
+            self.engine= create_db_engine(database_url, name="idempotency")
+            metadata.create_all(self.engine)
+
+    def begin(self, key: str, fingerprint: str):
+        """
+        Called before running a request that carries an Idempotency-Key.
+        Returns (state, (status_code, body) or None) where state is one of
+        PROCEED, REPLAY, MISMATCH or IN_PROGRESS (see top of file).
+        Blocks while another request with the same key is in flight.
+        """
+        deadline= time.monotonic()+self.wait_timeout
+        while True:
+            with self._lock:
+                entry= self._get(key)
+                if entry:
+                    return self._answer(entry, fingerprint)
+                inflight= self._inflight.get(key)
+                if inflight is None:
+                    # Claim the key; duplicates now wait for us, also while SQLite is read below
+                    event= threading.Event()
+                    self._inflight[key]= (fingerprint, event)
+                    break
+                if inflight[0]!=fingerprint:
+                    return MISMATCH, None
+                event= inflight[1]
+            # Wait outside the lock; when the original finishes we loop and find its entry
+            remaining= deadline-time.monotonic()
+            if remaining<=0 or not event.wait(remaining):
+                return IN_PROGRESS, None
+
+        if self.engine is None:
+            return PROCEED, None
+        try:
+            entry= self._load(key)
+        except Exception:
+            self.abandon(key)
+            raise
+        if entry is None:
+            return PROCEED, None
+        # Finished earlier (maybe by another worker): remember it and let the duplicates replay it
+        with self._lock:
+            self._remember(key, entry)
+            self._inflight.pop(key)
+        event.set()
+        return self._answer(entry, fingerprint)
+
+    def complete(self, key: str, fingerprint: str, status_code: int, body):
+        """Stores the response of a PROCEED request and wakes up any waiting duplicates."""
+        entry= (time.time()+self.ttl, fingerprint, status_code, body)
+        with self._lock:
+            self._remember(key, entry)
+            _, event= self._inflight.pop(key)
+        event.set()
+        # Duplicates replay from memory from here on, so the write doesn't hold anyone up
+        if self.engine is not None:
+            self._persist(key, *entry)
+
+    def abandon(self, key: str):
+        """The PROCEED request failed unexpectedly: release the key so a retry can run it."""
+        with self._lock:
+            _, event= self._inflight.pop(key)
+        event.set()
+
+    def _answer(self, entry, fingerprint: str):
+        if entry[1]!=fingerprint:
+            return MISMATCH, None
+        return REPLAY, (entry[2], entry[3])
+
+    def _get(self, key: str):
+        """Looks a key up in memory; drops it if expired. Caller holds the lock."""
+        entry= self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0]<time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remember(self, key: str, entry):
+        """Puts an entry in memory, dropping the least recently used beyond max_size. Caller holds the lock."""
+        self._entries[key]= entry
+        self._entries.move_to_end(key)
+        while len(self._entries)>self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str):
+        """The unexpired SQLite row for key as an entry, or None. Called without the lock."""
+        with self.engine.connect() as conn:
+            row= conn.execute(select(
+                idempotency_keys.c.expires_at, idempotency_keys.c.fingerprint,
+                idempotency_keys.c.status_code, idempotency_keys.c.body,
+            ).where(idempotency_keys.c.key==key)).first()
+        if row is None or row[0]<time.time():
+            return None
+        return (row[0], row[1], row[2], json.loads(row[3]))
+
+    def _persist(self, key, expires_at, fingerprint, status_code, body):
+        """Writes an entry to SQLite and clears out expired rows. Called without the lock."""
+        values= {"key": key, "fingerprint": fingerprint, "status_code": status_code,
+                 "body": json.dumps(body), "expires_at": expires_at}
+        with self.engine.begin() as conn:
+            conn.execute(sqlite_insert(idempotency_keys).values(**values).on_conflict_do_nothing())
+            conn.execute(delete(idempotency_keys).where(idempotency_keys.c.expires_at<time.time()))
+
+
+# Shared store for POST /items/ (set IDEMPOTENCY_DATABASE_URL, e.g. sqlite:///./idempotency.db,
+# to keep finished keys across restarts and let other workers replay them)
+idempotency_store= IdempotencyStore(
+    max_size=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000")),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", str(24*3600))),
+    database_url=os.getenv("IDEMPOTENCY_DATABASE_URL"),
+)
@@ -0,0 +1,56 @@
+# Brings an items table created by an older version of models2.py up to date
+# Related files: models2.py (Item), sharding.py (create_schema runs it on every shard file)
+
+# create_all() only creates missing tables: it never changes one that exists, so
+# an items.db from before item versions (ETags) would keep working at startup
+# and then fail every SELECT/INSERT/UPDATE of items on the missing column.
+# upgrade_items_table() runs before create_all() and, only where needed:
+#   1. adds the version column (every existing item starts at version 1)
+#   2. rebuilds the table with AUTOINCREMENT, keeping every id, so the id of a
+#      deleted item is never handed out again (ETags are "<id>.<version>").
+#      Ids above the highest one left before the upgrade can't be known any more,
+#      so new ids start right after it.
+# Both checks are one PRAGMA / sqlite_master lookup, so on an up-to-date file it
+# costs next to nothing (and ensure_schema skips it entirely once the
+# schema_version fingerprint is stored).
+
+from sqlalchemy import text
+from models2 import Base, Item
+
+
+VERSION_COLUMN_DDL= "ALTER TABLE items ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+
+
+def upgrade_items_table(engine):
+    """
+    Adds what an existing items table is missing (see top of file); does nothing
+    if there is no items table yet. Returns the steps that ran.
+    The rebuild drops the triggers on items (search, stats, change log):
+    create_schema() creates them again right after, the FTS index and the stats
+    row stay valid because every row keeps its id and values.
+    """
+    steps= []
+    with engine.begin() as conn:
+        table_sql= conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name='items'")).scalar()
+        if table_sql is None:
+            return steps
+
+        columns= {row[1] for row in conn.execute(text("PRAGMA table_info(items)"))}
+        if "version" not in columns:
+            conn.execute(text(VERSION_COLUMN_DDL))
+            steps.append("add version column")
+
+        if "AUTOINCREMENT" not in table_sql.upper():
+            # The old indexes keep their names after the rename, so drop them first
+            # or create_all() couldn't create the new table's indexes
+            for index in Item.__table__.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+            conn.execute(text("ALTER TABLE items RENAME TO items_old"))
+            Base.metadata.create_all(bind=conn, tables=[Item.__table__])
+            conn.execute(text(
+                "INSERT INTO items (id, name, price, quantity, version) "
+                "SELECT id, name, price, quantity, version FROM items_old"
+            ))
+            conn.execute(text("DROP TABLE items_old"))
+            steps.append("rebuild with AUTOINCREMENT")
+    return steps
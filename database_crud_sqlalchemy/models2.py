@@ -1,7 +1,7 @@
 # Define ORM models for the database
 # Related files: db2.py, crud.py
 
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, Text
 from db2 import Base
 
 class Item(Base):
@@ -12,10 +12,58 @@ class Item(Base):
         name: Name of the item (string), must be unique
         price: Price of the item (float)
         quantity: Number of items in stock, default is 0
+        version: Incremented on every update; used for ETags and If-Match checks
     """
     __tablename__= "items"
+    # AUTOINCREMENT stops SQLite from reusing the id of a deleted row, so an
+    # ETag like "<id>.<version>" can never point at a different item later
+    __table_args__= {"sqlite_autoincrement": True}
 
     id= Column(Integer, primary_key=True, index=True)
     name= Column(String(50), unique=True, nullable=False, index=True)
     price= Column(Float, nullable=False)
     quantity= Column(Integer, default=0) # Default quantity to 0 if not provided
+    # Added later: migrations.py adds it (and AUTOINCREMENT) to an older items.db at startup
+    version= Column(Integer, nullable=False, default=1, server_default="1")
+
+
+class ItemStats(Base):
+    """
+    Single-row summary of the items table (always id=1), kept up to date by
+    triggers created in stats.py so reading it is O(1).
+    Attributes:
+        item_count: Number of items
+        total_quantity: Sum of quantity
+        total_value: Sum of price * quantity (stock value)
+        low_stock_count: Items with quantity <= low_stock_threshold
+        low_stock_threshold: Threshold used for low_stock_count
+    """
+    __tablename__= "item_stats"
+
+    id= Column(Integer, primary_key=True)
+    item_count= Column(Integer, nullable=False, default=0)
+    total_quantity= Column(Integer, nullable=False, default=0)
+    total_value= Column(Float, nullable=False, default=0.0)
+    low_stock_count= Column(Integer, nullable=False, default=0)
+    low_stock_threshold= Column(Integer, nullable=False, default=0)
+
+
+class ItemChange(Base):
+    """
+    Append-only log of every change to the items table, written by triggers
+    created in changes.py. Feeds GET /items/changes and lets clients resume.
+    Attributes:
+        seq: Ever-increasing sequence number (the SSE event id)
+        op: 'create', 'update' or 'delete'
+        item_id: Id of the changed item
+        item: JSON of the item after the change (only the id for deletes)
+        created_at: Unix time of the change
+    """
+    __tablename__= "item_changes"
+    __table_args__= {"sqlite_autoincrement": True}
+
+    seq= Column(Integer, primary_key=True)
+    op= Column(String(6), nullable=False)
+    item_id= Column(Integer, nullable=False)
+    item= Column(Text, nullable=False)
+    created_at= Column(Float, nullable=False)
@@ -0,0 +1,123 @@
+# Pydantic schemas and serialisation helpers for the CRUD APIs
+# Related files: crud.py, crud_async.py, models2.py, benchmark_serialization.py
+
+# Responses take the fast path:
+#   1. Handlers select plain columns (ITEM_COLUMNS) instead of ORM objects and turn
+#      each row into a dict with row_to_dict (a fixed dict literal, no reflection)
+#   2. Every JSON endpoint declares a response model below. With one, FastAPI
+#      validates and serialises the result to JSON bytes in pydantic's Rust core;
+#      without one it walks the value with jsonable_encoder and json.dumps in Python.
+# FastAPI's default response class is kept on purpose: setting a custom one
+# (e.g. ORJSONResponse) turns that direct-to-bytes path off.
+
+from typing import List, Optional
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from models2 import Item
+from etags import make_etag
+
+
+# -------------------------------
+# Pydantic Schema for Item
+# -------------------------------
+class ItemSchema(BaseModel):
+    """
+    Defines the data structure for incoming requests for creating/updating items.
+    Attributes:
+        name: Name of the item
+        quantity: Number of items
+        price: Price of the item
+    """
+    name: str
+    quantity: int
+    price: float
+
+
+class ItemPatch(BaseModel):
+    """
+    Body for PATCH /items/{item_id}: every field is optional and only the
+    fields actually sent are updated.
+    """
+    name: Optional[str]= None
+    quantity: Optional[int]= None
+    price: Optional[float]= None
+
+
+class ItemDeleteFilter(BaseModel):
+    """
+    Body for POST /items/bulk-delete. Conditions that are set are combined with AND.
+    Attributes:
+        ids: Delete only these ids
+        name_prefix: Delete items whose name starts with this
+        max_quantity: Delete items with quantity <= this
+    """
+    ids: Optional[List[int]]= None
+    name_prefix: Optional[str]= None
+    max_quantity: Optional[int]= None
+
+
+# -------------------------------
+# Response Models
+# -------------------------------
+class ItemOut(BaseModel):
+    """One item as returned by the API."""
+    id: int
+    name: str
+    quantity: int
+    price: float
+    version: int
+
+
+class ItemPage(BaseModel):
+    """A page of GET /items/; next is the cursor for the following page (None on the last one)."""
+    items: List[ItemOut]
+    next: Optional[str]= None
+
+
+class ItemList(BaseModel):
+    items: List[ItemOut]
+
+
+class ItemStats(BaseModel):
+    item_count: int
+    total_quantity: int
+    total_value: float
+    low_stock_count: int
+    low_stock_threshold: int
+
+
+class BulkDeleteResult(BaseModel):
+    deleted: int
+    ids: List[int]
+
+
+class Message(BaseModel):
+    message: str
+
+
+class ErrorMessage(BaseModel):
+    """The {"error": ...} body the item endpoints return when the id doesn't exist."""
+    error: str
+
+
+# Columns every item query selects (and every RETURNING clause returns), in row_to_dict's order
+ITEM_COLUMNS= (Item.id, Item.name, Item.quantity, Item.price, Item.version)
+
+
+def row_to_dict(row):
+    """
+    Turns a row of ITEM_COLUMNS into a plain dict (safe to cache and share between requests).
+    The serialiser for items: a fixed dict literal, with none of the attribute
+    walking jsonable_encoder does on an ORM object.
+    price goes through float() because SQLite's RETURNING can hand back a whole
+    REAL value (e.g. 2.0) as the integer 2.
+    """
+    return {"id": row[0], "name": row[1], "quantity": row[2], "price": float(row[3]), "version": row[4]}
+
+
+def item_response(status_code: int, body: dict, replayed: bool=False):
+    """JSON response for a create: carries the new item's ETag, and marks idempotent replays."""
+    headers= {"ETag": make_etag(body)} if status_code==200 else {}
+    if replayed:
+        headers["Idempotent-Replayed"]= "true"
+    return JSONResponse(body, status_code=status_code, headers=headers)
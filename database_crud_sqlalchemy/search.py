@@ -0,0 +1,191 @@
+# Full-text / prefix search over item names using SQLite FTS5
+# Related files: crud.py (GET /items/search), models2.py (items table)
+
+# items_fts is an "external content" FTS5 table: it stores only the search
+# index and reads the names themselves from the items table (content='items').
+# Triggers keep the index in sync with every INSERT/UPDATE/DELETE on items,
+# including the bulk upsert and bulk delete paths, inside the same transaction.
+# prefix='2 3' builds extra indexes so short type-ahead prefixes stay fast.
+#
+# Ranking across shards: FTS5's bm25 weighs every term by how rare it is in
+# *that* file (IDF) and every name by its length relative to *that* file's
+# average, so rank values from two shards aren't comparable. With several
+# shards, each one returns its own top `limit` together with its counts
+# (search_stats), and rerank() scores that union once with the bm25 formula
+# over the totals of all shards: the same ranking one items.db would give.
+# The candidates are still each shard's local top `limit`; with several words
+# an item just below one shard's cut could in theory beat the last result.
+
+import math
+import re
+import unicodedata
+from sqlalchemy import text
+from schemas2 import row_to_dict
+
+
+SEARCH_INDEX_DDL= [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts
+    USING fts5(name, content='items', content_rowid='id', tokenize='unicode61', prefix='2 3')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF name ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO items_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+]
+
+SEARCH_SQL= text("""
+    SELECT items.id, items.name, items.quantity, items.price, items.version, items_fts.rank
+    FROM items_fts JOIN items ON items.id = items_fts.rowid
+    WHERE items_fts MATCH :query
+    ORDER BY items_fts.rank
+    LIMIT :limit
+""")
+
+
+# FTS5's bm25() defaults
+BM25_K1= 1.2
+BM25_B= 0.75
+
+# Row 1 of the FTS5 data table is its "averages" record: varint row count, then
+# varint token count per column
+TOTALS_SQL= text("SELECT block FROM items_fts_data WHERE id=1")
+MATCH_COUNT_SQL= text("SELECT count(*) FROM items_fts WHERE items_fts MATCH :query")
+
+
+def create_search_index(engine):
+    """
+    Creates the FTS5 table and its triggers if they don't exist yet.
+    The first time, the index is built from the rows already in items.
+    """
+    with engine.begin() as conn:
+        exists= conn.execute(text("SELECT 1 FROM sqlite_master WHERE name='items_fts'")).first()
+        for ddl in SEARCH_INDEX_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text("INSERT INTO items_fts(items_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(q: str):
+    """
+    Turns user input into an FTS5 MATCH expression.
+    Every word becomes a quoted prefix term ("word"*) and the terms are ANDed,
+    so "red sh" finds "Red Shoes". Quoting keeps FTS5 syntax characters in the
+    input from being interpreted. Returns None if there are no words.
+    """
+    words= re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_items_ranked(db, q: str, limit: int):
+    """
+    Runs a ranked (bm25) search and returns (rank, item dict) pairs, best match
+    (lowest rank) first. The ranks only compare within one shard (see rerank).
+    """
+    query= build_match_query(q)
+    if query is None:
+        return []
+    rows= db.execute(SEARCH_SQL, {"query": query, "limit": limit}).all()
+    return [(row[5], row_to_dict(row)) for row in rows]
+
+
+def search_items(db, q: str, limit: int):
+    """Runs a ranked (bm25) search and returns item dicts, best match first."""
+    return [item for _, item in search_items_ranked(db, q, limit)]
+
+
+# -------------------------------
+# Ranking Across Shards
+# -------------------------------
+def _varint(data: bytes, pos: int):
+    """SQLite varint at data[pos] -> (value, position after it)."""
+    value= 0
+    for i in range(9):
+        byte= data[pos+i]
+        if i==8:
+            return (value<<8)|byte, pos+9
+        value= (value<<7)|(byte&0x7f)
+        if byte<0x80:
+            return value, pos+i+1
+
+
+def _fold(token: str):
+    """Case and diacritics folding like the unicode61 tokenizer."""
+    decomposed= unicodedata.normalize("NFKD", token.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _tokens(name: str):
+    """A name split into folded tokens like unicode61 (letters and digits; "_" separates)."""
+    return [_fold(token) for token in re.findall(r"[^\W_]+", name)]
+
+
+def search_stats(db, q: str):
+    """
+    One shard's counts for rerank(): (rows indexed, tokens indexed, {word: rows matching "word"*}).
+    One indexed lookup plus one count per word of q.
+    """
+    words= re.findall(r"\w+", q)
+    block= db.execute(TOTALS_SQL).scalar()
+    rows, tokens= 0, 0
+    if block:
+        rows, pos= _varint(block, 0)
+        tokens, _= _varint(block, pos)
+    matches= {word: db.execute(MATCH_COUNT_SQL, {"query": f'"{word}"*'}).scalar() for word in words}
+    return rows, tokens, matches
+
+
+def global_bm25(q: str, stats: list):
+    """
+    bm25 scorer over the totals of several shards -> function(item dict) -> rank
+    (negative like FTS5's, lower is better), or None if nothing is indexed.
+    - stats: search_stats() of every shard
+    """
+    words= re.findall(r"\w+", q)
+    rows= sum(stat[0] for stat in stats)
+    if not words or not rows:
+        return None
+    average_length= sum(stat[1] for stat in stats)/rows
+    weights= []
+    for word in words:
+        matching= sum(stat[2].get(word, 0) for stat in stats)
+        idf= math.log((rows-matching+0.5)/(matching+0.5))
+        weights.append((_fold(word), idf if idf>0 else 1e-6))  # FTS5 clamps the IDF the same way
+
+    def rank(item):
+        tokens= _tokens(item["name"])
+        norm= BM25_K1*(1-BM25_B+BM25_B*len(tokens)/average_length)
+        total= 0.0
+        for prefix, idf in weights:
+            hits= sum(1 for token in tokens if token.startswith(prefix))
+            total+= idf*hits*(BM25_K1+1)/(hits+norm)
+        return -total
+
+    return rank
+
+
+def rerank(q: str, candidates: list, stats: list, limit: int):
+    """
+    Orders the union of several shards' candidates by bm25 over all shards' totals.
+    - candidates: Item dicts from every shard
+    - stats: search_stats() of every shard
+    Returns the best `limit` item dicts.
+    """
+    rank= global_bm25(q, stats)
+    if rank is None:
+        return candidates[:limit]
+    return sorted(candidates, key=lambda item: (rank(item), item["id"]))[:limit]
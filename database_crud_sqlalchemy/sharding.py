@@ -0,0 +1,522 @@
+# Hash-sharded storage for items: N SQLite files instead of one
+# Related files: db2.py (engine, sessions and write queue for one file), crud.py, crud_async.py
+
+# Usage as a command (from this folder, with the app stopped):
+#   python sharding.py status                      -> rows per shard file
+#   python sharding.py rebalance --from 1 --to 4   -> move rows into the layout for a new shard count
+
+# ITEMS_SHARDS (default 1) sets the number of shards.
+# - 1: a single shard made of db2's engine, SessionLocal and write_queue on items.db,
+#      so nothing changes compared to running without sharding.
+# - N > 1: items_0.db ... items_{N-1}.db next to items.db. Each file has its own
+#      engine, session factory and group-commit writer, so N writers commit in
+#      parallel instead of queueing behind one database lock. A small directory
+#      database (items_directory.db) hands out globally unique ids and owns the
+#      name -> id mapping, which is what keeps names unique across shards.
+#
+# An item lives on shard crc32(id) % N. Reads and writes by id go to that shard
+# only; creates reserve the name in the directory first. Each shard keeps its own
+# FTS index, stats row and change log (the triggers are per file), and crud.py
+# merges them: list/search/stats query every shard in parallel, export does a
+# k-way merge by id.
+
+import argparse
+import os
+import sys
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from sqlalchemy import Column, Integer, MetaData, String, Table, delete, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import db2
+from db2 import DATABASE_URL, DB_MODE, WRITE_BATCH, WRITE_WAIT, WriteQueue
+from config_environment.engine_factory import create_db_engine, create_async_db_engine, create_session_factory
+from config_environment.schema_check import ensure_schema
+from models2 import Base, Item
+from schemas2 import ITEM_COLUMNS
+from writes import insert_op, update_op, delete_op, delete_many_op, upsert_op, STALE
+from search import create_search_index, SEARCH_INDEX_DDL
+from stats import create_stats_triggers, STATS_TRIGGERS_DDL, LOW_STOCK_THRESHOLD
+from changes import create_change_log, CHANGE_LOG_DDL
+from migrations import upgrade_items_table
+
+
+SHARD_COUNT= int(os.getenv("ITEMS_SHARDS", "1"))
+SHARDED= SHARD_COUNT>1
+
+
+def shard_index(item_id: int, count: int=SHARD_COUNT):
+    """Which shard an id lives on (stable across processes, unlike hash())."""
+    return zlib.crc32(str(item_id).encode()) % count
+
+
+def shard_url(index: int, count: int=SHARD_COUNT):
+    """Database URL of shard `index` in a layout of `count` shards; one shard is items.db itself."""
+    if count==1:
+        return DATABASE_URL
+    base, extension= os.path.splitext(DATABASE_URL)
+    return f"{base}_{index}{extension}"
+
+
+def open_engine(url: str):
+    """Engine with the same pool settings and pragmas as db2.engine."""
+    return create_db_engine(url)
+
+
+def create_schema(engine):
+    """
+    Tables plus the search, stats and change log triggers, on one shard file.
+    An items table from an older models2.py is upgraded first (migrations.py).
+    """
+    upgrade_items_table(engine)
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    create_stats_triggers(engine)
+    create_change_log(engine)
+
+
+def ensure_shard_schema(engine):
+    """
+    create_schema(), skipped when the file's schema_version row has the current fingerprint.
+    The trigger DDL and LOW_STOCK_THRESHOLD are part of the fingerprint, so changing
+    either runs create_schema() again (which rebuilds the stats row if needed).
+    """
+    return ensure_schema(engine, Base.metadata, name="items", create=create_schema,
+                         extra=SEARCH_INDEX_DDL+STATS_TRIGGERS_DDL+CHANGE_LOG_DDL+[f"low_stock_threshold={LOW_STOCK_THRESHOLD}"])
+
+
+class Shard:
+    """
+    One SQLite file holding part of the items table.
+    - index: Position in `shards`
+    - engine / SessionLocal: Sync access
+    - async_engine / AsyncSessionLocal: Async access (only in async mode)
+    - write_queue: This file's group-commit writer
+    """
+
+    def __init__(self, index: int, engine, session_factory, write_queue, async_session_factory=None, async_engine=None):
+        self.index= index
+        self.engine= engine
+        self.SessionLocal= session_factory
+        self.write_queue= write_queue
+        self.AsyncSessionLocal= async_session_factory
+        self.async_engine= async_engine
+        # Commit listeners after async writes: one background thread, one queued run at a time
+        self._listeners_pool= ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{index}-listeners")
+        self._listeners_lock= threading.Lock()
+        self._listeners_queued= False
+
+    def after_async_commit(self):
+        """
+        Runs write_queue's commit listeners (change feed, change log pruning) after a
+        write committed on the async engine. They may block on SQLite, so they run on
+        a background thread, and commits landing while a run is queued share that run.
+        """
+        with self._listeners_lock:
+            if self._listeners_queued:
+                return
+            self._listeners_queued= True
+        self._listeners_pool.submit(self._run_listeners)
+
+    def _run_listeners(self):
+        with self._listeners_lock:
+            self._listeners_queued= False
+        self.write_queue.run_commit_listeners()
+
+
+def open_shard(index: int):
+    """Builds engine, sessions and writer for shard `index` of SHARD_COUNT."""
+    url= shard_url(index)
+    engine= open_engine(url)
+    session_factory= create_session_factory(engine)
+    async_engine, async_session_factory= None, None
+    if DB_MODE=="async":
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        async_engine= create_async_db_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+        async_session_factory= async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    write_queue= WriteQueue(session_factory, max_batch=WRITE_BATCH, max_wait=WRITE_WAIT)
+    return Shard(index, engine, session_factory, write_queue, async_session_factory, async_engine)
+
+
+if SHARDED:
+    shards= [open_shard(index) for index in range(SHARD_COUNT)]
+else:
+    shards= [Shard(0, db2.engine, db2.SessionLocal, db2.write_queue, db2.AsyncSessionLocal, db2.async_engine)]
+
+
+def shard_for(item_id: int):
+    """The shard that stores item_id."""
+    return shards[shard_index(item_id)] if SHARDED else shards[0]
+
+
+# Reads that touch every shard run on this pool, one thread per shard
+_fan_out_pool= ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix="shard-read") if SHARDED else None
+
+
+def fan_out(fn):
+    """Calls fn(shard) for every shard in parallel; returns the results in shard order."""
+    if not SHARDED:
+        return [fn(shards[0])]
+    return list(_fan_out_pool.map(fn, shards))
+
+
+# -------------------------------
+# Name Directory (sharded mode only)
+# -------------------------------
+directory_metadata= MetaData()
+
+# AUTOINCREMENT: ids are never reused, same as Item.id in single-file mode
+item_directory= Table(
+    "item_directory", directory_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(50), nullable=False, unique=True),
+    sqlite_autoincrement=True,
+)
+
+
+def directory_url():
+    base, extension= os.path.splitext(DATABASE_URL)
+    return f"{base}_directory{extension}"
+
+
+def claim_op(name: str):
+    """Reserves a new name -> its id. IntegrityError if the name is taken."""
+    def op(db):
+        return db.execute(sqlite_insert(item_directory).values(name=name).returning(item_directory.c.id)).scalar()
+    return op
+
+
+def claim_many_op(names: list):
+    """Reserves every name not yet taken -> (names that already existed, {name: id} for all names)."""
+    def op(db):
+        existing= set(db.scalars(select(item_directory.c.name).where(item_directory.c.name.in_(names))))
+        new_names= [{"name": name} for name in dict.fromkeys(names) if name not in existing]
+        if new_names:
+            db.execute(sqlite_insert(item_directory).on_conflict_do_nothing(), new_names)
+        ids= dict(db.execute(select(item_directory.c.name, item_directory.c.id).where(item_directory.c.name.in_(names))).all())
+        return existing, ids
+    return op
+
+
+def rename_op(item_id: int, name: str):
+    """Points item_id at a new name -> the old name, or None if the id isn't known. IntegrityError if taken."""
+    def op(db):
+        old_name= db.scalar(select(item_directory.c.name).where(item_directory.c.id==item_id))
+        if old_name is not None and old_name!=name:
+            db.execute(update(item_directory).where(item_directory.c.id==item_id).values(name=name))
+        return old_name
+    return op
+
+
+def release_op(ids: list):
+    """Frees the names of deleted items."""
+    def op(db):
+        if ids:
+            db.execute(delete(item_directory).where(item_directory.c.id.in_(ids)))
+    return op
+
+
+directory_engine= None
+directory_queue= None
+directory_async_sessions= None
+if SHARDED:
+    directory_engine= open_engine(directory_url())
+    ensure_schema(directory_engine, directory_metadata, name="item_directory")
+    directory_queue= WriteQueue(create_session_factory(directory_engine),
+                                max_batch=WRITE_BATCH, max_wait=WRITE_WAIT)
+    if DB_MODE=="async":
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        directory_async_sessions= async_sessionmaker(
+            create_async_db_engine(directory_url().replace("sqlite://", "sqlite+aiosqlite://", 1)),
+            autoflush=False, expire_on_commit=False)
+
+
+# -------------------------------
+# Routed Writes
+# -------------------------------
+# Every function returns a concurrent.futures.Future, like WriteQueue.submit, so
+# crud.py can block on it and crud_async.py can await it. A write that needs the
+# directory is chained: the directory step's Future triggers the shard step from
+# a callback on the directory writer thread, so no thread sits waiting in between.
+
+def _then(future: Future, fn):
+    """Future of fn(result of future); fn may return a value or another Future to wait for."""
+    chained= Future()
+
+    def step(done):
+        try:
+            result= fn(done.result())
+        except Exception as e:
+            chained.set_exception(e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda f: _copy_result(f, chained))
+        else:
+            chained.set_result(result)
+
+    future.add_done_callback(step)
+    return chained
+
+
+def _copy_result(source: Future, target: Future):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def submit_insert(values: dict):
+    """Creates one item -> Future of the new item dict (IntegrityError for a duplicate name)."""
+    if not SHARDED:
+        return shards[0].write_queue.submit(insert_op(values))
+
+    def place(item_id):
+        inserted= shard_for(item_id).write_queue.submit(insert_op({**values, "id": item_id}))
+        inserted.add_done_callback(lambda f: f.exception() and directory_queue.submit(release_op([item_id])))
+        return inserted
+
+    return _then(directory_queue.submit(claim_op(values["name"])), place)
+
+
+def submit_update(item_id: int, values: dict, versions=None):
+    """update_op on the right shard -> Future of the item dict, None or STALE."""
+    shard= shard_for(item_id)
+    op= update_op(item_id, values, versions)
+    if not SHARDED or "name" not in values:
+        return shard.write_queue.submit(op)
+
+    # Renames take the new name in the directory first and give it back if the update doesn't happen
+    def apply(old_name):
+        if old_name is None:
+            return None
+
+        def undo(f):
+            if f.exception() is not None or f.result() is None or f.result() is STALE:
+                directory_queue.submit(rename_op(item_id, old_name))
+
+        updated= shard.write_queue.submit(op)
+        updated.add_done_callback(undo)
+        return updated
+
+    return _then(directory_queue.submit(rename_op(item_id, values["name"])), apply)
+
+
+def submit_delete(item_id: int, versions=None):
+    """delete_op on the right shard -> Future of True, False or STALE."""
+    deleted= shard_for(item_id).write_queue.submit(delete_op(item_id, versions))
+    if not SHARDED:
+        return deleted
+
+    # Free the name before answering, so an immediate re-create with it succeeds
+    def release(result):
+        if result is not True:
+            return result
+        return _then(directory_queue.submit(release_op([item_id])), lambda _: result)
+
+    return _then(deleted, release)
+
+
+# -------------------------------
+# Routed Async Writes
+# -------------------------------
+# The same operations as above, for crud_async.py: each one runs in its own
+# transaction on the async engine (AsyncSession.run_sync hands it a Session on
+# the aiosqlite connection), so no thread is held while SQLite works. There is
+# no group commit here; concurrent writers to one file queue on SQLite's lock
+# (busy_timeout). The directory steps and their undo are awaited in order.
+
+async def _write_async(session_factory, op):
+    """op(db) in one transaction on an async session -> op's result."""
+    async with session_factory() as db:
+        result= await db.run_sync(op)
+        await db.commit()
+    return result
+
+
+async def shard_write_async(shard: Shard, op):
+    """op(db) committed on the shard's async engine; then its commit listeners run."""
+    result= await _write_async(shard.AsyncSessionLocal, op)
+    shard.after_async_commit()
+    return result
+
+
+async def insert_async(values: dict):
+    """Async submit_insert -> the new item dict (IntegrityError for a duplicate name)."""
+    if not SHARDED:
+        return await shard_write_async(shards[0], insert_op(values))
+
+    item_id= await _write_async(directory_async_sessions, claim_op(values["name"]))
+    try:
+        return await shard_write_async(shard_for(item_id), insert_op({**values, "id": item_id}))
+    except Exception:
+        await _write_async(directory_async_sessions, release_op([item_id]))
+        raise
+
+
+async def update_async(item_id: int, values: dict, versions=None):
+    """Async submit_update -> the item dict, None or STALE."""
+    shard= shard_for(item_id)
+    op= update_op(item_id, values, versions)
+    if not SHARDED or "name" not in values:
+        return await shard_write_async(shard, op)
+
+    old_name= await _write_async(directory_async_sessions, rename_op(item_id, values["name"]))
+    if old_name is None:
+        return None
+    try:
+        updated= await shard_write_async(shard, op)
+    except Exception:
+        await _write_async(directory_async_sessions, rename_op(item_id, old_name))
+        raise
+    if updated is None or updated is STALE:
+        await _write_async(directory_async_sessions, rename_op(item_id, old_name))
+    return updated
+
+
+async def delete_async(item_id: int, versions=None):
+    """Async submit_delete -> True, False or STALE."""
+    deleted= await shard_write_async(shard_for(item_id), delete_op(item_id, versions))
+    if SHARDED and deleted is True:
+        await _write_async(directory_async_sessions, release_op([item_id]))
+    return deleted
+
+
+def delete_many(*conditions):
+    """delete_many_op on every shard (their writers run in parallel) -> list of deleted ids."""
+    futures= [shard.write_queue.submit(delete_many_op(*conditions)) for shard in shards]
+    ids= sorted(item_id for future in futures for item_id in future.result())
+    if SHARDED:
+        directory_queue.run(release_op(ids))
+    return ids
+
+
+def upsert(rows: list):
+    """
+    upsert_op split by shard -> (names that already existed, {name: id}).
+    Names are resolved to ids in the directory first, so a name always lands on
+    the shard that already holds it.
+    """
+    if not SHARDED:
+        return shards[0].write_queue.run(upsert_op(rows))
+
+    existing, ids= directory_queue.run(claim_many_op([row["name"] for row in rows]))
+    by_shard= {}
+    for row in rows:
+        by_shard.setdefault(shard_index(ids[row["name"]]), []).append({**row, "id": ids[row["name"]]})
+    futures= [(batch, shards[index].write_queue.submit(upsert_op(batch))) for index, batch in by_shard.items()]
+
+    error= None
+    for batch, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            # Names this batch reserved but never wrote must not stay taken
+            directory_queue.run(release_op([row["id"] for row in batch if row["name"] not in existing]))
+            error= error or e
+    if error:
+        raise error
+    return existing, ids
+
+
+# -------------------------------
+# Rebalance / Migration Tool
+# -------------------------------
+REBALANCE_CHUNK_SIZE= 1000
+
+
+def rebalance(old_count: int, new_count: int):
+    """
+    Moves every row from the layout for old_count shards to the layout for
+    new_count shards (1 = plain items.db). Rows that already sit in the right
+    file stay put. Each chunk is copied (INSERT OR REPLACE, keeping id and
+    version) and then deleted from its old file, so an interrupted run can
+    simply be started again. For new_count > 1 the name directory is rebuilt
+    from the rows as they are scanned (a row moved into a file that is scanned
+    later is seen twice; it is already in place then, so nothing happens).
+    Shard triggers see the moves as ordinary inserts/deletes: stats stay right,
+    and the change logs record a delete + create for every moved row.
+    Returns {"moved": n}.
+    """
+    targets= [open_engine(shard_url(index, new_count)) for index in range(new_count)]
+    for engine in targets:
+        create_schema(engine)
+    target_urls= [shard_url(index, new_count) for index in range(new_count)]
+
+    directory= None
+    if new_count>1:
+        directory= open_engine(directory_url())
+        directory_metadata.create_all(directory)
+        with directory.begin() as conn:
+            conn.execute(delete(item_directory))
+
+    moved= 0
+    for index in range(old_count):
+        source_url= shard_url(index, old_count)
+        source= open_engine(source_url)
+        upgrade_items_table(source)
+        Base.metadata.create_all(bind=source)
+        last_id= 0
+        while True:
+            with source.connect() as conn:
+                rows= conn.execute(
+                    select(*ITEM_COLUMNS).where(Item.id>last_id).order_by(Item.id).limit(REBALANCE_CHUNK_SIZE)
+                ).all()
+            if not rows:
+                break
+            last_id= rows[-1][0]
+            if directory is not None:
+                with directory.begin() as conn:
+                    conn.execute(sqlite_insert(item_directory).on_conflict_do_nothing(),
+                                 [{"id": row[0], "name": row[1]} for row in rows])
+
+            by_target= {}
+            for row in rows:
+                target= shard_index(row[0], new_count)
+                if target_urls[target]!=source_url:
+                    by_target.setdefault(target, []).append(dict(zip(("id", "name", "quantity", "price", "version"), row)))
+            for target, batch in by_target.items():
+                with targets[target].begin() as conn:
+                    conn.execute(sqlite_insert(Item).prefix_with("OR REPLACE"), batch)
+                with source.begin() as conn:
+                    conn.execute(delete(Item).where(Item.id.in_([row["id"] for row in batch])))
+                moved+= len(batch)
+        source.dispose()
+    return {"moved": moved}
+
+
+def shard_status(count: int=SHARD_COUNT):
+    """Row count per shard file of a layout."""
+    status= []
+    for index in range(count):
+        url= shard_url(index, count)
+        engine= open_engine(url)
+        upgrade_items_table(engine)
+        Base.metadata.create_all(bind=engine)
+        with engine.connect() as conn:
+            status.append({"shard": index, "url": url, "rows": conn.execute(text("SELECT COUNT(*) FROM items")).scalar()})
+        engine.dispose()
+    return status
+
+
+if __name__=="__main__":
+    parser= argparse.ArgumentParser(description="Inspect or rebalance the sharded items storage")
+    sub= parser.add_subparsers(dest="command", required=True)
+    status_parser= sub.add_parser("status", help="rows per shard")
+    status_parser.add_argument("--shards", type=int, default=SHARD_COUNT)
+    rebalance_parser= sub.add_parser("rebalance", help="move rows to the layout for a new shard count")
+    rebalance_parser.add_argument("--from", dest="old_count", type=int, required=True)
+    rebalance_parser.add_argument("--to", dest="new_count", type=int, required=True)
+    args= parser.parse_args()
+
+    if args.command=="status":
+        for row in shard_status(args.shards):
+            print(row)
+    else:
+        if args.old_count<1 or args.new_count<1:
+            sys.exit("shard counts must be >= 1")
+        print(rebalance(args.old_count, args.new_count))
+        for row in shard_status(args.new_count):
+            print(row)
+        print(f"now start the app with ITEMS_SHARDS={args.new_count}")
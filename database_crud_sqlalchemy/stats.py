@@ -0,0 +1,145 @@
+# Precomputed inventory aggregates for GET /items/stats
+# Related files: models2.py (ItemStats), crud.py, sharding.py (one summary row per shard)
+
+# Usage as a command (from this folder):
+#   python stats.py check     -> compare the summary row with a full recount
+#   python stats.py rebuild   -> recount and overwrite the summary row
+
+# The item_stats row is maintained by triggers on items, so every write path
+# (single create/update/delete, bulk upsert, bulk delete) adjusts it by the
+# difference it makes, in the same transaction as the write itself.
+
+import os
+import sys
+from sqlalchemy import text
+
+
+# Items with quantity <= this count as low stock
+LOW_STOCK_THRESHOLD= int(os.getenv("ITEMS_LOW_STOCK_THRESHOLD", "5"))
+
+# Floating point sums drift a little with every +/- adjustment; check() ignores this much
+VALUE_TOLERANCE= 1e-6
+
+STATS_TRIGGERS_DDL= [
+    """
+    CREATE TRIGGER IF NOT EXISTS item_stats_insert AFTER INSERT ON items BEGIN
+        UPDATE item_stats SET
+            item_count= item_count + 1,
+            total_quantity= total_quantity + COALESCE(new.quantity, 0),
+            total_value= total_value + new.price * COALESCE(new.quantity, 0),
+            low_stock_count= low_stock_count + (COALESCE(new.quantity, 0) <= low_stock_threshold)
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS item_stats_delete AFTER DELETE ON items BEGIN
+        UPDATE item_stats SET
+            item_count= item_count - 1,
+            total_quantity= total_quantity - COALESCE(old.quantity, 0),
+            total_value= total_value - old.price * COALESCE(old.quantity, 0),
+            low_stock_count= low_stock_count - (COALESCE(old.quantity, 0) <= low_stock_threshold)
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS item_stats_update AFTER UPDATE OF price, quantity ON items BEGIN
+        UPDATE item_stats SET
+            total_quantity= total_quantity - COALESCE(old.quantity, 0) + COALESCE(new.quantity, 0),
+            total_value= total_value - old.price * COALESCE(old.quantity, 0) + new.price * COALESCE(new.quantity, 0),
+            low_stock_count= low_stock_count
+                - (COALESCE(old.quantity, 0) <= low_stock_threshold)
+                + (COALESCE(new.quantity, 0) <= low_stock_threshold)
+        WHERE id = 1;
+    END
+    """,
+]
+
+RECOUNT_SQL= text("""
+    SELECT COUNT(*),
+           COALESCE(SUM(COALESCE(quantity, 0)), 0),
+           COALESCE(SUM(price * COALESCE(quantity, 0)), 0.0),
+           COALESCE(SUM(COALESCE(quantity, 0) <= :threshold), 0)
+    FROM items
+""")
+
+READ_SQL= text("""
+    SELECT item_count, total_quantity, total_value, low_stock_count, low_stock_threshold
+    FROM item_stats WHERE id = 1
+""")
+
+STATS_FIELDS= ("item_count", "total_quantity", "total_value", "low_stock_count")
+
+
+def recount(conn, threshold: int):
+    """Full-table recount (the slow path the summary row avoids)."""
+    return dict(zip(STATS_FIELDS, conn.execute(RECOUNT_SQL, {"threshold": threshold}).one()))
+
+
+def read_stats(conn):
+    """Reads the summary row: a single primary-key lookup."""
+    row= conn.execute(READ_SQL).mappings().first()
+    return dict(row) if row else None
+
+
+def rebuild_stats(engine, threshold: int=None):
+    """Recounts the items table and overwrites the summary row."""
+    threshold= LOW_STOCK_THRESHOLD if threshold is None else threshold
+    with engine.begin() as conn:
+        counts= recount(conn, threshold)
+        conn.execute(
+            text("""
+                INSERT OR REPLACE INTO item_stats
+                    (id, item_count, total_quantity, total_value, low_stock_count, low_stock_threshold)
+                VALUES (1, :item_count, :total_quantity, :total_value, :low_stock_count, :threshold)
+            """),
+            {**counts, "threshold": threshold},
+        )
+        return read_stats(conn)
+
+
+def check_stats(engine):
+    """
+    Compares the summary row with a full recount.
+    Returns {"ok": bool, "stored": {...}, "actual": {...}}.
+    """
+    with engine.connect() as conn:
+        stored= read_stats(conn)
+        if stored is None:
+            return {"ok": False, "stored": None, "actual": recount(conn, LOW_STOCK_THRESHOLD)}
+        actual= recount(conn, stored["low_stock_threshold"])
+    ok= all(
+        abs(stored[field]-actual[field])<=VALUE_TOLERANCE if field=="total_value" else stored[field]==actual[field]
+        for field in STATS_FIELDS
+    )
+    return {"ok": ok, "stored": stored, "actual": actual}
+
+
+def create_stats_triggers(engine):
+    """
+    Creates the triggers if they don't exist yet. The summary row is (re)built
+    when it is missing or was counted with a different LOW_STOCK_THRESHOLD.
+    """
+    with engine.begin() as conn:
+        for ddl in STATS_TRIGGERS_DDL:
+            conn.execute(text(ddl))
+        stored= read_stats(conn)
+    if stored is None or stored["low_stock_threshold"]!=LOW_STOCK_THRESHOLD:
+        rebuild_stats(engine)
+
+
+if __name__=="__main__":
+    from sharding import shards, create_schema
+
+    command= sys.argv[1] if len(sys.argv)>1 else "check"
+    ok= True
+    for shard in shards:
+        create_schema(shard.engine)
+        if command=="rebuild":
+            print(f"shard {shard.index}:", rebuild_stats(shard.engine))
+        elif command=="check":
+            result= check_stats(shard.engine)
+            print(f"shard {shard.index}:", result)
+            ok= ok and result["ok"]
+        else:
+            sys.exit("usage: python stats.py [check|rebuild]")
+    sys.exit(0 if ok else 1)
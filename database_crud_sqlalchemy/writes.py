@@ -0,0 +1,93 @@
+# Write operations for the items table
+# Related files: db2.py (write_queue runs these), crud.py, crud_async.py
+
+# Each function here builds an operation op(db) for db2.write_queue (async mode
+# runs the same operations through AsyncSession.run_sync, see sharding.py).
+# Every operation is a single SQL statement with RETURNING, so a write is one
+# round trip and no ORM object gets loaded just to be modified or deleted.
+# Updates bump Item.version; update/delete can be made conditional on the
+# version the client last saw (If-Match), in which case a mismatch returns STALE.
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models2 import Item
+from schemas2 import ITEM_COLUMNS, row_to_dict
+
+
+# Returned instead of a result when the row exists but its version didn't match
+STALE= object()
+
+
+def _version_mismatch(db, item_id: int):
+    """After a conditional write matched nothing: STALE if the row exists, else None."""
+    exists= db.scalar(select(Item.id).where(Item.id==item_id)) is not None
+    return STALE if exists else None
+
+
+def insert_op(values: dict):
+    """INSERT ... RETURNING -> the new item as a dict."""
+    def op(db):
+        row= db.execute(insert(Item).values(**values).returning(*ITEM_COLUMNS)).first()
+        return row_to_dict(row)
+    return op
+
+
+def update_op(item_id: int, values: dict, versions=None):
+    """
+    UPDATE ... WHERE id=:id [AND version IN :versions] RETURNING
+    -> the updated item as a dict, None if no such id, STALE if the version didn't match.
+    """
+    def op(db):
+        stmt= update(Item).where(Item.id==item_id)
+        if versions is not None:
+            stmt= stmt.where(Item.version.in_(versions))
+        stmt= stmt.values(**values, version=Item.version+1).returning(*ITEM_COLUMNS)
+        row= db.execute(stmt, execution_options={"synchronize_session": False}).first()
+        if row:
+            return row_to_dict(row)
+        return _version_mismatch(db, item_id) if versions is not None else None
+    return op
+
+
+def delete_op(item_id: int, versions=None):
+    """
+    DELETE ... WHERE id=:id [AND version IN :versions] RETURNING id
+    -> True if a row was deleted, False if no such id, STALE if the version didn't match.
+    """
+    def op(db):
+        stmt= delete(Item).where(Item.id==item_id)
+        if versions is not None:
+            stmt= stmt.where(Item.version.in_(versions))
+        deleted= db.execute(stmt.returning(Item.id), execution_options={"synchronize_session": False}).first()
+        if deleted:
+            return True
+        return (_version_mismatch(db, item_id) or False) if versions is not None else False
+    return op
+
+
+def delete_many_op(*conditions):
+    """DELETE ... WHERE <conditions> RETURNING id -> list of deleted ids."""
+    def op(db):
+        stmt= delete(Item).where(*conditions).returning(Item.id)
+        return list(db.scalars(stmt, execution_options={"synchronize_session": False}))
+    return op
+
+
+def upsert_op(rows: list):
+    """
+    One executemany INSERT ... ON CONFLICT(name) DO UPDATE for a batch of dicts.
+    Returns (names that already existed, {name: id} for every touched name).
+    """
+    names= [row["name"] for row in rows]
+    upsert= sqlite_insert(Item)
+    upsert= upsert.on_conflict_do_update(
+        index_elements=[Item.name],
+        set_={"price": upsert.excluded.price, "quantity": upsert.excluded.quantity, "version": Item.version+1},
+    )
+
+    def op(db):
+        existing= set(db.scalars(select(Item.name).where(Item.name.in_(names))))
+        db.execute(upsert, rows)
+        ids= dict(db.execute(select(Item.name, Item.id).where(Item.name.in_(names))).all())
+        return existing, ids
+    return op
@@ -3,13 +3,18 @@
 #   - templates/form.html         -> Form to upload image
 #   - templates/result_image.html -> Page to show uploaded image and info
 #   - static/uploads/             -> Folder to store uploaded images
+#   - ../middleware/compression.py -> Response compression, precompressed static files
 
 from fastapi import FastAPI, Request, UploadFile, File
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import shutil
 import os
+import sys
+
+# The repo root holds middleware/compression.py (shared response compression)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from middleware.compression import CompressionMiddleware, PrecompressedStaticFiles, precompress_file
 
 
 # -------------------------------
@@ -17,18 +22,24 @@ import os
 # -------------------------------
 app= FastAPI()
 
+# Compress HTML pages (and other text responses) for clients that accept it
+app.add_middleware(CompressionMiddleware)
+
+# Directory to save uploaded files
+UPLOAD_DIR= "static/uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True) # Create folder if it doesn't exist (StaticFiles needs it to exist)
+
 # Serve static files from "static" directory
 # This allows access to uploaded images via /static/uploads/<filename>
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# If a file has a precompressed sibling (style.css -> style.css.gz) and the browser
+# accepts gzip, the .gz file is sent instead: no compression work per request.
+# Create them with: python -m middleware.compression image_uploads/static
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 
 # Setup Jinja2 templates directory
 templates= Jinja2Templates(directory="templates")
 
-# Directory to save uploaded files
-UPLOAD_DIR= "static/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True) # Create folder if it doesn't exist
-
 
 # -------------------------------
 # GET Endpoint: Render Upload Form
@@ -58,6 +69,7 @@ async def upload(request: Request, file: UploadFile= File(...)):
     file_location= os.path.join(UPLOAD_DIR, file.filename)
     with open(file_location, 'wb') as f:
         shutil.copyfileobj(file.file, f)
+    precompress_file(file_location)  # writes a .gz next to compressible uploads (e.g. SVG)
     
     file_info= {
         'filename': file.filename,
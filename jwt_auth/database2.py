@@ -1,18 +1,22 @@
 # Database setup using SQLAlchemy ORM
 # Related files: models3.py, jwt.py
 
-from sqlalchemy import create_engine
+import os
+import sys
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+
+# The repo root holds config_environment/engine_factory.py (shared pooled engines)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_environment.engine_factory import create_db_engine, create_session_factory
 
 # SQLite database URL
 DATABASE_URL= "sqlite:///./users.db"
 
-# Create engine
-engine= create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Create engine (pool settings and SQLite pragmas come from config_environment.conf.Settings)
+engine= create_db_engine(DATABASE_URL)
 
 # Create session factory
-SessionLocal= sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal= create_session_factory(engine)
 
 # Base class for ORM models
 Base= declarative_base()
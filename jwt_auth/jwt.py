@@ -10,6 +10,8 @@
 from fastapi import FastAPI, HTTPException, Depends
 from sqlalchemy.orm import Session
 from database2 import SessionLocal, engine, Base
+# config_environment is importable once database2 has put the repo root on sys.path
+from config_environment.schema_check import ensure_schema
 from models3 import User
 from auth_utils import create_access_token, decode_access_token, verify_password, hash_password
 from pydantic import BaseModel
@@ -19,7 +21,8 @@ from fastapi.security import HTTPBearer
 # -------------------------------
 # Database: Create tables
 # -------------------------------
-Base.metadata.create_all(bind=engine)
+# Only when they changed since the last start (schema fingerprint in schema_version)
+ensure_schema(engine, Base.metadata, name="jwt_auth")
 
 
 # -------------------------------
@@ -0,0 +1,319 @@
+# Admission control and load shedding as a pure ASGI middleware: concurrency limits
+# (global + per route) with a bounded wait queue, an adaptive global limit, and
+# per-client rate limiting
+# Related files: middleware.py (uses it), metrics.py (GET /metrics also shows these numbers),
+#                benchmark_admission.py (overload with and without it)
+
+# Use in an app (from another folder, after putting the repo root on sys.path):
+#   from middleware.admission import AdmissionController, AdmissionMiddleware
+#   admission= AdmissionController(route_limits={"GET /slow": 4})
+#   app.add_middleware(AdmissionMiddleware, controller=admission)
+#   metrics.collectors.append(admission.render)   # optional: export via GET /metrics
+#
+# Configuration (environment variables, defaults for AdmissionController):
+#   ADMISSION_MAX_CONCURRENCY=64    upper bound of the adaptive global limit
+#   ADMISSION_MIN_CONCURRENCY=4     lower bound of the adaptive global limit
+#   ADMISSION_TARGET_MS=250         latency above this shrinks the global limit
+#   ADMISSION_QUEUE_SIZE=128        requests allowed to wait for a slot
+#   ADMISSION_QUEUE_TIMEOUT_MS=1000 longest wait before giving up with a 503
+#   ADMISSION_RETRY_AFTER=1         Retry-After (seconds) sent with a 503
+#   RATE_LIMIT_RPS=0                requests per second per client (0 = no rate limit)
+#   RATE_LIMIT_BURST=20             requests a client may send at once
+#
+# Why: a `def` route blocked on a locked SQLite file holds a threadpool thread.
+# Without a limit every new request queues up behind it (in the threadpool, the
+# connection pool, SQLite's busy timeout) and everyone's latency grows until
+# clients time out anyway. Here requests beyond the limit wait in a short queue
+# of our own, and once that is full or the wait too long they get an immediate
+# 503 with Retry-After, so the requests that are admitted stay fast.
+
+# How a request is admitted, in order (paths in `exempt`, like /metrics, skip all of it):
+#   1. Rate limit: each client (by IP) has a token bucket that refills at
+#      RATE_LIMIT_RPS and holds at most RATE_LIMIT_BURST tokens. No token -> 429
+#      with Retry-After set to when the next token is due.
+#   2. Route limit: if "METHOD /path/{template}" has a limit in route_limits, the
+#      request takes a slot of that route's limiter (fixed limit).
+#   3. Global limit: then a slot of the global limiter, whose limit adapts (AIMD):
+#      every request finishing under ADMISSION_TARGET_MS raises it by 1/limit (so
+#      about +1 per "limit" fast requests), a slower one multiplies it by 0.9, at
+#      most once per target interval so a burst of slow requests doesn't collapse it.
+#   When a limiter is full the request waits in its FIFO queue. Queue full -> 503
+#   at once; no slot within ADMISSION_QUEUE_TIMEOUT_MS -> 503.
+# Everything runs on the event loop, so, like metrics.py, no locks are needed.
+# Each worker process has its own limits and buckets.
+
+import asyncio
+import math
+import os
+from collections import OrderedDict, deque
+from time import monotonic, perf_counter_ns
+from starlette.routing import compile_path
+
+
+MAX_CONCURRENCY= int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+MIN_CONCURRENCY= int(os.getenv("ADMISSION_MIN_CONCURRENCY", "4"))
+TARGET_LATENCY= float(os.getenv("ADMISSION_TARGET_MS", "250"))/1000
+QUEUE_SIZE= int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))
+QUEUE_TIMEOUT= float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "1000"))/1000
+RETRY_AFTER= int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+RATE_LIMIT_RPS= float(os.getenv("RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST= int(os.getenv("RATE_LIMIT_BURST", "20"))
+
+# Multiplicative decrease of the adaptive limit on a slow request
+BACKOFF= 0.9
+
+# Clients whose token buckets are remembered; the least recently seen are forgotten
+MAX_CLIENTS= 10000
+
+# Paths that are never limited (monitoring must keep working while shedding)
+EXEMPT_PATHS= ("/metrics", "/debug/")
+
+
+# -------------------------------
+# Concurrency Limiter
+# -------------------------------
+class ConcurrencyLimiter:
+    """
+    At most `limit` requests at a time, the rest wait in a bounded FIFO queue.
+    - name: Label in the exported metrics ("global" or the route)
+    - limit: Starting (and, if not adaptive, fixed) number of concurrent requests
+    - min_limit, max_limit: Bounds of an adaptive limit; adaptive when they differ
+    - target: Latency in seconds above which an adaptive limit shrinks
+    """
+
+    def __init__(self, name: str, limit: int, min_limit: int=None, max_limit: int=None,
+                 target: float=TARGET_LATENCY, queue_size: int=QUEUE_SIZE, queue_timeout: float=QUEUE_TIMEOUT):
+        self.name= name
+        self.limit= float(limit)
+        self.min_limit= limit if min_limit is None else min_limit
+        self.max_limit= limit if max_limit is None else max_limit
+        self.adaptive= self.min_limit!=self.max_limit
+        self.target= target
+        self.queue_size= queue_size
+        self.queue_timeout= queue_timeout
+        self.in_flight= 0
+        self.waiters= deque()   # futures of queued requests, oldest first
+        self.last_decrease= 0.0
+        # Counters for the exported metrics
+        self.admitted= 0
+        self.queued= 0
+        self.shed= {"queue_full": 0, "queue_timeout": 0}
+        self.wait_ns= 0
+
+    async def acquire(self):
+        """Takes a slot, waiting in the queue if needed. False if the request is shed."""
+        if self.in_flight<int(self.limit) and not self.waiters:
+            self.in_flight+= 1
+            self.admitted+= 1
+            return True
+        if len(self.waiters)>=self.queue_size:
+            self.shed["queue_full"]+= 1
+            return False
+
+        waiter= asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued+= 1
+        start= perf_counter_ns()
+        try:
+            # shield: a timeout must not cancel a slot that release() is handing over
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self.abandon(waiter)  # client went away / shutdown while queued
+            raise
+        finally:
+            self.wait_ns+= perf_counter_ns()-start
+        if waiter.done():
+            self.admitted+= 1
+            return True
+        self.abandon(waiter)
+        self.shed["queue_timeout"]+= 1
+        return False
+
+    def abandon(self, waiter):
+        if waiter.done():
+            self.release()  # the slot was already handed over: give it back
+        else:
+            self.waiters.remove(waiter)
+            waiter.cancel()
+
+    def release(self, latency: float=None):
+        """Frees a slot; `latency` (seconds) of the finished request drives an adaptive limit."""
+        self.in_flight-= 1
+        if latency is not None and self.adaptive:
+            if latency<=self.target:
+                self.limit= min(self.max_limit, self.limit+1/self.limit)
+            else:
+                now= monotonic()
+                if now-self.last_decrease>=self.target:
+                    self.limit= max(self.min_limit, self.limit*BACKOFF)
+                    self.last_decrease= now
+        # Hand free slots to the oldest waiters (their in_flight is counted here)
+        while self.waiters and self.in_flight<int(self.limit):
+            self.in_flight+= 1
+            self.waiters.popleft().set_result(True)
+
+
+# -------------------------------
+# Rate Limiter
+# -------------------------------
+class RateLimiter:
+    """
+    Token bucket per client.
+    - rate: Tokens added per second (requests per second in the long run)
+    - burst: Bucket size (requests allowed back to back)
+    """
+
+    def __init__(self, rate: float=RATE_LIMIT_RPS, burst: int=RATE_LIMIT_BURST, max_clients: int=MAX_CLIENTS):
+        self.rate= rate
+        self.burst= burst
+        self.max_clients= max_clients
+        self.buckets= OrderedDict()  # client -> [tokens, time of last refill], least recently seen first
+        self.limited= 0
+
+    def check(self, client: str):
+        """0 if the request may go ahead, else the seconds until the client's next token."""
+        now= monotonic()
+        bucket= self.buckets.get(client)
+        if bucket is None:
+            bucket= self.buckets[client]= [float(self.burst), now]
+            if len(self.buckets)>self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+            bucket[0]= min(self.burst, bucket[0]+(now-bucket[1])*self.rate)
+            bucket[1]= now
+        if bucket[0]>=1:
+            bucket[0]-= 1
+            return 0
+        self.limited+= 1
+        return (1-bucket[0])/self.rate
+
+
+# -------------------------------
+# Admission Controller
+# -------------------------------
+class AdmissionController:
+    """
+    The limiters one app uses, shared by AdmissionMiddleware and the metrics export.
+    - route_limits: {"GET /items/{item_id}": 8} or {"/slow": 4} (any method); fixed limits
+    - rate / burst: Per-client token bucket; rate=0 turns rate limiting off
+    Queue size and timeout apply to the global limiter and to every route limiter.
+    """
+
+    def __init__(self, max_concurrency: int=MAX_CONCURRENCY, min_concurrency: int=MIN_CONCURRENCY,
+                 target: float=TARGET_LATENCY, queue_size: int=QUEUE_SIZE, queue_timeout: float=QUEUE_TIMEOUT,
+                 route_limits: dict=None, rate: float=RATE_LIMIT_RPS, burst: int=RATE_LIMIT_BURST):
+        self.global_limiter= ConcurrencyLimiter("global", max_concurrency, min_concurrency, max_concurrency,
+                                                target, queue_size, queue_timeout)
+        self.route_limiters= []  # (method or None, compiled path regex, limiter)
+        for route, limit in (route_limits or {}).items():
+            method, _, path= route.rpartition(" ")
+            regex, _, _= compile_path(path)
+            limiter= ConcurrencyLimiter(route, limit, queue_size=queue_size, queue_timeout=queue_timeout)
+            self.route_limiters.append((method.upper() or None, regex, limiter))
+        self.rate_limiter= RateLimiter(rate, burst) if rate>0 else None
+
+    def route_limiter(self, method: str, path: str):
+        for route_method, regex, limiter in self.route_limiters:
+            if (route_method is None or route_method==method) and regex.match(path):
+                return limiter
+        return None
+
+    def limiters(self):
+        return [self.global_limiter]+[limiter for _, _, limiter in self.route_limiters]
+
+    def render(self):
+        """Prometheus exposition lines (metrics.py's Metrics.collectors calls this)."""
+        gauges= (
+            ("admission_concurrency_limit", "Current concurrency limit.", lambda limiter: int(limiter.limit)),
+            ("admission_in_flight", "Requests holding a slot.", lambda limiter: limiter.in_flight),
+            ("admission_queue_length", "Requests waiting for a slot.", lambda limiter: len(limiter.waiters)),
+        )
+        counters= (
+            ("admission_admitted_total", "Requests that got a slot.", lambda limiter: limiter.admitted),
+            ("admission_queued_total", "Requests that had to wait for a slot.", lambda limiter: limiter.queued),
+            ("admission_queue_wait_seconds_total", "Time spent waiting for a slot.", lambda limiter: limiter.wait_ns/1e9),
+        )
+        lines= []
+        for kind, metrics in (("gauge", gauges), ("counter", counters)):
+            for name, help_text, value in metrics:
+                lines+= [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for limiter in self.limiters():
+                    lines.append(f'{name}{{limiter="{escape(limiter.name)}"}} {value(limiter)}')
+        lines+= ["# HELP admission_shed_total Requests rejected with 503, by reason.", "# TYPE admission_shed_total counter"]
+        for limiter in self.limiters():
+            for reason, count in limiter.shed.items():
+                lines.append(f'admission_shed_total{{limiter="{escape(limiter.name)}",reason="{reason}"}} {count}')
+        if self.rate_limiter is not None:
+            lines+= [
+                "# HELP admission_rate_limited_total Requests rejected with 429 by the per-client rate limit.",
+                "# TYPE admission_rate_limited_total counter",
+                f"admission_rate_limited_total {self.rate_limiter.limited}",
+            ]
+        return lines
+
+
+def escape(value: str):
+    """Escapes a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Default controller (configured from the environment), used unless told otherwise
+admission= AdmissionController()
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+async def reject(send, status: int, detail: str, retry_after: int):
+    """Sends a JSON error in HTTPException's {"detail": ...} format."""
+    body= f'{{"detail":"{detail}"}}'.encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware that admits, queues or rejects requests (see top of file).
+    - controller: Limiters to use (default: the module's `admission`)
+    - exempt: Path prefixes that are never limited
+    - retry_after: Seconds in the Retry-After header of a 503
+    """
+
+    def __init__(self, app, controller: AdmissionController=admission, exempt=EXEMPT_PATHS, retry_after: int=RETRY_AFTER):
+        self.app= app
+        self.controller= controller
+        self.exempt= tuple(exempt)
+        self.retry_after= retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http" or scope["path"].startswith(self.exempt):
+            return await self.app(scope, receive, send)
+        controller= self.controller
+
+        if controller.rate_limiter is not None:
+            client= scope["client"][0] if scope.get("client") else ""
+            wait= controller.rate_limiter.check(client)
+            if wait:
+                return await reject(send, 429, "Too many requests", math.ceil(wait))
+
+        route_limiter= controller.route_limiter(scope["method"], scope["path"])
+        if route_limiter is not None and not await route_limiter.acquire():
+            return await reject(send, 503, "Server busy, try again later", self.retry_after)
+        try:
+            if not await controller.global_limiter.acquire():
+                return await reject(send, 503, "Server busy, try again later", self.retry_after)
+            start= perf_counter_ns()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                controller.global_limiter.release((perf_counter_ns()-start)/1e9)
+        finally:
+            if route_limiter is not None:
+                route_limiter.release()
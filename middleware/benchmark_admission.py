@@ -0,0 +1,105 @@
+# Benchmark: an overloaded app with and without AdmissionMiddleware
+# Related files: admission.py, middleware.py
+
+# Usage (from the repo root):
+#   python -m middleware.benchmark_admission --rate 400 --seconds 3
+#
+# The app has one route that needs a "database" which handles one request at a
+# time for --service-ms (like a SQLite file that is locked while someone writes),
+# so it can serve 1000/service-ms requests per second. Requests arrive at --rate
+# per second, more than that, for --seconds, straight through the ASGI interface.
+# A client waits at most --client-timeout seconds; a response arriving later is
+# useless to it, so it counts as failed, not served.
+#   without admission -> every request queues for the lock, the queue (and the
+#                        latency) keeps growing until nearly nobody is served in time
+#   with admission    -> a few requests are in at a time and a short queue waits;
+#                        the rest get a 503 straight away, and the ones admitted stay fast
+
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from middleware.admission import AdmissionController, AdmissionMiddleware
+
+
+def build_app(service_time: float, controller: AdmissionController=None):
+    app= FastAPI()
+    database= asyncio.Lock()
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        async with database:
+            await asyncio.sleep(service_time)
+        return {"item_id": item_id}
+
+    if controller is not None:
+        app.add_middleware(AdmissionMiddleware, controller=controller)
+    return app
+
+
+async def call(app, item_id: int):
+    """(status, seconds) of one GET through the ASGI interface."""
+    path= f"/items/{item_id}"
+    scope= {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    status= [None]
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"]=="http.response.start":
+            status[0]= message["status"]
+
+    start= time.perf_counter()
+    await app(scope, receive, send)
+    return status[0], time.perf_counter()-start
+
+
+async def overload(app, rate: float, seconds: float):
+    """Starts rate requests per second for `seconds` (open loop) and collects their results."""
+    tasks= []
+    start= time.perf_counter()
+    for n in range(int(rate*seconds)):
+        delay= start+n/rate-time.perf_counter()
+        if delay>0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(call(app, n)))
+    return await asyncio.gather(*tasks)
+
+
+def percentile(values, fraction: float):
+    return sorted(values)[min(len(values)-1, int(len(values)*fraction))] if values else float("nan")
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Overload with and without admission control")
+    parser.add_argument("--rate", type=float, default=400, help="requests started per second")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--service-ms", type=float, default=5, help="time each request holds the database")
+    parser.add_argument("--client-timeout", type=float, default=1.0)
+    args= parser.parse_args()
+
+    service_time= args.service_ms/1000
+    print(f"capacity {1/service_time:.0f} req/s, offered {args.rate:.0f} req/s for {args.seconds:.0f}s, "
+          f"client timeout {args.client_timeout}s")
+    setups= {
+        "without admission": None,
+        "with admission": AdmissionController(max_concurrency=16, min_concurrency=2, target=0.05,
+                                              queue_size=32, queue_timeout=0.2),
+    }
+    for name, controller in setups.items():
+        results= asyncio.run(overload(build_app(service_time, controller), args.rate, args.seconds))
+        ok= [seconds for status, seconds in results if status==200]
+        in_time= [seconds for seconds in ok if seconds<=args.client_timeout]
+        shed= [seconds for status, seconds in results if status==503]
+        print(f"{name:>18}: served in time {len(in_time):5}/{len(results)}   late {len(ok)-len(in_time):5}   "
+              f"503 {len(shed):5}   200 latency p50 {percentile(ok, 0.5)*1000:7.1f} ms  "
+              f"p99 {percentile(ok, 0.99)*1000:7.1f} ms   503 p99 {percentile(shed, 0.99)*1000:6.1f} ms")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,84 @@
+# Benchmark: per-request overhead of MetricsMiddleware vs no middleware vs the old
+# @app.middleware("http") + print() request logger
+# Related files: metrics.py, middleware.py
+
+# Usage (from the repo root):
+#   python -m middleware.benchmark_metrics --requests 20000
+#
+# Each setup is the same one-route app (like middleware.py's GET /) driven straight
+# through the ASGI interface, so the numbers are the framework + middleware cost
+# alone. The print()s of the old logger go to /dev/null, which is cheaper than a
+# real terminal. Setups take turns in several rounds and the best round counts.
+
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+from fastapi import FastAPI, Request
+from middleware.metrics import Metrics, MetricsMiddleware
+
+
+def build_app(mode: str):
+    app= FastAPI()
+
+    if mode=="print logger":
+        @app.middleware("http")
+        async def log_request_time(request: Request, call_next):
+            start_time= time.time()
+            response= await call_next(request)
+            process_time= time.time()-start_time
+            print(f"Request: {request.method} {request.url} - Process time: {process_time:.4f} seconds")
+            return response
+    elif mode=="MetricsMiddleware":
+        app.add_middleware(MetricsMiddleware, metrics=Metrics())
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"item_id": item_id}
+
+    return app
+
+
+async def per_request_us(app, requests: int):
+    scope= {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/items/42", "raw_path": b"/items/42", "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(100):  # warm up
+        await app(dict(scope), receive, send)
+    start= time.perf_counter_ns()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter_ns()-start)/requests/1000
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Per-request overhead of the metrics middleware")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args= parser.parse_args()
+
+    modes= ("no middleware", "MetricsMiddleware", "print logger")
+    apps= {mode: build_app(mode) for mode in modes}
+    best= {mode: float("inf") for mode in modes}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(args.rounds):
+            for mode in modes:
+                best[mode]= min(best[mode], asyncio.run(per_request_us(apps[mode], args.requests)))
+
+    base= best["no middleware"]
+    for mode in modes:
+        print(f"{mode:>17}: {best[mode]:7.1f} us/request   ({best[mode]-base:+.1f} us)")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,77 @@
+# Benchmark: per-request cost of a cacheable GET route with and without ResponseCacheMiddleware
+# Related files: response_cache.py, basics/main.py
+
+# Usage (from the repo root):
+#   python -m middleware.benchmark_response_cache --requests 20000
+#
+# The route is basics/main.py's read_item (a path and a query parameter to
+# validate), driven straight through the ASGI interface with the same URL every
+# time, so with the cache every request after the first is a hit:
+#   no cache        -> routing, parameter validation, the endpoint and JSON encoding every time
+#   cache (hits)    -> the middleware finds the entry and sends the stored bytes
+#   cache (misses)  -> a different URL every time: the middleware's own cost on top of "no cache"
+# Setups take turns in several rounds and the best round counts.
+
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from middleware.response_cache import ResponseCache, ResponseCacheMiddleware, cache_response
+
+
+def build_app(cached: bool):
+    app= FastAPI()
+
+    @app.get("/items/{item_id}")
+    @cache_response(ttl=300)
+    def read_item(item_id: int, q: str=None):
+        return {"item_id": item_id, "query": q}
+
+    if cached:
+        app.add_middleware(ResponseCacheMiddleware, cache=ResponseCache())
+    return app
+
+
+async def per_request_us(app, requests: int, same_url: bool):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(n: int):
+        path= "/items/42" if same_url else f"/items/{n}"
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"q=test", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        }
+
+    for n in range(100):  # warm up
+        await app(scope(-n), receive, send)
+    start= time.perf_counter_ns()
+    for n in range(requests):
+        await app(scope(n), receive, send)
+    return (time.perf_counter_ns()-start)/requests/1000
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Per-request cost with and without the response cache")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args= parser.parse_args()
+
+    setups= {"no cache": (False, True), "cache (hits)": (True, True), "cache (misses)": (True, False)}
+    best= {name: float("inf") for name in setups}
+    for _ in range(args.rounds):
+        for name, (cached, same_url) in setups.items():
+            # A fresh app per round, so "misses" never finds entries of an earlier round
+            best[name]= min(best[name], asyncio.run(per_request_us(build_app(cached), args.requests, same_url)))
+
+    base= best["no cache"]
+    for name in setups:
+        print(f"{name:>14}: {best[name]:7.1f} us/request   ({best[name]/base:.2f}x)")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,109 @@
+# Benchmark: database queries for a burst of identical concurrent GETs, with and without single flight
+# Related files: single_flight.py, basics/main3.py (GET /items/, decorator),
+#                database_crud_sqlalchemy/crud.py (GET /items/{item_id}, middleware)
+
+# Usage (from the repo root):
+#   python -m middleware.benchmark_single_flight --clients 200 --rows 2000
+#
+# Works on scratch databases in a temporary folder (the real ones are not touched).
+# For each app, --clients requests for the same URL are started at once through the
+# ASGI interface, and every SQL statement the app's engines run is counted.
+#   main3 GET /items/              without: load_items' undecorated function
+#                                  with:    @single_flight load_items
+#   crud.py GET /items/{item_id}   without: the app minus SingleFlightMiddleware
+#                                  with:    the app as it is (item_cache cleared first,
+#                                           so every request starts as a cache miss)
+# Each burst is checked: all responses must be 200 and identical.
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from sqlalchemy import event, insert
+
+ROOT= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_queries(engines):
+    counter= [0]
+
+    def before_cursor_execute(*args):
+        counter[0]+= 1
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+async def burst(app, path: str, clients: int):
+    """Starts `clients` identical GETs at once; returns (responses, seconds)."""
+    async def get():
+        scope= {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        }
+        response= {"body": b""}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"]=="http.response.start":
+                response["status"]= message["status"]
+            elif message["type"]=="http.response.body":
+                response["body"]+= message.get("body", b"")
+        await app(scope, receive, send)
+        return response["status"], response["body"]
+
+    start= time.perf_counter()
+    responses= await asyncio.gather(*[get() for _ in range(clients)])
+    return responses, time.perf_counter()-start
+
+
+def report(name: str, counter, run):
+    before= counter[0]
+    responses, seconds= run()
+    assert all(status==200 for status, _ in responses), {status for status, _ in responses}
+    assert len({body for _, body in responses})==1, "responses differ"
+    print(f"  {name:>8}: {counter[0]-before:5} queries   {seconds*1000:8.1f} ms for the burst")
+
+
+def main():
+    parser= argparse.ArgumentParser(description="Queries per burst of identical GETs, with and without single flight")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=2000)
+    args= parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    sys.path[:0]= [ROOT, os.path.join(ROOT, "database_crud_sqlalchemy")]
+
+    import basics.main3 as main3
+    main3.create_db_and_tables()
+    with main3.engine.begin() as conn:
+        conn.execute(insert(main3.Item), [{"name": f"item {n}", "price": n/4} for n in range(args.rows)])
+    counter= count_queries([main3.engine])
+    decorated= main3.load_items
+    print(f"main3 GET /items/ ({args.rows} rows), {args.clients} concurrent clients")
+    main3.load_items= decorated.__wrapped__
+    report("without", counter, lambda: asyncio.run(burst(main3.app, "/items/", args.clients)))
+    main3.load_items= decorated
+    report("with", counter, lambda: asyncio.run(burst(main3.app, "/items/", args.clients)))
+
+    import crud
+    from middleware.single_flight import SingleFlightMiddleware
+    with crud.shards[0].engine.begin() as conn:
+        conn.execute(insert(crud.Item), [{"name": "item", "quantity": 1, "price": 1.0}])
+    counter= count_queries([shard.engine for shard in crud.shards])
+    plain= crud.FastAPI()
+    plain.router= crud.app.router
+    plain.user_middleware= [item for item in crud.app.user_middleware if item.cls is not SingleFlightMiddleware]
+    print(f"crud.py GET /items/1, {args.clients} concurrent clients, item_cache empty")
+    for name, app in (("without", plain), ("with", crud.app)):
+        crud.item_cache.clear()
+        report(name, counter, lambda: asyncio.run(burst(app, "/items/1", args.clients)))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,247 @@
+# Response compression (zstd / gzip / deflate) as a pure ASGI middleware, plus
+# StaticFiles that serves precompressed .gz files
+# Related files: basics/main3.py-main5.py, templating_jinja/jinja_demo.py, image_uploads/images.py
+
+# Optional zstd support (used when the client accepts it):
+#   pip install zstandard
+#
+# Use in an app (from another folder, after putting the repo root on sys.path):
+#   from middleware.compression import CompressionMiddleware
+#   app.add_middleware(CompressionMiddleware)
+#
+# Precompress static files (writes name.ext.gz next to every compressible file):
+#   python -m middleware.compression image_uploads/static
+
+# How the middleware decides, per response:
+#   1. Encoding: the best one in the request's Accept-Encoding (q-values respected),
+#      ties going to zstd, then gzip, then deflate. None acceptable -> untouched.
+#   2. Skipped when the response already has a Content-Encoding, its Content-Type
+#      isn't in COMPRESSIBLE_TYPES (images, zips... are compressed already; SSE
+#      streams must reach the client unbuffered), or it says Cache-Control: no-transform.
+#      Partial responses (206, or any with Content-Range) pass through as well: their
+#      byte ranges refer to the uncompressed body, compressing them would break that.
+#   3. A body sent in one piece (Response, JSONResponse, HTMLResponse) is compressed
+#      only when it is at least minimum_size bytes; smaller ones gain nothing.
+#   4. A body sent in pieces (StreamingResponse, FileResponse) is compressed piece by
+#      piece: each chunk is compressed and flushed straight away, so nothing is
+#      buffered and the client can decode every chunk as it arrives.
+# Vary: Accept-Encoding is added to every compressible response, so shared caches
+# keep the compressed and the plain version apart.
+
+import gzip
+import mimetypes
+import os
+import shutil
+import sys
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+from starlette.responses import FileResponse
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard= None
+
+
+# Content-Type prefixes worth compressing
+COMPRESSIBLE_TYPES= (
+    "text/html", "text/plain", "text/css", "text/csv", "text/xml", "text/javascript",
+    "application/json", "application/x-ndjson", "application/javascript", "application/xml",
+    "image/svg+xml",
+)
+
+GZIP_LEVEL= 6
+ZSTD_LEVEL= 3
+
+
+# -------------------------------
+# Encoders
+# -------------------------------
+def zlib_encoder(wbits: int, level: int):
+    """gzip (wbits=31) or zlib-wrapped deflate (wbits=15) as an encode(data, final) function."""
+    compressor= zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def encode(data: bytes, final: bool):
+        return compressor.compress(data)+compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return encode
+
+
+def zstd_encoder(level: int):
+    compressor= zstandard.ZstdCompressor(level=level).compressobj()
+
+    def encode(data: bytes, final: bool):
+        return compressor.compress(data)+(compressor.flush() if final else compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+    return encode
+
+
+# encoding -> function returning a new encoder; in order of preference
+ENCODERS= {
+    "gzip": lambda: zlib_encoder(16+zlib.MAX_WBITS, GZIP_LEVEL),
+    "deflate": lambda: zlib_encoder(zlib.MAX_WBITS, GZIP_LEVEL),
+}
+if zstandard is not None:
+    ENCODERS= {"zstd": lambda: zstd_encoder(ZSTD_LEVEL), **ENCODERS}
+
+
+def choose_encoding(accept_encoding: str, available=tuple(ENCODERS)):
+    """The best encoding in `available` the Accept-Encoding header allows, or None."""
+    weights= {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params= part.partition(";")
+        quality= 1.0
+        for param in params.split(";"):
+            key, _, value= param.strip().partition("=")
+            if key=="q":
+                try:
+                    quality= float(value)
+                except ValueError:
+                    quality= 0.0
+        weights[name.strip()]= quality
+    best, best_quality= None, 0.0
+    for encoding in available:
+        quality= weights.get(encoding, weights.get("*", 0.0))
+        if quality>best_quality:
+            best, best_quality= encoding, quality
+    return best
+
+
+def is_compressible(content_type: str):
+    return content_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: MutableHeaders):
+    vary= headers.get("vary")
+    if vary is None:
+        headers["vary"]= "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["vary"]= f"{vary}, Accept-Encoding"
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware that compresses responses (see top of file).
+    - minimum_size: Bodies sent in one piece below this many bytes stay uncompressed
+    """
+
+    def __init__(self, app, minimum_size: int=500):
+        self.app= app
+        self.minimum_size= minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http" or scope["method"]=="HEAD":
+            return await self.app(scope, receive, send)
+        encoding= choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start= None    # the held back http.response.start message
+        encode= None   # set once we know the body gets compressed
+        passthrough= False
+
+        async def compressing_send(message):
+            nonlocal start, encode, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message["type"]=="http.response.start":
+                headers= MutableHeaders(raw=list(message.get("headers", [])))
+                if (message["status"]==206 or "content-range" in headers or "content-encoding" in headers
+                        or not is_compressible(headers.get("content-type", ""))
+                        or "no-transform" in headers.get("cache-control", "")):
+                    passthrough= True
+                    return await send(message)
+                add_vary(headers)
+                start= {**message, "headers": headers.raw}
+                return
+
+            if message["type"]!="http.response.body":
+                return await send(message)
+
+            body= message.get("body", b"")
+            more_body= message.get("more_body", False)
+            if encode is None:
+                headers= MutableHeaders(raw=start["headers"])
+                if not more_body and len(body)<self.minimum_size:
+                    # Whole body in one piece and too small: send it as it is
+                    passthrough= True
+                    await send(start)
+                    return await send(message)
+                encode= ENCODERS[encoding]()
+                headers["content-encoding"]= encoding
+                if more_body:
+                    # Streamed: the compressed length isn't known up front
+                    del headers["content-length"]
+                    await send(start)
+                else:
+                    body= encode(body, final=True)
+                    headers["content-length"]= str(len(body))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": body, "more_body": False})
+            await send({"type": "http.response.body", "body": encode(body, final=not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+
+# -------------------------------
+# Precompressed Static Files
+# -------------------------------
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that answers with file.ext.gz (if it exists and isn't older than
+    file.ext) when the client accepts gzip, so nothing is compressed per request.
+    The .gz files come from precompress() / `python -m middleware.compression <dir>`.
+    Every successful answer (200, 206, 304) says Vary: Accept-Encoding, the plain
+    one too, so a shared cache never hands one variant to a client that asked for the other.
+    """
+
+    async def get_response(self, path: str, scope):
+        response= await super().get_response(path, scope)
+        if response.status_code in (200, 206, 304):
+            add_vary(response.headers)
+        if not isinstance(response, FileResponse) or response.status_code!=200:
+            return response
+        if choose_encoding(Headers(scope=scope).get("accept-encoding", ""), ("gzip",))!="gzip":
+            return response
+        original= response.path
+        compressed= f"{original}.gz"
+        try:
+            compressed_stat= os.stat(compressed)
+        except OSError:
+            return response
+        if compressed_stat.st_mtime<os.stat(original).st_mtime:
+            return response  # stale .gz: the original changed after it was made
+        gz_response= FileResponse(compressed, stat_result=compressed_stat, media_type=response.media_type)
+        gz_response.headers["content-encoding"]= "gzip"
+        add_vary(gz_response.headers)
+        return gz_response
+
+
+def precompress_file(path: str):
+    """Writes path.gz if path is compressible and path.gz is missing or older. Returns True if written."""
+    content_type, _= mimetypes.guess_type(path)
+    if path.endswith(".gz") or content_type is None or not is_compressible(content_type):
+        return False
+    compressed= f"{path}.gz"
+    if os.path.exists(compressed) and os.path.getmtime(compressed)>=os.path.getmtime(path):
+        return False
+    with open(path, "rb") as source, gzip.open(compressed, "wb", compresslevel=9) as target:
+        shutil.copyfileobj(source, target)
+    return True
+
+
+def precompress(directory: str):
+    """precompress_file() for every file under directory; returns how many .gz files were written."""
+    written= 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            written+= precompress_file(os.path.join(root, name))
+    return written
+
+
+if __name__=="__main__":
+    for directory in sys.argv[1:] or ["static"]:
+        print(f"{directory}: {precompress(directory)} .gz files written")
@@ -0,0 +1,190 @@
+# Request metrics as a pure ASGI middleware, exposed in Prometheus format at GET /metrics
+# Related files: middleware.py (uses it), benchmark_metrics.py (overhead)
+
+# Use in an app (from another folder, after putting the repo root on sys.path):
+#   from middleware.metrics import MetricsMiddleware, router as metrics_router
+#   app.add_middleware(MetricsMiddleware)
+#   app.include_router(metrics_router)      # GET /metrics
+#
+# Prometheus scrape config:
+#   scrape_configs:
+#     - job_name: fastapi
+#       static_configs: [{targets: ["127.0.0.1:8000"]}]
+
+# What is recorded, per method + route template ("/items/{item_id}", not "/items/42",
+# so the number of series stays bounded; requests no route matched share "<unmatched>"):
+#   http_request_duration_seconds  histogram, from the request arriving to the last body byte sent
+#   http_requests_total            counter, also split by status code
+#   http_request_size_bytes        summary (sum + count) of request body sizes
+#   http_response_size_bytes       summary (sum + count) of response body sizes
+#   http_requests_in_flight        gauge, requests currently being handled
+#
+# Why not @app.middleware("http"): that wraps the app in BaseHTTPMiddleware, which
+# builds Request/Response objects and runs the route in a separate task for every
+# request. Here the middleware only wraps send/receive, reads the clock with
+# perf_counter_ns and increments a few integers. Everything runs on the event loop,
+# so no locks are needed. Each worker process has its own numbers; Prometheus
+# adds them up across the scraped workers.
+
+from bisect import bisect_left
+from time import perf_counter_ns
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+
+# Histogram bucket upper bounds in seconds (Prometheus' "le" labels)
+BUCKETS= (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED= "<unmatched>"
+
+
+class RouteStats:
+    """Everything recorded for one method + route template."""
+    __slots__= ("buckets", "duration_ns", "count", "statuses", "request_bytes", "response_bytes")
+
+    def __init__(self, bucket_count: int):
+        self.buckets= [0]*(bucket_count+1)  # per bucket (not cumulative); last one is +Inf
+        self.duration_ns= 0
+        self.count= 0
+        self.statuses= {}                   # status code -> requests
+        self.request_bytes= 0
+        self.response_bytes= 0
+
+
+class Metrics:
+    """
+    In-memory metric store shared by MetricsMiddleware and GET /metrics.
+    - buckets: Histogram upper bounds in seconds
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets= tuple(buckets)
+        self._bounds_ns= [int(bound*1e9) for bound in self.buckets]
+        self.routes= {}  # (method, route) -> RouteStats
+        self.in_flight= 0
+        self.collectors= []  # functions returning more exposition lines (e.g. admission.py's render)
+
+    def observe(self, method: str, route: str, status: int, duration_ns: int, request_bytes: int, response_bytes: int):
+        stats= self.routes.get((method, route))
+        if stats is None:
+            stats= self.routes[(method, route)]= RouteStats(len(self.buckets))
+        stats.buckets[bisect_left(self._bounds_ns, duration_ns)]+= 1
+        stats.duration_ns+= duration_ns
+        stats.count+= 1
+        stats.statuses[status]= stats.statuses.get(status, 0)+1
+        stats.request_bytes+= request_bytes
+        stats.response_bytes+= response_bytes
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines= [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Time from request start to the last response byte.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        routes= sorted(self.routes.items())
+        for (method, route), stats in routes:
+            labels= f'method="{method}",route="{escape(route)}"'
+            cumulative= 0
+            for bound, count in zip(self.buckets, stats.buckets):
+                cumulative+= count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.duration_ns/1e9}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        lines+= ["# HELP http_requests_total Requests handled, by status code.", "# TYPE http_requests_total counter"]
+        for (method, route), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{escape(route)}",status="{status}"}} {count}')
+
+        for name, field, help_text in (
+            ("http_request_size_bytes", "request_bytes", "Request body sizes."),
+            ("http_response_size_bytes", "response_bytes", "Response body sizes."),
+        ):
+            lines+= [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for (method, route), stats in routes:
+                labels= f'method="{method}",route="{escape(route)}"'
+                lines.append(f"{name}_sum{{{labels}}} {getattr(stats, field)}")
+                lines.append(f"{name}_count{{{labels}}} {stats.count}")
+
+        for collect in self.collectors:
+            lines+= collect()
+        return "\n".join(lines)+"\n"
+
+
+def escape(value: str):
+    """Escapes a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def route_template(scope):
+    """The matched route's path template, the mount prefix for mounted apps, or UNMATCHED."""
+    route= scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", None) or route.path
+    if "endpoint" in scope:  # matched a Mount (e.g. StaticFiles) rather than a route
+        return scope.get("root_path", "")+"/*"
+    return UNMATCHED
+
+
+# Default store, used by MetricsMiddleware and GET /metrics unless told otherwise
+metrics= Metrics()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that records the metrics listed at the top of the file.
+    - metrics: Store to record into (default: the module's `metrics`)
+    """
+
+    def __init__(self, app, metrics: Metrics=metrics):
+        self.app= app
+        self.metrics= metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http":
+            return await self.app(scope, receive, send)
+
+        start= perf_counter_ns()
+        sizes= [0, 0]   # request bytes, response bytes
+        status= [500]   # stays 500 if the app fails before starting a response
+
+        async def counting_receive():
+            message= await receive()
+            if message["type"]=="http.request":
+                sizes[0]+= len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"]=="http.response.start":
+                status[0]= message["status"]
+            elif message["type"]=="http.response.body":
+                sizes[1]+= len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_flight+= 1
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            self.metrics.in_flight-= 1
+            self.metrics.observe(scope["method"], route_template(scope), status[0],
+                                 perf_counter_ns()-start, sizes[0], sizes[1])
+
+
+# -------------------------------
+# Metrics Endpoint
+# -------------------------------
+router= APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Prometheus text format (version 0.0.4) of everything MetricsMiddleware recorded in this process.
+    async def on purpose: it runs on the event loop like the middleware, so it never
+    reads the store while a request is updating it.
+    """
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,4 +1,7 @@
 ### Demonstrates how to implement Middleware in FastAPI
+# Related files: metrics.py (request metrics middleware and GET /metrics), benchmark_metrics.py,
+#                profiler.py (profile single requests on demand),
+#                admission.py (concurrency limits, load shedding, rate limiting), benchmark_admission.py
 
 # -------------------------------
 # What is Middleware?
@@ -11,8 +14,19 @@
 #   - Measure performance
 #   - Enforce rules or validations
 
-from fastapi import FastAPI, Request
+# Run from the repo root:
+#   uvicorn middleware.middleware:app
+
+import os
+import sys
 import time
+from fastapi import FastAPI
+
+# The repo root, so this folder's modules import as middleware.* like in the other apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from middleware.admission import AdmissionController, AdmissionMiddleware
+from middleware.metrics import MetricsMiddleware, metrics, router as metrics_router
+from middleware import profiler
 
 
 # Create FastAPI instance
@@ -20,29 +34,63 @@ app= FastAPI()
 
 
 # -------------------------------
-# Custom Middleware to Log Request Time
+# Middleware to Measure Request Time
 # -------------------------------
-@app.middleware("http")
-async def log_request_time(request: Request, call_next):
-    """
-    Middleware function that logs the time taken to process each request.
-
-    Parameters:
-    - request: Incoming HTTP request
-    - call_next: Function to call the next step in the request lifecycle (usually the route handler)
-
-    Steps:
-    1. Record start time
-    2. Call the actual route handler with call_next(request)
-    3. Measure the total processing time
-    4. Print log to console
-    5. Return the response
-    """
-    start_time= time.time() # Record time when request started
-    response= await call_next(request)  # Call the actual route
-    process_time= time.time()-start_time # Calculate elapsed time
-    print(f"Request: {request.method} {request.url} - Process time: {process_time:.4f} seconds")
-    return response
+# MetricsMiddleware (metrics.py) times every request with perf_counter_ns and keeps
+# per-route latency histograms, status counts, request/response sizes and the
+# number of requests in flight. Instead of printing a line per request, it adds
+# everything up and serves it at GET /metrics for Prometheus (or a quick look):
+#   curl http://127.0.0.1:8000/metrics
+#
+# It is a "pure ASGI" middleware: a class whose __call__(scope, receive, send)
+# wraps the next app. The simpler decorator form looks like this:
+#
+#   @app.middleware("http")
+#   async def log_request_time(request: Request, call_next):
+#       start_time= time.perf_counter()
+#       response= await call_next(request)  # Call the actual route
+#       print(f"{request.method} {request.url} took {time.perf_counter()-start_time:.4f}s")
+#       return response
+#
+# but that form runs through BaseHTTPMiddleware (extra objects and a task per
+# request) and a print() per request blocks the event loop on the console.
+# benchmark_metrics.py measures both against no middleware at all.
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics_router)
+
+
+# -------------------------------
+# Middleware for Admission Control
+# -------------------------------
+# When something downstream stalls (a locked SQLite file, a slow API), requests
+# keep arriving and pile up on the threadpool, and every request gets slower.
+# AdmissionMiddleware (admission.py) lets at most a limited number of requests in
+# at a time (globally, and per route where route_limits says so), queues a few
+# more briefly, and answers the rest at once with 503 + Retry-After. The global
+# limit adapts: it shrinks while requests are slower than ADMISSION_TARGET_MS and
+# grows back when they are fast again. With RATE_LIMIT_RPS set, each client also
+# gets a token bucket (429 + Retry-After when it is empty).
+# The limiters' numbers (limit, in flight, queue length, shed requests) are part
+# of GET /metrics. Added after MetricsMiddleware, so it is the outer one: a shed
+# request is turned away before any other middleware runs.
+admission= AdmissionController(route_limits={"GET /slow": 4})
+app.add_middleware(AdmissionMiddleware, controller=admission)
+metrics.collectors.append(admission.render)
+
+
+# -------------------------------
+# Middleware to Profile Single Requests
+# -------------------------------
+# /metrics shows *which* route is slow; ProfilerMiddleware (profiler.py) shows *where*
+# the time goes. Start the app with PROFILE_SECRET set, mint a token with
+# `python -m middleware.profiler token`, and send it in an X-Profile header: that request is
+# stack-sampled and the profile can be fetched from GET /debug/profiles/<id>
+# (the id comes back in the X-Profile-Id header, and the endpoints want the token too).
+# Without PROFILE_SECRET it isn't installed at all, so it costs nothing; PROFILE_SAMPLE_RATE
+# alone is refused at startup, as it would serve everyone's stacks to anyone. Added after
+# MetricsMiddleware, so it is the outer one and its own work doesn't count in the
+# metrics' timings.
+profiler.install(app)
 
 
 # -------------------------------
@@ -53,15 +101,27 @@ def read_root():
     """
     A simple GET route to test middleware.
     Visiting http://127.0.0.1:8000/ will trigger the middleware first,
-    then this route, and log the request processing time.
+    then this route; the request then shows up in GET /metrics.
     """
     return {"Hello": "World"}
 
 
+@app.get("/slow")
+def slow(seconds: float=0.5):
+    """
+    Stands in for a request stuck on a slow database: holds a threadpool thread for `seconds`.
+    Only 4 run at once (route_limits above); try it with many concurrent clients, e.g.
+    `ab -n 200 -c 50 http://127.0.0.1:8000/slow`, and watch admission_shed_total in /metrics.
+    """
+    time.sleep(min(seconds, 10))
+    return {"slept": seconds}
+
+
 # -------------------------------
 # Notes:
 # -------------------------------
 # 1. Middleware is global: it affects all routes in the app.
 # 2. The call_next function must always be called to continue processing the request.
-# 3. You can have multiple middleware functions; they run in the order they are added.
+# 3. You can have multiple middleware; the one added last with add_middleware() is the outermost
+#    and sees the request first.
 # 4. Middleware can also modify requests/responses if needed (e.g., adding headers).
@@ -0,0 +1,353 @@
+# On-demand sampling profiler for single requests, with profiles served at GET /debug/profiles
+# Related files: middleware.py (uses it), metrics.py (which routes are slow in the first place)
+
+# Use in an app (from another folder, after putting the repo root on sys.path):
+#   from middleware import profiler
+#   profiler.install(app)  # ProfilerMiddleware and the debug endpoints, with the same secret
+#
+# Configuration (environment variables):
+#   PROFILE_SECRET=...        enables signed triggers and protects the debug endpoints
+#   PROFILE_SAMPLE_RATE=0.01  also profile 1% of all requests (default 0, needs PROFILE_SECRET)
+#   PROFILE_INTERVAL_MS=1     time between stack samples
+# The debug endpoints show every thread's stack, other clients' requests included,
+# so they are never served without a secret: a sample rate alone is refused
+# (install() raises ValueError) instead of collecting profiles anyone could read.
+# Without a secret ENABLED is False and install() adds nothing, since even an
+# empty middleware layer costs a few us per request.
+#
+# Profiling one request:
+#   python -m middleware.profiler token --minutes 10        # prints a signed token (from the repo root)
+#   curl -H "X-Profile: <token>" http://127.0.0.1:8000/slow  # or /slow?profile=<token>
+#   -> the response carries X-Profile-Id: <id>
+#   curl -H "X-Profile: <token>" "http://127.0.0.1:8000/debug/profiles/<id>?format=speedscope" > p.json
+#   Open p.json at https://www.speedscope.app, or get format=collapsed for flamegraph.pl.
+
+# How it works:
+#   1. A token is "<expiry>.<HMAC-SHA256(secret, expiry)>": anyone holding the
+#      secret can mint one, nobody else can, and it stops working at expiry.
+#   2. While at least one profiled request is running, a background thread wakes
+#      up every PROFILE_INTERVAL_MS, reads every thread's current Python stack
+#      (sys._current_frames) and adds one count to that stack in each active profile.
+#      Idle threads (a worker waiting for work, the event loop waiting for I/O)
+#      are skipped. With no profiled request the thread isn't running at all.
+#   3. When the request ends its profile (stack -> sample count) goes into a ring
+#      buffer of the last MAX_PROFILES profiles.
+# Samples cover the event loop thread and the threadpool (where `def` endpoints
+# run), so other requests running at the same moment show up too; their stacks
+# start from their own route functions, so they are easy to tell apart.
+
+import argparse
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+
+PROFILE_SECRET= os.getenv("PROFILE_SECRET", "")
+SAMPLE_RATE= float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL= float(os.getenv("PROFILE_INTERVAL_MS", "1"))/1000
+ENABLED= bool(PROFILE_SECRET)
+
+# Profiles kept for GET /debug/profiles, and distinct stacks kept per profile
+MAX_PROFILES= 20
+MAX_STACKS= 5000
+
+# Innermost frames that mean "this thread is waiting, not working": (file name, function)
+IDLE_FRAMES= {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select")}
+
+
+# -------------------------------
+# Signed Tokens
+# -------------------------------
+def sign(expiry: int, secret: str=PROFILE_SECRET):
+    return hmac.new(secret.encode(), str(expiry).encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(minutes: float, secret: str=PROFILE_SECRET):
+    """Token valid for `minutes`, for the X-Profile header or the ?profile= query parameter."""
+    expiry= int(time.time()+minutes*60)
+    return f"{expiry}.{sign(expiry, secret)}"
+
+
+def check_token(token: str, secret: str=PROFILE_SECRET):
+    """True if token was made with secret and hasn't expired."""
+    if not secret or not token:
+        return False
+    expiry, _, signature= token.partition(".")
+    if not expiry.isdigit() or int(expiry)<time.time():
+        return False
+    return hmac.compare_digest(signature, sign(int(expiry), secret))
+
+
+# -------------------------------
+# Stack Sampler
+# -------------------------------
+class Profile:
+    """Samples collected for one request."""
+
+    def __init__(self, profile_id: int, method: str, path: str, trigger: str):
+        self.id= profile_id
+        self.method= method
+        self.path= path
+        self.trigger= trigger
+        self.status= None
+        self.started= time.time()
+        self.duration_ms= None
+        self.stacks= Counter()  # "thread;outer;...;inner" -> samples
+        self.ticks= 0           # times the sampler looked (one tick can add a stack per busy thread)
+        self.samples= 0
+        self.dropped= 0         # samples whose stack didn't fit in MAX_STACKS
+
+    def add(self, stack: str):
+        self.samples+= 1
+        if stack in self.stacks or len(self.stacks)<MAX_STACKS:
+            self.stacks[stack]+= 1
+        else:
+            self.dropped+= 1
+
+    def summary(self):
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "status": self.status,
+            "trigger": self.trigger, "started": self.started, "duration_ms": self.duration_ms,
+            "ticks": self.ticks, "samples": self.samples, "dropped": self.dropped,
+        }
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed stack format: one "frame;frame;frame count" line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self):
+        """
+        speedscope's file format (one "sampled" profile, weights in milliseconds).
+        A sample weighs duration / ticks: under load the sampler wakes up less often
+        than INTERVAL, and this keeps the total equal to the request's real duration.
+        """
+        tick_ms= (self.duration_ms or 0)/max(self.ticks, 1)
+        frames, index= [], {}
+        samples, weights= [], []
+        for stack, count in self.stacks.items():
+            sample= []
+            for name in stack.split(";"):
+                if name not in index:
+                    index[name]= len(frames)
+                    frames.append({"name": name})
+                sample.append(index[name])
+            samples.append(sample)
+            weights.append(count*tick_ms)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": f"{self.method} {self.path}", "unit": "milliseconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+            "name": f"{self.method} {self.path} (profile {self.id})",
+            "exporter": "profiler.py",
+        }
+
+
+class Sampler:
+    """
+    Background thread that samples all thread stacks while any profile is active.
+    - interval: Seconds between samples
+    """
+
+    def __init__(self, interval: float=INTERVAL):
+        self.interval= interval
+        self.active= set()
+        self.lock= threading.Lock()
+        self.thread= None
+        self.code_names= {}  # code object -> "function (file:line)", built once per function
+
+    def start(self, profile: Profile):
+        with self.lock:
+            self.active.add(profile)
+            if self.thread is None:
+                self.thread= threading.Thread(target=self.run, name="profiler-sampler", daemon=True)
+                self.thread.start()
+
+    def stop(self, profile: Profile):
+        with self.lock:
+            self.active.discard(profile)
+
+    def frame_name(self, code):
+        name= self.code_names.get(code)
+        if name is None:
+            name= self.code_names[code]= f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name
+
+    def run(self):
+        own_id= threading.get_ident()
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.thread= None  # the next start() starts a new thread
+                    return
+            names= {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks= []
+            for thread_id, frame in sys._current_frames().items():
+                code= frame.f_code
+                if thread_id==own_id or (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack= []
+                while frame is not None:
+                    stack.append(self.frame_name(frame.f_code))
+                    frame= frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(stack)))
+            # Only profiles still running get the samples: a stopped one may be read already
+            with self.lock:
+                for profile in self.active:
+                    profile.ticks+= 1
+                    for stack in stacks:
+                        profile.add(stack)
+            time.sleep(self.interval)
+
+
+sampler= Sampler()
+
+# Finished profiles, oldest first
+profiles= OrderedDict()
+profile_ids= itertools.count(1)
+
+
+class ProfilerMiddleware:
+    """
+    Pure ASGI middleware that profiles a request when it carries a valid token
+    (X-Profile header or ?profile= query parameter) or is picked by sample_rate.
+    Without a secret it passes every request through, sample_rate included:
+    nobody could read those profiles without the debug endpoints' token.
+    - secret: HMAC secret for tokens (default: PROFILE_SECRET)
+    - sample_rate: Fraction of all requests to profile (default: PROFILE_SAMPLE_RATE)
+    """
+
+    def __init__(self, app, secret: str=None, sample_rate: float=None):
+        self.app= app
+        self.secret= PROFILE_SECRET if secret is None else secret
+        self.sample_rate= SAMPLE_RATE if sample_rate is None else sample_rate
+        self.enabled= bool(self.secret)
+
+    def trigger(self, scope):
+        """Why this request should be profiled ("token" or "sampled"), or None."""
+        if self.secret:
+            token= None
+            for name, value in scope["headers"]:
+                if name==b"x-profile":
+                    token= value.decode("latin-1")
+                    break
+            if token is None and b"profile=" in scope["query_string"]:
+                for pair in scope["query_string"].decode("latin-1").split("&"):
+                    key, _, value= pair.partition("=")
+                    if key=="profile":
+                        token= value
+                        break
+            if token is not None and check_token(token, self.secret):
+                return "token"
+        if self.sample_rate>0 and random.random()<self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"]!="http" or scope["path"].startswith("/debug/profiles"):
+            return await self.app(scope, receive, send)
+        trigger= self.trigger(scope)
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile= Profile(next(profile_ids), scope["method"], scope["path"], trigger)
+
+        async def send_with_id(message):
+            if message["type"]=="http.response.start":
+                profile.status= message["status"]
+                message= {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]}
+            await send(message)
+
+        start= time.perf_counter()
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(profile)
+            profile.duration_ms= round((time.perf_counter()-start)*1000, 3)
+            profiles[profile.id]= profile
+            while len(profiles)>MAX_PROFILES:
+                profiles.popitem(last=False)
+
+
+# -------------------------------
+# Debug Endpoints
+# -------------------------------
+def debug_router(secret: str=PROFILE_SECRET):
+    """
+    GET /debug/profiles[/{id}], answering only requests with a token made with secret
+    (pass the same secret as ProfilerMiddleware's, or use install()).
+    - secret: HMAC secret for tokens; required, the profiles hold every thread's stack
+    """
+    if not secret:
+        raise ValueError("The profile debug endpoints need a secret (PROFILE_SECRET)")
+    router= APIRouter()
+
+    def require_token(x_profile: str=None, profile: str=None):
+        if not check_token(x_profile or profile or "", secret):
+            raise HTTPException(status_code=403, detail="Valid X-Profile token required")
+
+    @router.get("/debug/profiles")
+    async def list_profiles(x_profile: str= Header(None), profile: str= Query(None)):
+        """The retained profiles, newest first (without their samples)."""
+        require_token(x_profile, profile)
+        return [item.summary() for item in reversed(list(profiles.values()))]
+
+    @router.get("/debug/profiles/{profile_id}")
+    async def get_profile(profile_id: int, format: str="speedscope", x_profile: str= Header(None), profile: str= Query(None)):
+        """
+        One profile.
+        Query Parameters:
+            format: 'speedscope' (JSON for speedscope.app) or 'collapsed' (text for flamegraph.pl)
+        """
+        require_token(x_profile, profile)
+        item= profiles.get(profile_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Profile not found (only the last MAX_PROFILES are kept)")
+        if format=="collapsed":
+            return PlainTextResponse(item.collapsed())
+        if format!="speedscope":
+            raise HTTPException(status_code=400, detail="format must be 'speedscope' or 'collapsed'")
+        return item.speedscope()
+
+    return router
+
+
+def install(app, secret: str=None, sample_rate: float=None):
+    """
+    Adds ProfilerMiddleware and the debug endpoints to app, both with the same secret.
+    Without a secret nothing is added (and a sample rate alone raises ValueError).
+    Returns True if the profiler was installed.
+    - secret: HMAC secret for tokens (default: PROFILE_SECRET)
+    - sample_rate: Fraction of all requests to profile (default: PROFILE_SAMPLE_RATE)
+    """
+    secret= PROFILE_SECRET if secret is None else secret
+    sample_rate= SAMPLE_RATE if sample_rate is None else sample_rate
+    if not secret:
+        if sample_rate>0:
+            raise ValueError("PROFILE_SAMPLE_RATE needs PROFILE_SECRET: the profiles would be readable by anyone")
+        return False
+    app.add_middleware(ProfilerMiddleware, secret=secret, sample_rate=sample_rate)
+    app.include_router(debug_router(secret))
+    return True
+
+
+if __name__=="__main__":
+    parser= argparse.ArgumentParser(description="Mint a profiling token (uses PROFILE_SECRET)")
+    parser.add_argument("command", choices=["token"])
+    parser.add_argument("--minutes", type=float, default=10)
+    args= parser.parse_args()
+    if not PROFILE_SECRET:
+        sys.exit("Set PROFILE_SECRET (the same value the app runs with)")
+    print(make_token(args.minutes))
@@ -0,0 +1,406 @@
+# In-process HTTP response cache for idempotent GET routes, as a pure ASGI middleware
+# Related files: basics/main.py, custom_exceptions/exception.py, config_environment/environ.py (use it),
+#                metrics.py (GET /metrics can show the hit ratio too), benchmark_response_cache.py
+
+# Use in an app (from another folder, after putting the repo root on sys.path):
+#   from middleware.response_cache import ResponseCacheMiddleware, cache_response, router as cache_router
+#   app.add_middleware(ResponseCacheMiddleware)
+#   app.include_router(cache_router)              # GET /debug/cache: hit ratio, entries, bytes
+#
+#   @app.get("/products/")
+#   @cache_response(ttl=60, stale_while_revalidate=30)
+#   def list_products(...): ...
+#
+# Configuration (environment variables):
+#   RESPONSE_CACHE_MAX_BYTES=33554432      total size of the cached bodies + headers (LRU beyond it)
+#   RESPONSE_CACHE_MAX_ENTRY_BYTES=1048576 larger responses are never stored
+
+# How a GET request is handled:
+#   1. On the first request the middleware looks through the app's routes once
+#      and notes the path regex of every endpoint marked with @cache_response.
+#      A request whose path matches none of them passes straight through.
+#   2. The cache key is the path plus the query parameters in sorted order, so
+#      ?a=1&b=2 and ?b=2&a=1 share an entry. Under one key there can be several
+#      variants, one per combination of values of the request headers named in
+#      the response's Vary header (and in the route's `vary`).
+#   3. Fresh variant -> HIT: the stored status, headers and body are sent with
+#      an Age header, without routing, validation or the endpoint running at all.
+#      Expired but within stale-while-revalidate -> STALE: sent the same way, and
+#      the request is run again in a background task to refresh the entry.
+#      Otherwise -> MISS: the app handles the request and the response is stored
+#      while it is being sent (nothing is held back from the client).
+#   4. The TTL comes from the response's Cache-Control (s-maxage, then max-age,
+#      and its stale-while-revalidate) or else from @cache_response; a response
+#      without Cache-Control gets one describing the route's TTL, so browsers and
+#      proxies can cache it too.
+# Not stored: statuses other than CACHEABLE_STATUSES (e.g. 422 validation errors),
+# responses with Cache-Control no-store, no-cache or private (so a route declared
+# with private=True is left to the browser's cache), Vary: *, and anything over the
+# entry size limit. A request sending Cache-Control: no-cache (or max-age=0, or
+# Pragma: no-cache without Cache-Control) is never answered from the cache: it runs
+# the endpoint and refreshes the entry; no-store bypasses the cache. All Cache-Control
+# headers of a request or response count, not just the first. Requests carrying
+# Authorization or Cookie bypass it unless the route lists that header in `vary`,
+# so one user's response is never served to another.
+# Two concurrent misses for the same key both run the endpoint; only the stale
+# refresh is limited to one at a time per variant. Each worker process has its own cache.
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from time import monotonic
+from fastapi import APIRouter
+from starlette.datastructures import Headers, MutableHeaders
+
+
+logger= logging.getLogger(__name__)
+
+MAX_BYTES= int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32*1024*1024)))
+MAX_ENTRY_BYTES= int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024*1024)))
+
+# Statuses that may be stored (RFC 9110's "heuristically cacheable" ones)
+CACHEABLE_STATUSES= {200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501}
+
+# Variants kept per key; the oldest goes when another one arrives
+MAX_VARIANTS= 8
+
+# Response headers that are about this one transmission, not the stored response
+HOP_HEADERS= {b"age", b"x-cache", b"connection", b"keep-alive", b"transfer-encoding"}
+
+
+def parse_cache_control(value: str):
+    """{"max-age": "60", "no-store": None, ...} with lower-cased directive names."""
+    directives= {}
+    for part in value.split(","):
+        name, _, argument= part.strip().partition("=")
+        if name:
+            directives[name.lower()]= argument.strip('"') or None
+    return directives
+
+
+def header_cache_control(headers):
+    """parse_cache_control() of every Cache-Control header in headers (Headers or MutableHeaders)."""
+    return parse_cache_control(",".join(headers.getlist("cache-control")))
+
+
+def request_cache_control(headers: Headers):
+    """The request's Cache-Control directives; HTTP/1.0's Pragma: no-cache counts as no-cache."""
+    directives= header_cache_control(headers)
+    if not directives and "no-cache" in headers.get("pragma", "").lower():
+        directives["no-cache"]= None
+    return directives
+
+
+# Response directives that keep a response out of the cache
+UNSTORABLE= ("no-store", "no-cache", "private")
+
+
+def seconds(directives: dict, name: str):
+    """A directive's value in seconds, or None if it is missing or not a number."""
+    value= directives.get(name)
+    return int(value) if value is not None and value.isdigit() else None
+
+
+# -------------------------------
+# Route Declarations
+# -------------------------------
+class CachePolicy:
+    """What @cache_response declared for one route."""
+    __slots__= ("ttl", "stale_while_revalidate", "vary", "cache_control")
+
+    def __init__(self, ttl: float, stale_while_revalidate: float=0, vary=(), private: bool=False):
+        self.ttl= ttl
+        self.stale_while_revalidate= stale_while_revalidate
+        self.vary= tuple(name.lower() for name in vary)
+        # Cache-Control sent with responses that don't set their own
+        self.cache_control= ("private, " if private else "")+f"max-age={int(ttl)}"
+        if stale_while_revalidate:
+            self.cache_control+= f", stale-while-revalidate={int(stale_while_revalidate)}"
+
+
+def cache_response(ttl: float, stale_while_revalidate: float=0, vary=(), private: bool=False):
+    """
+    Marks a GET endpoint as cacheable by ResponseCacheMiddleware.
+    - ttl: Seconds a stored response is fresh
+    - stale_while_revalidate: Seconds after that during which it is still served while refreshed
+    - vary: Request headers the response depends on (e.g. ["authorization"]), on top of its Vary header
+    - private: Tell browsers only, not shared proxies, that they may cache it
+               (this cache then doesn't store it either)
+    The endpoint itself is returned unchanged, so FastAPI sees its real signature.
+    """
+    def decorate(endpoint):
+        endpoint.cache_policy= CachePolicy(ttl, stale_while_revalidate, vary, private)
+        return endpoint
+    return decorate
+
+
+# -------------------------------
+# Cache Store
+# -------------------------------
+class Entry:
+    """One stored response variant."""
+    __slots__= ("status", "headers", "body", "vary", "stored", "expires", "stale_until", "size")
+
+    def __init__(self, status: int, headers: list, body: bytes, vary: dict, ttl: float, stale: float):
+        self.status= status
+        self.headers= headers
+        self.body= body
+        self.vary= vary       # request header name -> value this variant was made for
+        self.stored= monotonic()
+        self.expires= self.stored+ttl
+        self.stale_until= self.expires+stale
+        self.size= len(body)+sum(len(name)+len(value) for name, value in headers)
+
+    def matches(self, request_headers: Headers):
+        return all(request_headers.get(name)==value for name, value in self.vary.items())
+
+    async def send(self, send, now: float, state: str):
+        headers= [*self.headers, (b"age", str(int(now-self.stored)).encode()), (b"x-cache", state.encode())]
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU of response variants, shared by ResponseCacheMiddleware and GET /debug/cache.
+    - max_bytes: Total size of stored bodies + headers
+    - max_entry_bytes: Largest single response stored
+    """
+
+    def __init__(self, max_bytes: int=MAX_BYTES, max_entry_bytes: int=MAX_ENTRY_BYTES):
+        self.max_bytes= max_bytes
+        self.max_entry_bytes= max_entry_bytes
+        self.entries= OrderedDict()  # key -> [Entry, ...], least recently used key first
+        self.size= 0
+        # Counters for the hit ratio
+        self.hits= 0
+        self.stale_hits= 0
+        self.misses= 0
+        self.bypassed= 0
+        self.stores= 0
+        self.evictions= 0
+        self.revalidations= 0
+
+    def lookup(self, key, request_headers: Headers):
+        variants= self.entries.get(key)
+        if variants is None:
+            return None
+        self.entries.move_to_end(key)
+        for entry in variants:
+            if entry.matches(request_headers):
+                return entry
+        return None
+
+    def store(self, key, entry: Entry):
+        variants= self.entries.setdefault(key, [])
+        self.entries.move_to_end(key)
+        replaced= [old for old in variants if old.vary==entry.vary]
+        if not replaced and len(variants)>=MAX_VARIANTS:
+            replaced= variants[:1]
+        for old in replaced:
+            variants.remove(old)
+            self.size-= old.size
+        variants.append(entry)
+        self.size+= entry.size
+        self.stores+= 1
+        while self.size>self.max_bytes and self.entries:
+            _, evicted= self.entries.popitem(last=False)
+            self.size-= sum(old.size for old in evicted)
+            self.evictions+= len(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size= 0
+
+    def stats(self):
+        served= self.hits+self.stale_hits
+        lookups= served+self.misses
+        return {
+            "hit_ratio": round(served/lookups, 4) if lookups else None,
+            "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+            "bypassed": self.bypassed, "stores": self.stores, "evictions": self.evictions,
+            "revalidations": self.revalidations,
+            "keys": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes,
+        }
+
+    def render(self):
+        """Prometheus exposition lines (for metrics.py's Metrics.collectors)."""
+        lines= ["# HELP response_cache_requests_total Cacheable GET requests, by result.",
+                "# TYPE response_cache_requests_total counter"]
+        for result, count in (("hit", self.hits), ("stale", self.stale_hits), ("miss", self.misses), ("bypass", self.bypassed)):
+            lines.append(f'response_cache_requests_total{{result="{result}"}} {count}')
+        lines+= ["# HELP response_cache_bytes Size of the stored responses.", "# TYPE response_cache_bytes gauge",
+                 f"response_cache_bytes {self.size}",
+                 "# HELP response_cache_evictions_total Variants dropped to stay under max_bytes.",
+                 "# TYPE response_cache_evictions_total counter",
+                 f"response_cache_evictions_total {self.evictions}"]
+        return lines
+
+
+# Default store, used by ResponseCacheMiddleware and GET /debug/cache unless told otherwise
+response_cache= ResponseCache()
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+def cache_key(scope):
+    """(root path, path, query string with its key=value pairs sorted)."""
+    query= scope["query_string"]
+    if b"&" in query:
+        query= b"&".join(sorted(query.split(b"&")))
+    return (scope.get("root_path", ""), scope["path"], query)
+
+
+class ResponseCacheMiddleware:
+    """
+    Pure ASGI middleware serving @cache_response routes from a ResponseCache (see top of file).
+    - cache: Store to use (default: the module's `response_cache`)
+    """
+
+    def __init__(self, app, cache: ResponseCache=response_cache):
+        self.app= app
+        self.cache= cache
+        self.rules= None         # [(path regex, CachePolicy)], built on the first request
+        self.revalidating= set()
+        self.tasks= set()        # background refreshes (kept so they aren't garbage collected)
+
+    def policy(self, scope):
+        if self.rules is None:
+            self.rules= [
+                (route.path_regex, route.endpoint.cache_policy)
+                for route in scope["app"].routes
+                if "GET" in (getattr(route, "methods", None) or ()) and hasattr(getattr(route, "endpoint", None), "cache_policy")
+            ]
+        for regex, policy in self.rules:
+            if regex.match(scope["path"]):
+                return policy
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http" or scope["method"]!="GET":
+            return await self.app(scope, receive, send)
+        policy= self.policy(scope)
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        request_headers= Headers(scope=scope)
+        cache_control= request_cache_control(request_headers)
+        if "no-store" in cache_control or any(
+                name in request_headers and name not in policy.vary for name in ("authorization", "cookie")):
+            self.cache.bypassed+= 1
+            return await self.app(scope, receive, send)
+
+        key= cache_key(scope)
+        if "no-cache" not in cache_control and cache_control.get("max-age")!="0":
+            entry= self.cache.lookup(key, request_headers)
+            now= monotonic()
+            if entry is not None and now<entry.expires:
+                self.cache.hits+= 1
+                return await entry.send(send, now, "HIT")
+            if entry is not None and now<entry.stale_until:
+                self.cache.stale_hits+= 1
+                self.revalidate(dict(scope), key, policy, request_headers, entry)
+                return await entry.send(send, now, "STALE")
+        self.cache.misses+= 1
+        await self.fetch(scope, receive, send, key, policy, request_headers)
+
+    async def fetch(self, scope, receive, send, key, policy: CachePolicy, request_headers: Headers):
+        """Runs the app and stores its response while passing it on to `send`."""
+        response= {}  # "start": the start message, while the response can still be stored
+        chunks= []
+        size= 0
+
+        async def storing_send(message):
+            nonlocal size
+            if message["type"]=="http.response.start":
+                headers= MutableHeaders(raw=list(message.get("headers", [])))
+                if message["status"] in CACHEABLE_STATUSES and headers.get("vary", "").strip()!="*":
+                    if "cache-control" not in headers:
+                        headers["cache-control"]= policy.cache_control
+                    cache_control= header_cache_control(headers)
+                    if not any(name in cache_control for name in UNSTORABLE):
+                        headers["x-cache"]= "MISS"
+                        response["start"]= {**message, "headers": headers.raw}
+                        response["cache_control"]= cache_control
+                    message= {**message, "headers": headers.raw}
+            elif message["type"]=="http.response.body" and "start" in response:
+                body= message.get("body", b"")
+                size+= len(body)
+                if size>self.cache.max_entry_bytes:
+                    response.clear()
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+                    if not message.get("more_body", False):
+                        self.store(key, policy, request_headers, response["start"], response["cache_control"], b"".join(chunks))
+            await send(message)
+
+        await self.app(scope, receive, storing_send)
+
+    def store(self, key, policy: CachePolicy, request_headers: Headers, start: dict, cache_control: dict, body: bytes):
+        ttl= seconds(cache_control, "s-maxage")
+        if ttl is None:
+            ttl= seconds(cache_control, "max-age")
+        if ttl is None:
+            ttl= policy.ttl
+        stale= seconds(cache_control, "stale-while-revalidate")
+        if stale is None:
+            stale= policy.stale_while_revalidate
+        if ttl<=0 and stale<=0:
+            return
+        headers= [(name, value) for name, value in start["headers"] if name not in HOP_HEADERS]
+        vary_names= set(policy.vary)
+        for name, value in headers:
+            if name==b"vary":
+                vary_names.update(part.strip().lower() for part in value.decode("latin-1").split(",") if part.strip())
+        vary= {name: request_headers.get(name) for name in sorted(vary_names)}
+        self.cache.store(key, Entry(start["status"], headers, body, vary, ttl, stale))
+
+    def revalidate(self, scope, key, policy: CachePolicy, request_headers: Headers, entry: Entry):
+        """Refreshes a stale variant in the background (one refresh per variant at a time)."""
+        variant= (key, tuple(entry.vary.items()))
+        if variant in self.revalidating:
+            return
+        self.revalidating.add(variant)
+        self.cache.revalidations+= 1
+
+        async def refresh():
+            sent= False
+
+            async def receive():
+                nonlocal sent
+                if sent:
+                    await asyncio.Event().wait()  # a real client stays connected until the response is done
+                sent= True
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def discard(message):
+                pass
+
+            try:
+                await self.fetch(scope, receive, discard, key, policy, request_headers)
+            except Exception:
+                logger.exception("Refreshing the cached response for %s failed", scope["path"])
+            finally:
+                self.revalidating.discard(variant)
+
+        task= asyncio.create_task(refresh())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+# -------------------------------
+# Debug Endpoint
+# -------------------------------
+router= APIRouter()
+
+
+@router.get("/debug/cache")
+async def cache_stats():
+    """
+    Hit ratio ((hits + stale hits) / lookups) and size of the response cache in this process.
+    async def on purpose: it reads the counters on the event loop, where the middleware updates them.
+    """
+    return response_cache.stats()
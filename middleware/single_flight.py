@@ -0,0 +1,316 @@
+# Request coalescing ("single flight"): concurrent identical calls share one execution
+# Related files: database_crud_sqlalchemy/crud.py (middleware on GET /items/{item_id}),
+#                basics/main3.py (decorator on the GET /items/ query), benchmark_single_flight.py
+
+# Two ways to use it (from another folder, after putting the repo root on sys.path):
+#
+#   As middleware, for whole GET requests to the listed routes:
+#     from middleware.single_flight import SingleFlightMiddleware
+#     app.add_middleware(SingleFlightMiddleware, routes=["GET /items/{item_id:int}"])
+#
+#   As a decorator, for any function (a loader, a dependency, or an endpoint; def or async def):
+#     from middleware.single_flight import single_flight
+#     @single_flight(timeout=10)
+#     def load_items(): ...
+#     load_items.forget()   # after a write: later calls don't join a read that started before it
+#
+# Configuration (environment variables):
+#   SINGLE_FLIGHT_TIMEOUT=10        seconds a follower waits for the shared result
+#   SINGLE_FLIGHT_MAX_BODY=4194304  larger responses aren't shared (followers run on their own)
+
+# How it works:
+#   The first call with a given key (the leader) runs; calls with the same key
+#   arriving while it runs (followers) don't run anything, they wait for the
+#   leader and all get its result. When the leader finishes, the key is free
+#   again: this is not a cache, a call arriving afterwards runs anew.
+#   - Errors propagate: if the leader raises, every follower raises the same exception
+#     (through the middleware: every follower gets a 500, like the leader).
+#   - Timeout: a follower waits at most `timeout` seconds, then gets TimeoutError
+#     (through the middleware: 504). The leader itself is never cut short.
+#   - If the leader is cancelled (e.g. its client went away), its followers run on their own.
+# Middleware keys are method + path + query (pairs sorted) + the request headers in
+# KEY_HEADERS: Authorization and Cookie, so requests with different credentials
+# never share a response, plus the ones that change the response format or status
+# (Accept, Accept-Encoding, If-None-Match...). They also include a write generation
+# that goes up whenever a request other than GET/HEAD finishes, so a GET that
+# arrives after a write completed doesn't get the answer of a GET that started before it.
+# Followers get the leader's status, body and headers minus PER_REQUEST_HEADERS:
+# hop-by-hop ones and those about the leader's own request (Set-Cookie, its request
+# id, profiler and SQL timing headers).
+# Only the listed routes are coalesced: never list streaming endpoints (SSE), their
+# followers would just wait for the timeout.
+#
+# do() makes a follower thread block until the leader is done; for a def function
+# that runs in the threadpool that holds a worker for the wait. Prefer an async def
+# function (do_async(): followers wait on a Future and hold no thread) that runs the
+# blocking part with run_in_threadpool, as basics/main3.py's load_items does.
+# Every caller gets the same result object: return values nobody mutates (or copy them).
+
+import asyncio
+import functools
+import inspect
+import os
+import threading
+from starlette.datastructures import Headers
+from starlette.routing import compile_path
+
+
+TIMEOUT= float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "10"))
+MAX_BODY= int(os.getenv("SINGLE_FLIGHT_MAX_BODY", str(4*1024*1024)))
+
+# Request headers that are part of the middleware's key
+KEY_HEADERS= ("authorization", "cookie", "accept", "accept-encoding", "if-none-match", "if-modified-since", "range")
+
+# Response headers a follower doesn't get from the leader's response
+PER_REQUEST_HEADERS= {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te", b"trailer",
+    b"transfer-encoding", b"upgrade",
+    b"set-cookie", b"x-request-id", b"x-profile-id", b"server-timing", b"x-db-queries",
+}
+
+# Result of a flight whose leader was cancelled: followers run on their own
+NO_RESULT= object()
+
+
+# -------------------------------
+# Single Flight Group
+# -------------------------------
+class Call:
+    """One in-flight execution shared by a leader thread and its followers."""
+    __slots__= ("done", "result", "error")
+
+    def __init__(self):
+        self.done= threading.Event()
+        self.result= NO_RESULT
+        self.error= None
+
+
+class SingleFlight:
+    """
+    In-flight calls by key. do() is for threads (def endpoints run in the threadpool),
+    do_async() for coroutines on the event loop; the two don't share flights.
+    """
+
+    def __init__(self):
+        self.lock= threading.Lock()
+        self.calls= {}          # key -> Call (threads)
+        self.futures= {}        # key -> asyncio.Future (event loop)
+        # Counters
+        self.executions= 0      # calls that ran (leaders)
+        self.shared= 0          # calls that got a leader's result instead of running
+        self.timeouts= 0
+        self.errors= 0          # leader exceptions (each also raised to its followers)
+
+    def do(self, key, fn, timeout: float=TIMEOUT):
+        """fn(), or the result of the same key's fn() already running in another thread."""
+        with self.lock:
+            call= self.calls.get(key)
+            leader= call is None
+            if leader:
+                call= self.calls[key]= Call()
+                self.executions+= 1
+        if leader:
+            try:
+                call.result= fn()
+                return call.result
+            except BaseException as exc:
+                call.error= exc
+                with self.lock:
+                    self.errors+= 1
+                raise
+            finally:
+                with self.lock:
+                    if self.calls.get(key) is call:
+                        del self.calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            with self.lock:
+                self.timeouts+= 1
+            raise TimeoutError(f"single flight: no result for {key!r} within {timeout}s")
+        if call.error is not None:
+            raise call.error
+        with self.lock:
+            self.shared+= 1
+        return call.result
+
+    async def do_async(self, key, fn, timeout: float=TIMEOUT):
+        """await fn(), or the result of the same key's fn() already being awaited."""
+        future= self.futures.get(key)
+        if future is None:
+            future= self.futures[key]= asyncio.get_running_loop().create_future()
+            self.executions+= 1
+            try:
+                result= await fn()
+            except Exception as exc:
+                self.errors+= 1
+                future.set_exception(exc)
+                future.exception()  # marks it retrieved: no "never retrieved" warning without followers
+                raise
+            except BaseException:
+                future.set_result(NO_RESULT)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                if self.futures.get(key) is future:
+                    del self.futures[key]
+
+        try:
+            # shield: a follower timing out must not cancel the leader's future
+            result= await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts+= 1
+            raise TimeoutError(f"single flight: no result for {key!r} within {timeout}s") from None
+        if result is NO_RESULT:
+            return await fn()
+        self.shared+= 1
+        return result
+
+    def forget(self, key):
+        """Later calls with key start a new flight (the running one still answers its followers)."""
+        with self.lock:
+            self.calls.pop(key, None)
+        self.futures.pop(key, None)
+
+    def stats(self):
+        return {"executions": self.executions, "shared": self.shared, "timeouts": self.timeouts, "errors": self.errors,
+                "in_flight": len(self.calls)+len(self.futures)}
+
+
+# Default group, used by single_flight() and SingleFlightMiddleware unless told otherwise
+group= SingleFlight()
+
+
+def single_flight(key=None, timeout: float=TIMEOUT, flights: SingleFlight=group):
+    """
+    Decorator: concurrent calls of the function with equal arguments share one execution.
+    - key: Function of the call's arguments returning the key (default: all arguments,
+      which must be hashable); include whatever identifies the caller's auth scope
+    - timeout: Seconds a follower waits before TimeoutError
+    The wrapper keeps the function's signature (FastAPI endpoints and dependencies
+    work as before) and has .forget(*args, **kwargs) to start afresh after a write.
+    """
+    def decorate(fn):
+        def make_key(args, kwargs):
+            call_key= key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+            return (fn.__module__, fn.__qualname__, call_key)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await flights.do_async(make_key(args, kwargs), lambda: fn(*args, **kwargs), timeout)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return flights.do(make_key(args, kwargs), lambda: fn(*args, **kwargs), timeout)
+
+        wrapper.forget= lambda *args, **kwargs: flights.forget(make_key(args, kwargs))
+        return wrapper
+    return decorate
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+class SingleFlightMiddleware:
+    """
+    Pure ASGI middleware coalescing concurrent identical GET/HEAD requests (see top of file).
+    - routes: Route patterns to coalesce, "GET /items/{item_id:int}" or "/items/" (GET and HEAD)
+    - timeout: Seconds a follower waits for the leader's response before a 504
+    - max_body: Responses larger than this aren't shared; followers then run on their own
+    - flights: Group whose counters (stats()) also count the middleware's requests
+    """
+
+    def __init__(self, app, routes=(), timeout: float=TIMEOUT, max_body: int=MAX_BODY, key_headers=KEY_HEADERS,
+                 flights: SingleFlight=group):
+        self.app= app
+        self.routes= []  # (method or None, compiled path regex)
+        for route in routes:
+            method, _, path= route.rpartition(" ")
+            regex, _, _= compile_path(path)
+            self.routes.append((method.upper() or None, regex))
+        self.timeout= timeout
+        self.max_body= max_body
+        self.key_headers= tuple(key_headers)
+        self.counters= flights
+        self.flights= {}          # key -> asyncio.Future of (start message, body) / None / NO_RESULT
+        self.write_generation= 0
+
+    def coalesced(self, scope):
+        method= scope["method"]
+        return any((route_method is None or route_method==method) and regex.match(scope["path"])
+                   for route_method, regex in self.routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http":
+            return await self.app(scope, receive, send)
+        if scope["method"] not in ("GET", "HEAD"):
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                self.write_generation+= 1
+        if not self.coalesced(scope):
+            return await self.app(scope, receive, send)
+
+        query= scope["query_string"]
+        if b"&" in query:
+            query= b"&".join(sorted(query.split(b"&")))
+        headers= Headers(scope=scope)
+        key= (scope["method"], scope.get("root_path", ""), scope["path"], query,
+              tuple(headers.get(name) for name in self.key_headers), self.write_generation)
+
+        future= self.flights.get(key)
+        if future is None:
+            return await self.lead(key, scope, receive, send)
+
+        try:
+            shared= await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters.timeouts+= 1
+            body= b'{"detail":"Timed out waiting for an identical request in flight"}'
+            await send({"type": "http.response.start", "status": 504, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+            return await send({"type": "http.response.body", "body": body})
+        if shared is None or shared is NO_RESULT:  # too large to share, or the leader was cancelled
+            return await self.app(scope, receive, send)
+        self.counters.shared+= 1
+        start, body= shared
+        await send({**start, "headers": [(name, value) for name, value in start.get("headers", [])
+                                         if name.lower() not in PER_REQUEST_HEADERS]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def lead(self, key, scope, receive, send):
+        """Runs the request, passing the response on while keeping a copy for the followers."""
+        future= self.flights[key]= asyncio.get_running_loop().create_future()
+        self.counters.executions+= 1
+        response= {"start": None, "body": [], "size": 0}
+
+        async def capturing_send(message):
+            if message["type"]=="http.response.start":
+                response["start"]= message
+            elif message["type"]=="http.response.body" and response["body"] is not None:
+                response["size"]+= len(message.get("body", b""))
+                if response["size"]>self.max_body:
+                    response["body"]= None
+                else:
+                    response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capturing_send)
+        except Exception as exc:
+            self.counters.errors+= 1
+            future.set_exception(exc)
+            future.exception()  # marks it retrieved when nobody followed
+            raise
+        except BaseException:
+            future.set_result(NO_RESULT)
+            raise
+        else:
+            shareable= response["start"] is not None and response["body"] is not None
+            future.set_result((response["start"], b"".join(response["body"])) if shareable else None)
+        finally:
+            if self.flights.get(key) is future:
+                del self.flights[key]
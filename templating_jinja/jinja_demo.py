@@ -9,6 +9,11 @@ from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+import sys
+
+# The repo root holds middleware/compression.py (shared response compression)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from middleware.compression import CompressionMiddleware
 
 
 # -------------------------------
@@ -16,6 +21,10 @@ from pathlib import Path
 # -------------------------------
 app= FastAPI()
 
+# Rendered pages are sent gzip/deflate (or zstd) compressed when the browser
+# accepts it and the HTML is at least 500 bytes
+app.add_middleware(CompressionMiddleware)
+
 
 # -------------------------------
 # Setup Templates Directory
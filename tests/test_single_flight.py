@@ -0,0 +1,201 @@
+# Tests for middleware/single_flight.py: callers are coalesced, errors and timeouts reach every follower
+# Related files: middleware/single_flight.py
+
+# Run (from the repo root):
+#   python -m pytest tests
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import pytest
+
+# The repo root holds middleware/single_flight.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from middleware.single_flight import SingleFlight, SingleFlightMiddleware, single_flight
+
+
+# -------------------------------
+# Threads (do)
+# -------------------------------
+def run_threads(count: int, target):
+    """Runs target() on `count` threads at once; returns [(result or None, exception or None)]."""
+    results= [None]*count
+    barrier= threading.Barrier(count)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index]= (target(), None)
+        except Exception as exc:
+            results[index]= (None, exc)
+
+    threads= [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flights= SingleFlight()
+    calls= []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"items": 3}
+
+    results= run_threads(10, lambda: flights.do("items", load))
+    assert len(calls)==1
+    assert all(result=={"items": 3} and error is None for result, error in results)
+    assert flights.stats()["executions"]==1 and flights.stats()["shared"]==9
+
+
+def test_leader_error_reaches_every_follower():
+    flights= SingleFlight()
+
+    def load():
+        time.sleep(0.2)
+        raise ValueError("database is gone")
+
+    results= run_threads(5, lambda: flights.do("items", load))
+    assert all(isinstance(error, ValueError) for _, error in results)
+    assert flights.stats()["executions"]==1 and flights.stats()["errors"]==1
+
+
+def test_follower_times_out():
+    flights= SingleFlight()
+    started= threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.5)
+        return 1
+
+    leader= threading.Thread(target=flights.do, args=("key", slow))
+    leader.start()
+    started.wait()
+    with pytest.raises(TimeoutError):
+        flights.do("key", slow, timeout=0.05)
+    leader.join()
+
+
+def test_calls_after_the_flight_run_again():
+    flights= SingleFlight()
+    calls= []
+    flights.do("key", lambda: calls.append(1))
+    flights.do("key", lambda: calls.append(1))
+    assert len(calls)==2
+
+
+# -------------------------------
+# Coroutines (do_async / decorator)
+# -------------------------------
+def test_async_decorator_coalesces_equal_arguments():
+    calls= []
+
+    @single_flight(flights=SingleFlight())
+    async def load(item_id: int):
+        calls.append(item_id)
+        await asyncio.sleep(0.05)
+        return {"id": item_id}
+
+    async def main():
+        return await asyncio.gather(*[load(1) for _ in range(10)], load(2))
+
+    results= asyncio.run(main())
+    assert sorted(calls)==[1, 2]
+    assert results==[{"id": 1}]*10+[{"id": 2}]
+
+
+def test_async_leader_error_reaches_every_follower():
+    flights= SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.05)
+        raise ValueError("database is gone")
+
+    async def main():
+        return await asyncio.gather(*[flights.do_async("key", load) for _ in range(5)], return_exceptions=True)
+
+    results= asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.stats()["executions"]==1
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+def make_app(calls: list, fail: bool=False):
+    """ASGI app answering after a short delay, with a per-request Set-Cookie and X-Request-Id."""
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.05)
+        if fail:
+            raise RuntimeError("endpoint failed")
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"set-cookie", b"session=leader"),
+            (b"x-request-id", f"{len(calls)}".encode()),
+        ]})
+        await send({"type": "http.response.body", "body": b'{"ok":true}'})
+    return app
+
+
+async def get(app, path: str="/items/1"):
+    scope= {"type": "http", "method": "GET", "path": path, "root_path": "", "query_string": b"", "headers": []}
+    response= {"headers": None, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"]=="http.response.start":
+            response["status"]= message["status"]
+            response["headers"]= dict(message["headers"])
+        else:
+            response["body"]+= message.get("body", b"")
+    await app(scope, receive, send)
+    return response
+
+
+def test_middleware_followers_share_the_response_without_per_request_headers():
+    calls= []
+    app= SingleFlightMiddleware(make_app(calls), routes=["GET /items/{item_id:int}"], flights=SingleFlight())
+
+    async def main():
+        return await asyncio.gather(*[get(app) for _ in range(5)])
+
+    responses= asyncio.run(main())
+    assert calls==["/items/1"]
+    assert all(response["status"]==200 and response["body"]==b'{"ok":true}' for response in responses)
+    leaders= [response for response in responses if b"set-cookie" in response["headers"]]
+    assert len(leaders)==1
+    followers= [response for response in responses if response is not leaders[0]]
+    assert all(b"x-request-id" not in response["headers"] and response["headers"][b"content-type"]==b"application/json"
+               for response in followers)
+
+
+def test_middleware_leader_error_reaches_followers():
+    calls= []
+    app= SingleFlightMiddleware(make_app(calls, fail=True), routes=["/items/{item_id:int}"], flights=SingleFlight())
+
+    async def main():
+        return await asyncio.gather(*[get(app) for _ in range(3)], return_exceptions=True)
+
+    results= asyncio.run(main())
+    assert len(calls)==1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_middleware_leaves_other_routes_alone():
+    calls= []
+    app= SingleFlightMiddleware(make_app(calls), routes=["GET /items/{item_id:int}"], flights=SingleFlight())
+
+    async def main():
+        return await asyncio.gather(*[get(app, "/other") for _ in range(3)])
+
+    asyncio.run(main())
+    assert len(calls)==3